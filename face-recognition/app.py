@@ -16,6 +16,12 @@ sys.path.append(
 
 from routes.supabase_route import router as supabase_router
 from routes.face_route import router as face_router
+from integrates.detection_pool import start_detection_pool, shutdown_detection_pool
+from integrates.mongo import close_async_client
+from integrates.milvus_async import start_milvus, close_async_milvus_client
+from integrates.storage import close_storage_client
+from services.migration_service import resume_migration
+from services.job_service import start_job_workers, stop_job_workers
 
 app = FastAPI(
     title="Face Recognition API",
@@ -49,6 +55,24 @@ async def startup_event():
     handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     logger.addHandler(handler)
 
+    # Prepare and warm the model pool once so the first request isn't cold
+    await start_detection_pool()
+    # Connect and load the Milvus collection before the first request needs it
+    await start_milvus()
+    # Pick an interrupted collection migration back up where it left off
+    await resume_migration()
+    # Drain detection jobs queued before the last shutdown and new ones
+    await start_job_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_job_workers()
+    shutdown_detection_pool()
+    await close_async_client()
+    await close_async_milvus_client()
+    await close_storage_client()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -16,13 +16,207 @@ def get_env_variable(name):
 
 MONGODB_KEY = os.getenv("MONGODB_KEY")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME")
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME")
+# Debug mode: also write downloaded images to DEBUG_DOWNLOAD_DIR
+DEBUG_SAVE_DOWNLOADS = os.getenv("DEBUG_SAVE_DOWNLOADS", "false").lower() == "true"
+DEBUG_DOWNLOAD_DIR = os.getenv("DEBUG_DOWNLOAD_DIR", "temp/download")
+# Storage calls share one pooled HTTP/2 client. The limits are per host in
+# practice, every call goes to the Supabase storage endpoint.
+STORAGE_HTTP2 = os.getenv("STORAGE_HTTP2", "true").lower() == "true"
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", "20"))
+STORAGE_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("STORAGE_MAX_KEEPALIVE_CONNECTIONS", "10")
+)
+STORAGE_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("STORAGE_CONNECT_TIMEOUT_SECONDS", "5")
+)
+STORAGE_READ_TIMEOUT_SECONDS = float(os.getenv("STORAGE_READ_TIMEOUT_SECONDS", "30"))
+# Waiting for a free connection of the pool
+STORAGE_POOL_TIMEOUT_SECONDS = float(os.getenv("STORAGE_POOL_TIMEOUT_SECONDS", "10"))
+# Downloads of many keys at once run this many at a time
+STORAGE_DOWNLOAD_CONCURRENCY = int(os.getenv("STORAGE_DOWNLOAD_CONCURRENCY", "8"))
+# Hedged downloads: a download still running after the recent
+# STORAGE_HEDGE_PERCENTILE latency (at least STORAGE_HEDGE_MIN_DELAY_MS) is
+# requested a second time and the first response wins. Needs
+# STORAGE_HEDGE_MIN_SAMPLES latencies first, and at most STORAGE_HEDGE_MAX_RATIO
+# of downloads are hedged, so a slow storage backend isn't hit twice as hard.
+STORAGE_HEDGE_ENABLED = os.getenv("STORAGE_HEDGE_ENABLED", "false").lower() == "true"
+STORAGE_HEDGE_PERCENTILE = float(os.getenv("STORAGE_HEDGE_PERCENTILE", "95"))
+STORAGE_HEDGE_MIN_DELAY_MS = float(os.getenv("STORAGE_HEDGE_MIN_DELAY_MS", "20"))
+STORAGE_HEDGE_MIN_SAMPLES = int(os.getenv("STORAGE_HEDGE_MIN_SAMPLES", "20"))
+STORAGE_HEDGE_MAX_RATIO = float(os.getenv("STORAGE_HEDGE_MAX_RATIO", "0.1"))
 
 MILVUS_CLOUD_ENDPOINT = os.getenv("MILVUS_CLOUD_ENDPOINT")
 MILVUS_CLOUD_TOKEN = os.getenv("MILVUS_CLOUD_TOKEN")
 MILVUS_CLOUD_DB_NAME = os.getenv("MILVUS_CLOUD_DB_NAME")
+# auto: rely on Milvus auto-seal, async: non-blocking flush every
+# MILVUS_FLUSH_INTERVAL_ROWS rows, sync: flush and wait after every insert
+MILVUS_FLUSH_POLICY = os.getenv("MILVUS_FLUSH_POLICY", "auto").lower()
+MILVUS_FLUSH_INTERVAL_ROWS = int(os.getenv("MILVUS_FLUSH_INTERVAL_ROWS", "10000"))
+# Request a background compaction every N inserted rows, 0 disables it
+MILVUS_COMPACT_INTERVAL_ROWS = int(os.getenv("MILVUS_COMPACT_INTERVAL_ROWS", "0"))
+# Async Milvus layer: pooled AsyncMilvusClient connections and per-call timeouts
+MILVUS_ASYNC_POOL_SIZE = int(os.getenv("MILVUS_ASYNC_POOL_SIZE", "2"))
+MILVUS_TIMEOUT_SECONDS = float(os.getenv("MILVUS_TIMEOUT_SECONDS", "10"))
+# Connect + create/load of the collection, paid once at startup
+MILVUS_LOAD_TIMEOUT_SECONDS = float(os.getenv("MILVUS_LOAD_TIMEOUT_SECONDS", "120"))
+
+# Vector index of the face collection: FLAT, IVF_FLAT, IVF_SQ8, IVF_PQ, HNSW or
+# DISKANN. Params are JSON and override the per-type defaults, e.g.
+# MILVUS_INDEX_PARAMS='{"M": 32, "efConstruction": 256}' MILVUS_SEARCH_PARAMS='{"ef": 128}'
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_FLAT").upper()
+MILVUS_INDEX_PARAMS = os.getenv("MILVUS_INDEX_PARAMS", "")
+MILVUS_SEARCH_PARAMS = os.getenv("MILVUS_SEARCH_PARAMS", "")
+# Compact embedding storage for first-pass search: float (float16 in the local
+# cache, float32 in Milvus), int8 (IVF_SQ8 in Milvus) or binary (sign bits,
+# BINARY_VECTOR/HAMMING in its own collection). Compact modes re-rank the top
+# limit * EMBEDDING_RERANK_FACTOR candidates against float32 vectors: int8
+# against the ones Milvus keeps, binary against a local SQLite store.
+EMBEDDING_STORAGE_MODE = os.getenv("EMBEDDING_STORAGE_MODE", "float").lower()
+EMBEDDING_RERANK_FACTOR = int(os.getenv("EMBEDDING_RERANK_FACTOR", "4"))
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "temp/embeddings.sqlite3")
+
+# InsightFace model pool
+INSIGHTFACE_MODEL_NAME = os.getenv("INSIGHTFACE_MODEL_NAME", "buffalo_l")
+INSIGHTFACE_CTX_ID = int(os.getenv("INSIGHTFACE_CTX_ID", "0"))
+INSIGHTFACE_DET_SIZE = int(os.getenv("INSIGHTFACE_DET_SIZE", "640"))
+# fixed: INSIGHTFACE_DET_SIZE square input, adaptive: input follows the image
+# size and aspect ratio between the adaptive min/max sides (see
+# integrates/detection.py and test/benchmark_detection.py for tuning)
+INSIGHTFACE_DET_MODE = os.getenv("INSIGHTFACE_DET_MODE", "fixed").lower()
+DETECTION_ADAPTIVE_MIN_SIDE = int(os.getenv("DETECTION_ADAPTIVE_MIN_SIDE", "320"))
+DETECTION_ADAPTIVE_MAX_SIDE = int(os.getenv("DETECTION_ADAPTIVE_MAX_SIDE", "1280"))
+# JPEGs whose long side is at least 2x this are decoded at 1/2, 1/4 or 1/8
+# scale straight from the DCT, 0 always decodes at full resolution
+DETECTION_DECODE_MAX_SIDE = int(os.getenv("DETECTION_DECODE_MAX_SIDE", "0"))
+# Overlapping-tile detection for crowd photos: off, on, or auto (images whose
+# decoded long side is at least DETECTION_TILE_MIN_SIDE)
+DETECTION_TILING = os.getenv("DETECTION_TILING", "off").lower()
+DETECTION_TILE_SIZE = int(os.getenv("DETECTION_TILE_SIZE", "1280"))
+DETECTION_TILE_OVERLAP = float(os.getenv("DETECTION_TILE_OVERLAP", "0.2"))
+DETECTION_TILE_MIN_SIDE = int(os.getenv("DETECTION_TILE_MIN_SIDE", "3000"))
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "1"))
+# Separately prepared slots for detection-only and embed-only requests,
+# loaded on first use of that mode
+DETECT_ONLY_POOL_SIZE = int(os.getenv("DETECT_ONLY_POOL_SIZE", "1"))
+EMBED_ONLY_POOL_SIZE = int(os.getenv("EMBED_ONLY_POOL_SIZE", "1"))
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))  # 0 = auto
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "1"))
+ORT_PIN_CORES = os.getenv("ORT_PIN_CORES", "false").lower() == "true"
+
+# Detection process pool (0 = run the engine inside the API process)
+DETECTION_PROCESS_WORKERS = int(os.getenv("DETECTION_PROCESS_WORKERS", "1"))
+
+# Micro-batching inference engine
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+
+# Batch detection pipeline: per-stage concurrency and queue bound
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+PIPELINE_FETCH_CONCURRENCY = int(os.getenv("PIPELINE_FETCH_CONCURRENCY", "8"))
+PIPELINE_DOWNLOAD_CONCURRENCY = int(os.getenv("PIPELINE_DOWNLOAD_CONCURRENCY", "8"))
+# A download worker also takes up to this many images already waiting and
+# downloads them in one batch over the shared connections
+PIPELINE_DOWNLOAD_BATCH_SIZE = int(os.getenv("PIPELINE_DOWNLOAD_BATCH_SIZE", "4"))
+PIPELINE_DECODE_CONCURRENCY = int(os.getenv("PIPELINE_DECODE_CONCURRENCY", "2"))
+# Enough in-flight images to fill the engine's micro-batches
+PIPELINE_INFERENCE_CONCURRENCY = int(
+    os.getenv(
+        "PIPELINE_INFERENCE_CONCURRENCY",
+        str(INFERENCE_MAX_BATCH_SIZE * max(DETECTION_PROCESS_WORKERS, 1)),
+    )
+)
+PIPELINE_MILVUS_CONCURRENCY = int(os.getenv("PIPELINE_MILVUS_CONCURRENCY", "2"))
+PIPELINE_PERSIST_CONCURRENCY = int(os.getenv("PIPELINE_PERSIST_CONCURRENCY", "4"))
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "500"))
+
+# Detection result cache
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "true").lower() == "true"
+DETECTION_CACHE_MEMORY_MAX_MB = int(os.getenv("DETECTION_CACHE_MEMORY_MAX_MB", "64"))
+DETECTION_CACHE_DISK_DIR = os.getenv(
+    "DETECTION_CACHE_DISK_DIR", "temp/cache/detections"
+)
+DETECTION_CACHE_DISK_MAX_MB = int(os.getenv("DETECTION_CACHE_DISK_MAX_MB", "512"))
+
+# Per-playground in-process vector cache in front of Milvus search
+VECTOR_CACHE_ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "true").lower() == "true"
+VECTOR_CACHE_DIR = os.getenv("VECTOR_CACHE_DIR", "temp/cache/vectors")
+# Playgrounds above this many faces are always searched in Milvus
+VECTOR_CACHE_MAX_SIZE = int(os.getenv("VECTOR_CACHE_MAX_SIZE", "500000"))
+# Up to this many faces are searched brute force, above it through IVF lists
+VECTOR_CACHE_BRUTE_FORCE_MAX = int(os.getenv("VECTOR_CACHE_BRUTE_FORCE_MAX", "20000"))
+VECTOR_CACHE_NPROBE = int(os.getenv("VECTOR_CACHE_NPROBE", "8"))
+# Re-warm from Milvus after this many seconds, 0 keeps a warmed index forever
+VECTOR_CACHE_TTL_SECONDS = int(os.getenv("VECTOR_CACHE_TTL_SECONDS", "3600"))
+# Inserts this long before a warm started are replayed into its snapshot:
+# faces reach Milvus (and the cache) before their Mongo write
+VECTOR_CACHE_WARM_GRACE_SECONDS = float(
+    os.getenv("VECTOR_CACHE_WARM_GRACE_SECONDS", "60")
+)
+
+# Name suggestions (/suggest-tags): nearest tagged faces per detected face,
+# minimum cosine similarity for a hit to vote, names returned per face
+SUGGEST_NEIGHBORS = int(os.getenv("SUGGEST_NEIGHBORS", "20"))
+SUGGEST_MIN_SIMILARITY = float(os.getenv("SUGGEST_MIN_SIMILARITY", "0.4"))
+SUGGEST_MAX_NAMES = int(os.getenv("SUGGEST_MAX_NAMES", "5"))
+# Per-person centroid index: /suggest-tags scores the centroids first and
+# refines against the faces of the CENTROID_CANDIDATES closest persons only
+CENTROID_INDEX_ENABLED = os.getenv("CENTROID_INDEX_ENABLED", "true").lower() == "true"
+CENTROID_INDEX_DIR = os.getenv("CENTROID_INDEX_DIR", "temp/cache/centroids")
+CENTROID_CANDIDATES = int(os.getenv("CENTROID_CANDIDATES", "3"))
+# Refinement filters on face ids; above this many it falls back to the full search
+CENTROID_MAX_REFINE_FACES = int(os.getenv("CENTROID_MAX_REFINE_FACES", "5000"))
+# Rebuild from the MongoDB tags after this many seconds, 0 keeps an index forever
+CENTROID_INDEX_TTL_SECONDS = int(os.getenv("CENTROID_INDEX_TTL_SECONDS", "3600"))
+# Person id -> name lookups are cached in-process for this many seconds
+PERSON_NAME_CACHE_TTL_SECONDS = int(os.getenv("PERSON_NAME_CACHE_TTL_SECONDS", "300"))
+
+# Aligned face-crop store: the 112x112 crops embedded at detection time are
+# kept by milvusId so a recognition model change only re-embeds them. Crops
+# are appended to fixed-size chunk files; with backend "supabase" every full
+# chunk is also uploaded under CROP_STORE_REMOTE_PREFIX in the bucket
+CROP_STORE_ENABLED = os.getenv("CROP_STORE_ENABLED", "false").lower() == "true"
+CROP_STORE_DIR = os.getenv("CROP_STORE_DIR", "temp/crops")
+CROP_STORE_CHUNK_CROPS = int(os.getenv("CROP_STORE_CHUNK_CROPS", "4096"))
+CROP_STORE_BACKEND = os.getenv("CROP_STORE_BACKEND", "local").lower()
+CROP_STORE_REMOTE_PREFIX = os.getenv("CROP_STORE_REMOTE_PREFIX", "face-crops")
+# Crops per recognition call of the re-embed job
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "256"))
+
+# Collection migrations (new recognition model or index): a new collection
+# version is backfilled in batches of MIGRATION_BATCH_SIZE rows, at most
+# MIGRATION_MAX_ROWS_PER_SECOND (0 = unthrottled), while new faces are
+# written to both versions; progress survives restarts in the state file
+MIGRATION_STATE_PATH = os.getenv("MIGRATION_STATE_PATH", "temp/milvus_migration.json")
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+MIGRATION_MAX_ROWS_PER_SECOND = float(os.getenv("MIGRATION_MAX_ROWS_PER_SECOND", "200"))
+
+# Detection jobs: /detect with queue=true persists the request in a SQLite
+# queue and answers 202; JOB_WORKERS drain it by priority, of which
+# JOB_RESERVED_WORKERS only take high-priority jobs so short requests never
+# wait behind a backlog of long ones. Jobs interrupted by a restart run again
+# until they used up JOB_MAX_ATTEMPTS.
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "temp/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RESERVED_WORKERS = int(os.getenv("JOB_RESERVED_WORKERS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished jobs are pruned from the queue after this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "604800"))
+
+# Detections of one image are single-flight: concurrent requests in a process
+# share one run, and a processing lease on the image document (renewed while
+# the detection runs, taken over once expired) makes other workers wait for
+# the holder's result instead of detecting again
+DETECTION_LEASE_SECONDS = float(os.getenv("DETECTION_LEASE_SECONDS", "120"))
+DETECTION_LEASE_POLL_SECONDS = float(os.getenv("DETECTION_LEASE_POLL_SECONDS", "0.5"))
+# A re-detected face takes over the tag of the previous face its bbox overlaps
+# at least this much (IoU): detection order, and so milvusIds, can change
+REDETECT_MATCH_MIN_IOU = float(os.getenv("REDETECT_MATCH_MIN_IOU", "0.5"))
 
 # OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -3,6 +3,8 @@ from enum import Enum
 
 class ImageStatusEnum(str, Enum):
     UPLOADED = "uploaded"
+    QUEUED = "queued"
+    PROCESSING = "processing"
     DETECTED = "detected"
     RECOGNIZED = "recognized"
     FAILED = "failed"
@@ -0,0 +1,326 @@
+"""
+Per-person centroid index, one per playground.
+
+Every tagged person is represented by the running sum of its faces'
+L2-normalized embeddings, so tagging or re-tagging a face is an O(dim) update
+and the centroid is the normalized sum. Identity lookups score a query against
+the P person centroids instead of all N stored faces, then refine against the
+faces of the few best persons only. Like the vector cache, a playground is
+used only once it has been fully built from the current tags; until then, or
+once the TTL has passed, callers fall back to the full search. Tags are
+appended to a journal that is folded into the saved matrix every
+JOURNAL_MAX_ENTRIES tags.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import CENTROID_INDEX_DIR, CENTROID_INDEX_TTL_SECONDS
+from integrates.quantization import normalize
+from integrates.vector_cache import _file_stem, _top_k
+
+# Tags appended to a playground's journal before it is folded into the .npz
+JOURNAL_MAX_ENTRIES = 1000
+
+
+class PersonCentroids:
+    def __init__(self, directory: Path, playground_id: str, dim: int):
+        self.dim = dim
+        self.playground_id = playground_id
+        stem = _file_stem(playground_id)
+        self.matrix_path = directory / f"{stem}.npz"
+        self.meta_path = directory / f"{stem}.json"
+        self.journal_path = directory / f"{stem}.log"
+        self.journal_entries = 0
+        self.lock = threading.RLock()
+
+        self.persons: List[str] = []
+        self.position: Dict[str, int] = {}
+        self.sums = np.zeros((0, dim), dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # face id -> person id of every face counted in a centroid
+        self.faces: Dict[str, str] = {}
+        self.complete = False
+        self.built_at = 0.0
+
+        self._load()
+
+    def _load(self):
+        if not (self.meta_path.exists() and self.matrix_path.exists()):
+            return
+        meta = json.loads(self.meta_path.read_text())
+        arrays = np.load(self.matrix_path)
+        if arrays["sums"].shape[1] != self.dim:
+            return
+        self.persons = meta["persons"]
+        self.position = {person_id: i for i, person_id in enumerate(self.persons)}
+        self.sums = arrays["sums"]
+        self.counts = arrays["counts"]
+        self.faces = meta["faces"]
+        self.complete = meta.get("complete", False)
+        self.built_at = meta.get("built_at", 0.0)
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line of a crash mid-append
+                    continue
+                self._apply(entry["face"], entry["person"], np.asarray(entry["vector"]))
+                self.journal_entries += 1
+
+    def _save(self):
+        with open(self.matrix_path, "wb") as f:
+            np.savez(f, sums=self.sums, counts=self.counts)
+        self.meta_path.write_text(
+            json.dumps(
+                {
+                    "persons": self.persons,
+                    "faces": self.faces,
+                    "complete": self.complete,
+                    "built_at": self.built_at,
+                }
+            )
+        )
+        self.journal_path.unlink(missing_ok=True)
+        self.journal_entries = 0
+
+    def _person_row(self, person_id: str) -> int:
+        row = self.position.get(person_id)
+        if row is None:
+            row = len(self.persons)
+            self.persons.append(person_id)
+            self.position[person_id] = row
+            self.sums = np.vstack([self.sums, np.zeros((1, self.dim))])
+            self.counts = np.append(self.counts, 0)
+        return row
+
+    def build(self, faces: Dict[str, str], embeddings: Dict[str, List[float]]):
+        """Replace all centroids from face id -> person id tags in one pass"""
+        face_ids = [face_id for face_id in faces if face_id in embeddings]
+        with self.lock:
+            self.persons = sorted({faces[face_id] for face_id in face_ids})
+            self.position = {person_id: i for i, person_id in enumerate(self.persons)}
+            rows = np.array(
+                [self.position[faces[face_id]] for face_id in face_ids], dtype=np.int64
+            )
+            self.sums = np.zeros((len(self.persons), self.dim), dtype=np.float64)
+            self.counts = np.bincount(rows, minlength=len(self.persons))
+            if face_ids:
+                np.add.at(
+                    self.sums,
+                    rows,
+                    normalize([embeddings[face_id] for face_id in face_ids]),
+                )
+            self.faces = {face_id: faces[face_id] for face_id in face_ids}
+            self.complete = True
+            self.built_at = time.time()
+            self._save()
+
+    def _apply(self, face_id: str, person_id: Optional[str], vector: np.ndarray):
+        previous = self.faces.pop(face_id, None)
+        if previous is not None:
+            row = self.position[previous]
+            self.sums[row] -= vector
+            self.counts[row] -= 1
+        if person_id:
+            row = self._person_row(person_id)
+            self.sums[row] += vector
+            self.counts[row] += 1
+            self.faces[face_id] = person_id
+
+    def assign(self, face_id: str, person_id: Optional[str], embedding):
+        """Move one face to person_id (None untags it), updating both centroids"""
+        vector = normalize(embedding)[0]
+        with self.lock:
+            self._apply(face_id, person_id, vector)
+            if self.journal_entries >= JOURNAL_MAX_ENTRIES:
+                self._save()
+                return
+            with open(self.journal_path, "a") as f:
+                f.write(
+                    json.dumps(
+                        {
+                            "face": face_id,
+                            "person": person_id,
+                            "vector": vector.tolist(),
+                        }
+                    )
+                    + "\n"
+                )
+            self.journal_entries += 1
+
+    def forget(self, face_ids) -> bool:
+        """
+        Mark the index for a rebuild when any of face_ids is counted in a
+        centroid, e.g. re-detection deleted it or reused its id for another
+        face. True when it did.
+        """
+        with self.lock:
+            if not self.complete or not any(
+                face_id in self.faces for face_id in face_ids
+            ):
+                return False
+            self.complete = False
+            self._save()
+            return True
+
+    def is_fresh(self) -> bool:
+        if not self.complete:
+            return False
+        return (
+            CENTROID_INDEX_TTL_SECONDS <= 0
+            or time.time() - self.built_at < CENTROID_INDEX_TTL_SECONDS
+        )
+
+    def search(self, queries, k: int) -> List[List[Tuple[str, float]]]:
+        """The k persons whose centroid is closest to each query, best first"""
+        queries = normalize(queries)
+        with self.lock:
+            tagged = np.nonzero(self.counts > 0)[0]
+            if len(tagged) == 0:
+                return [[] for _ in range(len(queries))]
+            centroids = normalize(self.sums[tagged])
+        scores = queries @ centroids.T
+        top = _top_k(scores, k)
+        return [
+            [(self.persons[tagged[i]], float(scores[q, i])) for i in top[q]]
+            for q in range(len(queries))
+        ]
+
+    def members(self, person_ids) -> Dict[str, str]:
+        wanted = set(person_ids)
+        with self.lock:
+            return {
+                face_id: person_id
+                for face_id, person_id in self.faces.items()
+                if person_id in wanted
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "persons": int(np.count_nonzero(self.counts > 0)),
+            "faces": len(self.faces),
+            "complete": self.complete,
+            "fresh": self.is_fresh(),
+            "built_at": self.built_at,
+        }
+
+
+class CentroidIndex:
+    def __init__(self, directory: str, dim: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, PersonCentroids] = {}
+        self._counters = {"hits": 0, "misses": 0}
+
+    def _index(
+        self, playground_id: str, create: bool = False
+    ) -> Optional[PersonCentroids]:
+        with self._lock:
+            index = self._indexes.get(playground_id)
+            if index is None:
+                path = self.directory / f"{_file_stem(playground_id)}.json"
+                if not create and not path.exists():
+                    return None
+                index = PersonCentroids(self.directory, playground_id, self.dim)
+                self._indexes[playground_id] = index
+            return index
+
+    def build(
+        self,
+        playground_id: str,
+        faces: Dict[str, str],
+        embeddings: Dict[str, List[float]],
+    ) -> Dict[str, Any]:
+        index = self._index(playground_id, create=True)
+        index.build(faces, embeddings)
+        return index.stats()
+
+    def assign(
+        self,
+        playground_id: Optional[str],
+        face_id: str,
+        person_id: Optional[str],
+        embedding,
+    ):
+        """Keep a built index incrementally up to date as faces are tagged"""
+        if not playground_id:
+            return
+        index = self._index(playground_id)
+        if index is None or not index.complete:
+            return
+        index.assign(face_id, person_id, embedding)
+
+    def forget(self, playground_id: Optional[str], face_ids) -> bool:
+        """Mark a playground for a rebuild when re-detection replaced tagged faces"""
+        if not playground_id:
+            return False
+        index = self._index(playground_id)
+        return index is not None and index.forget(face_ids)
+
+    def candidates(
+        self, playground_id: Optional[str], embeddings, k: int
+    ) -> Optional[Tuple[List[List[Tuple[str, float]]], Dict[str, str]]]:
+        """
+        Closest persons per query plus the face id -> person id map of all
+        of them, None when the playground has no fresh index.
+        """
+        index = self._index(playground_id) if playground_id else None
+        if index is None or not index.is_fresh():
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        persons = index.search(embeddings, k)
+        faces = index.members(
+            {person_id for query_persons in persons for person_id, _ in query_persons}
+        )
+        with self._lock:
+            self._counters["hits"] += 1
+        return persons, faces
+
+    def invalidate(self):
+        """Mark every playground for a rebuild, e.g. after a recognition model change"""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            with index.lock:
+                index.complete = False
+                index._save()
+        for meta_path in self.directory.glob("*.json"):
+            meta = json.loads(meta_path.read_text())
+            if meta.get("complete"):
+                meta["complete"] = False
+                meta_path.write_text(json.dumps(meta))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            indexes = dict(self._indexes)
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "playgrounds": {pid: index.stats() for pid, index in indexes.items()},
+        }
+
+
+# Global index instance
+centroid_index = None
+_index_lock = threading.Lock()
+
+
+def get_centroid_index(dim: int) -> CentroidIndex:
+    """Get the global centroid index with lazy initialization"""
+    global centroid_index
+    with _index_lock:
+        if centroid_index is None:
+            centroid_index = CentroidIndex(CENTROID_INDEX_DIR, dim)
+    return centroid_index
@@ -0,0 +1,247 @@
+"""
+Chunked on-disk store of aligned face crops, keyed by milvus id.
+
+Crops are raw uint8 (size, size, 3) records written into fixed-capacity chunk
+files, so reading a chunk back is one memory map and a re-embed batch is a
+slice of it instead of one file, download or image decode per face. A SQLite
+index maps every milvus id to its chunk and slot. Full chunks are sealed and
+never written again, which is what makes them safe to mirror to remote
+storage; a re-tagged or re-detected id simply points at its newest record.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import CROP_STORE_CHUNK_CROPS, CROP_STORE_DIR
+
+CROP_SIZE = 112
+
+
+class CropStore:
+    def __init__(
+        self,
+        directory: str,
+        crop_size: int = CROP_SIZE,
+        chunk_crops: int = CROP_STORE_CHUNK_CROPS,
+    ):
+        if chunk_crops < 1:
+            raise ValueError("chunk_crops must be >= 1")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.crop_size = crop_size
+        self.chunk_crops = chunk_crops
+        self.record_shape = (crop_size, crop_size, 3)
+        self.record_bytes = crop_size * crop_size * 3
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.directory / "index.sqlite3"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS crops "
+            "(id TEXT PRIMARY KEY, chunk INTEGER, slot INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (chunk INTEGER PRIMARY KEY, "
+            "crops INTEGER, sealed INTEGER DEFAULT 0, uploaded INTEGER DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        stored = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'crop_size'"
+        ).fetchone()
+        if stored is None:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('crop_size', ?)",
+                (str(crop_size),),
+            )
+        elif int(stored[0]) != crop_size:
+            raise ValueError(
+                f"Crop store at {directory} holds {stored[0]}px crops, not {crop_size}px"
+            )
+        self._conn.commit()
+
+    def chunk_name(self, chunk: int) -> str:
+        return f"chunk-{chunk:06d}.bin"
+
+    def chunk_path(self, chunk: int) -> Path:
+        return self.directory / self.chunk_name(chunk)
+
+    def _open_chunk(self) -> Tuple[int, int]:
+        """The chunk being filled and its record count, starting a new one if needed"""
+        row = self._conn.execute(
+            "SELECT chunk, crops FROM chunks WHERE sealed = 0 ORDER BY chunk LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            return row
+        last = self._conn.execute("SELECT MAX(chunk) FROM chunks").fetchone()[0]
+        chunk = 0 if last is None else last + 1
+        self._conn.execute("INSERT INTO chunks (chunk, crops) VALUES (?, 0)", (chunk,))
+        return chunk, 0
+
+    def put_many(self, ids: List[str], crops) -> List[int]:
+        """Store crops by id, returns the chunks this write sealed"""
+        crops = np.ascontiguousarray(crops, dtype=np.uint8)
+        if crops.shape[1:] != self.record_shape or len(crops) != len(ids):
+            raise ValueError(
+                f"Expected {len(ids)} crops of shape {self.record_shape}, "
+                f"got {crops.shape}"
+            )
+        sealed = []
+        with self._lock:
+            index_rows = []
+            position = 0
+            while position < len(ids):
+                chunk, count = self._open_chunk()
+                take = min(self.chunk_crops - count, len(ids) - position)
+                path = self.chunk_path(chunk)
+                # Written at the indexed offset, never at EOF: bytes left by a
+                # write whose index commit was lost are simply overwritten
+                with open(path, "r+b" if path.exists() else "wb") as f:
+                    f.seek(count * self.record_bytes)
+                    f.write(crops[position : position + take].tobytes())
+                index_rows += [
+                    (ids[position + i], chunk, count + i) for i in range(take)
+                ]
+                count += take
+                is_full = count >= self.chunk_crops
+                self._conn.execute(
+                    "UPDATE chunks SET crops = ?, sealed = ? WHERE chunk = ?",
+                    (count, int(is_full), chunk),
+                )
+                if is_full:
+                    sealed.append(chunk)
+                position += take
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO crops (id, chunk, slot) VALUES (?, ?, ?)",
+                index_rows,
+            )
+            self._conn.commit()
+        return sealed
+
+    def locate(self, ids: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Chunk and slot of every stored id"""
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk_ids = ids[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT id, chunk, slot FROM crops WHERE id IN "
+                    f"({','.join('?' * len(chunk_ids))})",
+                    chunk_ids,
+                ).fetchall()
+                for face_id, chunk, slot in rows:
+                    found[face_id] = (chunk, slot)
+        return found
+
+    def _records(self, chunk: int) -> np.ndarray:
+        return np.memmap(self.chunk_path(chunk), dtype=np.uint8, mode="r").reshape(
+            -1, *self.record_shape
+        )
+
+    def get_many(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Crops of the stored ids whose chunk is on local disk"""
+        by_chunk: Dict[int, List[Tuple[str, int]]] = {}
+        for face_id, (chunk, slot) in self.locate(ids).items():
+            by_chunk.setdefault(chunk, []).append((face_id, slot))
+        found = {}
+        for chunk, entries in by_chunk.items():
+            if not self.chunk_path(chunk).exists():
+                continue
+            records = self._records(chunk)
+            for face_id, slot in entries:
+                found[face_id] = np.array(records[slot])
+        return found
+
+    def chunk_ids(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT chunk FROM crops ORDER BY chunk"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_chunk(
+        self, chunk: int, batch_size: int
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """(ids, crops) batches of one local chunk's live records, in slot order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, slot FROM crops WHERE chunk = ? ORDER BY slot", (chunk,)
+            ).fetchall()
+        if not rows:
+            return
+        records = self._records(chunk)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            slots = np.array([slot for _, slot in batch], dtype=np.int64)
+            yield [face_id for face_id, _ in batch], np.array(records[slots])
+
+    def pending_uploads(self) -> List[int]:
+        """Sealed chunks not yet mirrored to remote storage"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk FROM chunks WHERE sealed = 1 AND uploaded = 0 "
+                "ORDER BY chunk"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_uploaded(self, chunk: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE chunks SET uploaded = 1 WHERE chunk = ?", (chunk,)
+            )
+            self._conn.commit()
+
+    def install_chunk(self, chunk: int, content: bytes):
+        """Put a chunk downloaded from remote storage back on local disk"""
+        path = self.chunk_path(chunk)
+        partial = path.with_suffix(".part")
+        partial.write_bytes(content)
+        partial.replace(path)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM crops").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            crops = self._conn.execute("SELECT COUNT(*) FROM crops").fetchone()[0]
+            chunks, records, sealed, uploaded = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(crops), 0), "
+                "COALESCE(SUM(sealed), 0), COALESCE(SUM(uploaded), 0) FROM chunks"
+            ).fetchone()
+        local = list(self.directory.glob("chunk-*.bin"))
+        return {
+            "crops": crops,
+            # Records no id points at any more (re-stored ids)
+            "stale_records": records - crops,
+            "crop_size": self.crop_size,
+            "chunk_crops": self.chunk_crops,
+            "chunks": chunks,
+            "sealed_chunks": sealed,
+            "uploaded_chunks": uploaded,
+            "local_chunks": len(local),
+            "local_mb": round(sum(path.stat().st_size for path in local) / 2**20, 2),
+        }
+
+
+# Global store instance
+crop_store: Optional[CropStore] = None
+_store_lock = threading.Lock()
+
+
+def get_crop_store() -> CropStore:
+    """Get the global crop store with lazy initialization"""
+    global crop_store
+    with _store_lock:
+        if crop_store is None:
+            crop_store = CropStore(CROP_STORE_DIR)
+    return crop_store
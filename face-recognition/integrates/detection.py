@@ -0,0 +1,209 @@
+"""
+Detection resolution and tiling for InsightFace's SCRFD detector.
+
+fixed:    every image is letterboxed into INSIGHTFACE_DET_SIZE x INSIGHTFACE_DET_SIZE
+adaptive: the detector input follows the image's aspect ratio and size,
+          between DETECTION_ADAPTIVE_MIN_SIDE and DETECTION_ADAPTIVE_MAX_SIDE
+          (multiples of 32), so thumbnails cost less and large photos keep
+          more pixels per face
+tiling:   overlapping DETECTION_TILE_SIZE windows at native resolution plus
+          one whole-image pass for faces larger than the overlap, merged by
+          dropping boxes cut by an inner tile edge and a cross-tile NMS
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    DETECTION_ADAPTIVE_MAX_SIDE,
+    DETECTION_ADAPTIVE_MIN_SIDE,
+    DETECTION_DECODE_MAX_SIDE,
+    DETECTION_TILE_MIN_SIDE,
+    DETECTION_TILE_OVERLAP,
+    DETECTION_TILE_SIZE,
+    DETECTION_TILING,
+    INSIGHTFACE_DET_MODE,
+    INSIGHTFACE_DET_SIZE,
+)
+
+DET_MODES = ("fixed", "adaptive")
+# Boxes this close to an inner tile edge are assumed cut by it
+EDGE_MARGIN = 2.0
+
+
+def _ceil32(value: float) -> int:
+    return max(int(math.ceil(value / 32.0)) * 32, 32)
+
+
+def adaptive_det_size(
+    width: int,
+    height: int,
+    min_side: int = DETECTION_ADAPTIVE_MIN_SIDE,
+    max_side: int = DETECTION_ADAPTIVE_MAX_SIDE,
+) -> Tuple[int, int]:
+    """Detector input (w, h) following the image's aspect ratio, no padding waste"""
+    long_side = max(width, height)
+    target = min(max(long_side, min_side), max_side)
+    scale = target / long_side
+    return _ceil32(width * scale), _ceil32(height * scale)
+
+
+def det_size_for(
+    img: np.ndarray,
+    det_mode: str = INSIGHTFACE_DET_MODE,
+    fixed_size: int = INSIGHTFACE_DET_SIZE,
+) -> Tuple[int, int]:
+    if det_mode == "adaptive":
+        return adaptive_det_size(img.shape[1], img.shape[0])
+    return fixed_size, fixed_size
+
+
+def tile_windows(
+    width: int, height: int, tile_size: int, overlap: float
+) -> List[Tuple[int, int, int, int]]:
+    """Overlapping (x1, y1, x2, y2) windows covering the image"""
+    step = max(int(tile_size * (1.0 - overlap)), 1)
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def nms(dets: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indices of the boxes kept by greedy NMS over (x1, y1, x2, y2, score) rows"""
+    x1, y1, x2, y2, scores = dets.T
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        inter = np.maximum(0.0, xx2 - xx1 + 1) * np.maximum(0.0, yy2 - yy1 + 1)
+        iou = inter / (areas[i] + areas[order[1:]] - inter)
+        order = order[1:][iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def _cut_by_inner_edge(
+    bboxes: np.ndarray, window: Tuple[int, int, int, int], width: int, height: int
+) -> np.ndarray:
+    """Mask of boxes touching a tile edge that isn't also an image edge"""
+    x1, y1, x2, y2 = window
+    cut = np.zeros(len(bboxes), dtype=bool)
+    if x1 > 0:
+        cut |= bboxes[:, 0] <= x1 + EDGE_MARGIN
+    if y1 > 0:
+        cut |= bboxes[:, 1] <= y1 + EDGE_MARGIN
+    if x2 < width:
+        cut |= bboxes[:, 2] >= x2 - EDGE_MARGIN
+    if y2 < height:
+        cut |= bboxes[:, 3] >= y2 - EDGE_MARGIN
+    return cut
+
+
+def detect_tiled(
+    det_model,
+    img: np.ndarray,
+    det_mode: str = INSIGHTFACE_DET_MODE,
+    tile_size: int = DETECTION_TILE_SIZE,
+    overlap: float = DETECTION_TILE_OVERLAP,
+    fixed_size: int = INSIGHTFACE_DET_SIZE,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    height, width = img.shape[:2]
+    bboxes, kpss = det_model.detect(
+        img,
+        input_size=det_size_for(img, det_mode, fixed_size),
+        max_num=0,
+        metric="default",
+    )
+    all_bboxes = [bboxes]
+    all_kpss = [kpss]
+    for window in tile_windows(width, height, tile_size, overlap):
+        x1, y1, x2, y2 = window
+        tile = img[y1:y2, x1:x2]
+        # Tiles are detected at native resolution, that's what finds tiny faces
+        tile_bboxes, tile_kpss = det_model.detect(
+            tile,
+            input_size=(_ceil32(x2 - x1), _ceil32(y2 - y1)),
+            max_num=0,
+            metric="default",
+        )
+        if tile_bboxes.shape[0] == 0:
+            continue
+        tile_bboxes = tile_bboxes.copy()
+        tile_bboxes[:, [0, 2]] += x1
+        tile_bboxes[:, [1, 3]] += y1
+        keep = ~_cut_by_inner_edge(tile_bboxes, window, width, height)
+        all_bboxes.append(tile_bboxes[keep])
+        if tile_kpss is not None:
+            all_kpss.append(tile_kpss[keep] + np.array([x1, y1], dtype=np.float32))
+
+    bboxes = np.vstack(all_bboxes)
+    has_kps = all(k is not None for k in all_kpss)
+    if bboxes.shape[0] == 0:
+        return bboxes, (np.vstack(all_kpss) if has_kps else None)
+    keep = nms(bboxes, getattr(det_model, "nms_thresh", 0.4))
+    return bboxes[keep], (np.vstack(all_kpss)[keep] if has_kps else None)
+
+
+def should_tile(img: np.ndarray, tiling: str = DETECTION_TILING) -> bool:
+    if tiling == "on":
+        return True
+    if tiling == "auto":
+        return max(img.shape[:2]) >= DETECTION_TILE_MIN_SIDE
+    return False
+
+
+def detect_faces(
+    det_model,
+    img: np.ndarray,
+    det_mode: str = INSIGHTFACE_DET_MODE,
+    tiling: str = DETECTION_TILING,
+    fixed_size: int = INSIGHTFACE_DET_SIZE,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Bounding boxes (x1, y1, x2, y2, score) and keypoints of one image"""
+    if should_tile(img, tiling):
+        return detect_tiled(det_model, img, det_mode, fixed_size=fixed_size)
+    return det_model.detect(
+        img,
+        input_size=det_size_for(img, det_mode, fixed_size),
+        max_num=0,
+        metric="default",
+    )
+
+
+def detection_profile() -> Dict:
+    """Every setting that changes detection output, part of the cache key"""
+    return {
+        "det_mode": INSIGHTFACE_DET_MODE,
+        "det_size": INSIGHTFACE_DET_SIZE,
+        "adaptive": [DETECTION_ADAPTIVE_MIN_SIDE, DETECTION_ADAPTIVE_MAX_SIDE],
+        "decode_max_side": DETECTION_DECODE_MAX_SIDE,
+        "tiling": DETECTION_TILING,
+        "tile": [DETECTION_TILE_SIZE, DETECTION_TILE_OVERLAP, DETECTION_TILE_MIN_SIDE],
+    }
+
+
+def rescale_faces(faces: List[Dict], scale: float) -> List[Dict]:
+    """Map serialized bbox/kps from a reduced decode back to original pixels"""
+    if scale == 1.0:
+        return faces
+    for face in faces:
+        for key in ("bbox", "kps"):
+            if face.get(key) is not None:
+                face[key] = (np.asarray(face[key]) * scale).tolist()
+    return faces
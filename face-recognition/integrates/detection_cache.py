@@ -0,0 +1,181 @@
+"""
+Content-addressed cache for serialized detection results.
+
+Entries are keyed by a SHA-256 of the image bytes plus the model name and
+detection size. A byte-bounded in-memory LRU tier sits in front of a
+size-bounded on-disk tier; both evict least recently used entries.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import (
+    DETECTION_CACHE_DISK_DIR,
+    DETECTION_CACHE_DISK_MAX_MB,
+    DETECTION_CACHE_MEMORY_MAX_MB,
+)
+
+
+class DetectionCache:
+    def __init__(
+        self,
+        memory_max_bytes: int,
+        disk_dir: Optional[str],
+        disk_max_bytes: int,
+    ):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir and disk_max_bytes > 0 else None
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(content: bytes, model_name: str, det_profile) -> str:
+        """
+        Content hash of the image bytes scoped to the model configuration;
+        det_profile is the det_size tuple or a dict of detection settings.
+        """
+        if isinstance(det_profile, dict):
+            det_profile = json.dumps(det_profile, sort_keys=True)
+        else:
+            det_profile = tuple(det_profile)
+        digest = hashlib.sha256(content)
+        digest.update(f"|{model_name}|{det_profile}".encode())
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _load_disk_index(self):
+        # Oldest first so eviction order survives restarts
+        entries = []
+        for path in self.disk_dir.glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a fresh copy of the cached faces, or None on miss"""
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return json.loads(payload)
+
+            if self.disk_dir is None or key not in self._disk_index:
+                self._counters["misses"] += 1
+                return None
+
+            path = self._disk_path(key)
+            try:
+                payload = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                self._disk_bytes -= self._disk_index.pop(key)
+                self._counters["misses"] += 1
+                return None
+            self._disk_index.move_to_end(key)
+            self._counters["disk_hits"] += 1
+            self._put_memory(key, payload)
+            return json.loads(payload)
+
+    def put(self, key: str, faces: List[Dict[str, Any]]):
+        payload = json.dumps(faces, separators=(",", ":")).encode()
+        with self._lock:
+            self._put_memory(key, payload)
+            if self.disk_dir is not None:
+                self._put_disk(key, payload)
+
+    def _put_memory(self, key: str, payload: bytes):
+        if len(payload) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = payload
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters["memory_evictions"] += 1
+
+    def _put_disk(self, key: str, payload: bytes):
+        if len(payload) > self.disk_max_bytes or key in self._disk_index:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+        self._disk_index[key] = len(payload)
+        self._disk_bytes += len(payload)
+        while self._disk_bytes > self.disk_max_bytes:
+            evicted_key, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            self._counters["disk_evictions"] += 1
+            try:
+                self._disk_path(evicted_key).unlink()
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = (
+                counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            )
+            return {
+                **counters,
+                "hit_rate": (
+                    round((lookups - counters["misses"]) / lookups, 4)
+                    if lookups
+                    else 0.0
+                ),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+            }
+
+
+# Global cache instance
+detection_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_detection_cache() -> DetectionCache:
+    """Get the global detection cache with lazy initialization"""
+    global detection_cache
+    with _cache_lock:
+        if detection_cache is None:
+            detection_cache = DetectionCache(
+                memory_max_bytes=DETECTION_CACHE_MEMORY_MAX_MB * 1024 * 1024,
+                disk_dir=DETECTION_CACHE_DISK_DIR,
+                disk_max_bytes=DETECTION_CACHE_DISK_MAX_MB * 1024 * 1024,
+            )
+    return detection_cache
@@ -0,0 +1,278 @@
+"""
+Process pool for CPU-bound face detection.
+
+Decoded images are copied once into `multiprocessing.shared_memory` and only
+the block name, shape and dtype are pickled to the worker, which runs the
+images through its own batching engine and returns serialized faces.
+
+A worker process executes one call at a time, so concurrent requests are
+grouped in the parent (max batch size / max wait) and handed over as one call;
+otherwise the worker's engine would only ever see batches of one image.
+"""
+
+import asyncio
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    CROP_STORE_ENABLED,
+    DETECTION_PROCESS_WORKERS,
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_WAIT_MS,
+)
+
+# Global executor instance
+detection_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pool_batcher = None
+
+
+def _init_worker(process_count: int, counter):
+    """Load and warm the model pool once per worker process"""
+    with counter.get_lock():
+        process_index = counter.value
+        counter.value += 1
+
+    from integrates.insightface import init_models
+
+    init_models(process_count=process_count, process_index=process_index)
+
+
+def _detect_shared_batch(handles: List[Tuple]) -> List[Tuple]:
+    """Detect every shared-memory image of a handoff in one engine batch"""
+    from integrates.insightface import get_inference_engine, serialize_faces
+
+    # Spawned workers share the parent's resource tracker, the parent unlinks
+    blocks = []
+    futures = []
+    try:
+        for name, shape, dtype, mode, faces, model_name in handles:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError as e:
+                # One image gone must not fail the rest of the batch
+                futures.append(e)
+                continue
+            blocks.append(shm)
+            futures.append(
+                get_inference_engine(mode, model_name).submit(
+                    np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf), faces
+                )
+            )
+        results = []
+        for future in futures:
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                results.append(
+                    (True, serialize_faces(future.result(), CROP_STORE_ENABLED))
+                )
+            except Exception as e:
+                results.append((False, str(e)))
+        return results
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+def _engine_stats() -> Dict:
+    from integrates.insightface import get_inference_engine
+
+    stats = get_inference_engine().get_stats()
+    stats["pid"] = os.getpid()
+    return stats
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def get_detection_executor() -> Optional[ProcessPoolExecutor]:
+    """Get the global detection process pool, None when running in-process"""
+    global detection_executor
+    if DETECTION_PROCESS_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if detection_executor is None:
+            # spawn: ONNX Runtime thread pools don't survive fork
+            ctx = mp.get_context("spawn")
+            detection_executor = ProcessPoolExecutor(
+                max_workers=DETECTION_PROCESS_WORKERS,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(DETECTION_PROCESS_WORKERS, ctx.Value("i", 0)),
+            )
+    return detection_executor
+
+
+async def start_detection_pool():
+    """Spawn and warm every detection worker (or the in-process engine)"""
+    executor = get_detection_executor()
+    if executor is None:
+        from integrates.insightface import init_models
+
+        await asyncio.to_thread(init_models)
+        return
+
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *[
+            loop.run_in_executor(executor, _ready)
+            for _ in range(DETECTION_PROCESS_WORKERS)
+        ]
+    )
+
+
+def shutdown_detection_pool():
+    global detection_executor, _pool_batcher
+    with _executor_lock:
+        if detection_executor is not None:
+            detection_executor.shutdown(wait=False, cancel_futures=True)
+            detection_executor = None
+            _pool_batcher = None
+
+
+def _release(shm: shared_memory.SharedMemory):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class _PoolBatcher:
+    """
+    Groups concurrent shared-memory handoffs into one worker call. The
+    batcher owns each block until the worker is done with it: a caller that
+    goes away (a disconnected stream or batch client) only drops its block
+    while it is still pending, a block already handed over is released once
+    the worker call finishes.
+    """
+
+    def __init__(self, executor: ProcessPoolExecutor):
+        self.executor = executor
+        self._pending = []
+        self._timer = None
+
+    async def submit(
+        self,
+        img: np.ndarray,
+        mode: str = "full",
+        faces: Optional[List[Dict]] = None,
+        model_name: Optional[str] = None,
+    ) -> List[Dict]:
+        img = np.ascontiguousarray(img)
+        shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+        try:
+            np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[:] = img
+        except BaseException:
+            _release(shm)
+            raise
+        future = asyncio.get_running_loop().create_future()
+        entry = (
+            (shm.name, img.shape, img.dtype.str, mode, faces, model_name),
+            future,
+            shm,
+        )
+        self._pending.append(entry)
+        if len(self._pending) >= INFERENCE_MAX_BATCH_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                INFERENCE_MAX_WAIT_MS / 1000.0, self._flush
+            )
+        try:
+            success, value = await future
+        except asyncio.CancelledError:
+            self._drop(entry)
+            raise
+        if not success:
+            raise RuntimeError(value)
+        return value
+
+    def _drop(self, entry: Tuple):
+        """Take a cancelled caller's handoff out, unless a worker has it"""
+        for index, pending in enumerate(self._pending):
+            if pending is entry:
+                del self._pending[index]
+                _release(entry[2])
+                return
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        def _resolve(done: asyncio.Future):
+            # The worker has closed its views, the blocks can go now
+            for _, _, shm in batch:
+                _release(shm)
+            for i, (_, future, _) in enumerate(batch):
+                if future.done():
+                    continue
+                if done.cancelled():
+                    future.cancel()
+                elif done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result()[i])
+
+        try:
+            call = asyncio.wrap_future(
+                self.executor.submit(
+                    _detect_shared_batch, [handle for handle, _, _ in batch]
+                )
+            )
+        except Exception as e:
+            # Pool shut down or broken: nothing reached a worker
+            failed = asyncio.get_running_loop().create_future()
+            failed.set_exception(e)
+            _resolve(failed)
+            return
+        call.add_done_callback(_resolve)
+
+
+async def detect_in_pool(
+    img: np.ndarray,
+    mode: str = "full",
+    faces: Optional[List[Dict]] = None,
+    model_name: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Run detection on a decoded image without blocking the event loop. `mode`
+    picks the engine: full, detect (no embeddings) or embed (aligns and embeds
+    the caller-supplied `faces` without running the detector). `model_name`
+    defaults to INSIGHTFACE_MODEL_NAME; a migration switches it at runtime.
+    """
+    global _pool_batcher
+    executor = get_detection_executor()
+    if executor is None:
+        from integrates.insightface import get_inference_engine, serialize_faces
+
+        engine = await asyncio.to_thread(get_inference_engine, mode, model_name)
+        detected = await asyncio.wrap_future(engine.submit(img, faces))
+        return serialize_faces(detected, CROP_STORE_ENABLED)
+
+    if _pool_batcher is None or _pool_batcher.executor is not executor:
+        _pool_batcher = _PoolBatcher(executor)
+    return await _pool_batcher.submit(img, mode, faces, model_name)
+
+
+async def get_pool_engine_stats() -> Dict:
+    """Engine stats from the in-process engine or one detection worker"""
+    executor = get_detection_executor()
+    if executor is None:
+        from integrates.insightface import get_inference_engine
+
+        return get_inference_engine().get_stats()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _engine_stats)
@@ -0,0 +1,122 @@
+"""
+Full-precision embedding store used to re-rank binary first-pass results.
+
+A single SQLite file keyed by milvus id holds the float32 vectors, so they
+live on local disk instead of in Milvus memory or the in-process cache. It
+is the only full-precision copy in binary mode and local to the host: a new
+host needs the file (or a migration from a float/int8 version) before it can
+re-rank, warm or copy the collection. int8 mode keeps float32 vectors in
+Milvus and re-ranks with those instead.
+Every collection version from _v2 on gets its own file, so a re-embedding
+migration never overwrites the vectors the serving version re-ranks with.
+"""
+
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import EMBEDDING_STORE_PATH
+from integrates.quantization import normalize
+
+
+class EmbeddingStore:
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (id TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+        # Re-ranked candidates without a stored vector, e.g. written by
+        # another host or before the store existed
+        self.unverified = 0
+
+    def put_many(self, ids: List[str], embeddings):
+        vectors = normalize(embeddings)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (id, vector) VALUES (?, ?)",
+                [(face_id, vector.tobytes()) for face_id, vector in zip(ids, vectors)],
+            )
+            self._conn.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT id, vector FROM embeddings WHERE id IN "
+                    f"({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for face_id, blob in rows:
+                    found[face_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def rerank(
+        self, query, candidates: List[Tuple[str, float]], limit: int
+    ) -> List[Tuple[str, float]]:
+        """Re-rank candidates against the stored vectors, see rerank_exact"""
+        if not candidates:
+            return []
+        vectors = self.get_many([face_id for face_id, _ in candidates])
+        self.unverified += sum(face_id not in vectors for face_id, _ in candidates)
+        return rerank_exact(query, candidates, vectors, limit)
+
+
+def rerank_exact(
+    query, candidates: List[Tuple[str, float]], vectors: Dict[str, Any], limit: int
+) -> List[Tuple[str, float]]:
+    """
+    Re-score (id, approximate similarity) candidates with exact cosine
+    similarity. Candidates without a vector never outrank exactly scored
+    ones: they only fill the slots left, in their estimated order.
+    """
+    if not candidates:
+        return []
+    query = normalize(query)[0]
+    scored = [face_id for face_id, _ in candidates if face_id in vectors]
+    scores = (
+        normalize([vectors[face_id] for face_id in scored]) @ query if scored else []
+    )
+    exact = sorted(
+        zip(scored, map(float, scores)), key=lambda hit: hit[1], reverse=True
+    )
+    unverified = [hit for hit in candidates if hit[0] not in vectors]
+    return (exact + sorted(unverified, key=lambda hit: hit[1], reverse=True))[:limit]
+
+
+def embedding_store_path(collection_name: Optional[str] = None) -> str:
+    """Store file of a collection: the configured path up to _v1, one per later version"""
+    match = re.search(r"_v(\d+)$", collection_name or "")
+    if not match or int(match.group(1)) < 2:
+        return EMBEDDING_STORE_PATH
+    path = Path(EMBEDDING_STORE_PATH)
+    return str(path.with_name(f"{path.stem}.v{match.group(1)}{path.suffix}"))
+
+
+# Global store instances, one per file
+embedding_stores: Dict[str, EmbeddingStore] = {}
+_store_lock = threading.Lock()
+
+
+def get_embedding_store(path: Optional[str] = None) -> EmbeddingStore:
+    """Get a full-precision store (the configured one by default), lazily opened"""
+    path = path or EMBEDDING_STORE_PATH
+    with _store_lock:
+        if path not in embedding_stores:
+            embedding_stores[path] = EmbeddingStore(path)
+    return embedding_stores[path]
@@ -0,0 +1,244 @@
+"""
+Dynamic micro-batching engine for InsightFace inference.
+
+Concurrent requests submit decoded images; a worker thread per model slot
+collects them until `max_batch_size` images are queued or `max_wait_ms` has
+elapsed, runs detection per image (resolution and tiling as configured in
+integrates/detection.py) and then embeds every aligned face crop of the batch
+in a single ArcFace ONNX call. Each face keeps its aligned crop (`face.crop`)
+so it can be stored and re-embedded later without decoding or detecting.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+from integrates.detection import detect_faces
+
+
+class _InferenceRequest:
+    def __init__(
+        self,
+        img: Optional[np.ndarray],
+        faces: Optional[List[Dict]] = None,
+        crops: Optional[np.ndarray] = None,
+    ):
+        self.img = img
+        # Caller-supplied bbox/kps: skip detection, only align and embed
+        self.faces = faces
+        # Already aligned crops: skip detection and alignment, only embed
+        self.crops = crops
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+def _supplied_faces(faces: List[Dict]):
+    """bboxes (x1, y1, x2, y2, score) and kps arrays from caller-supplied faces"""
+    kpss = np.array([face["kps"] for face in faces], dtype=np.float32).reshape(
+        len(faces), 5, 2
+    )
+    bboxes = np.array(
+        [
+            list(face.get("bbox") or [*kps.min(axis=0), *kps.max(axis=0)])
+            + [face.get("det_score", 1.0)]
+            for face, kps in zip(faces, kpss)
+        ],
+        dtype=np.float32,
+    ).reshape(len(faces), 5)
+    return bboxes, kpss
+
+
+class BatchingInferenceEngine:
+    def __init__(self, models, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.models = models if isinstance(models, list) else [models]
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: "queue.Queue[_InferenceRequest]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._batch_stats = deque(maxlen=100)
+        self._totals = {"batches": 0, "images": 0, "faces": 0}
+
+    def start(self):
+        """Start one batching worker thread per model slot (idempotent)"""
+        with self._lock:
+            if self._workers:
+                return
+            for i, model in enumerate(self.models):
+                worker = threading.Thread(
+                    target=self._run,
+                    args=(model,),
+                    name=f"insightface-batcher-{i}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, img: np.ndarray, faces: Optional[List[Dict]] = None) -> Future:
+        """
+        Queue an image for detection + recognition, resolved with a list of
+        Face. With `faces` (dicts with kps and optionally bbox/det_score) the
+        detector is skipped; slots without a recognition model skip embedding.
+        """
+        if img is None:
+            raise ValueError("Image is empty")
+        if faces is None and self.models[0].det_model is None:
+            raise ValueError("This engine has no detector, faces must be supplied")
+        self.start()
+        request = _InferenceRequest(img, faces)
+        self._queue.put(request)
+        return request.future
+
+    def submit_crops(self, crops: np.ndarray) -> Future:
+        """
+        Queue aligned (n, size, size, 3) crops for recognition only, resolved
+        with a list of Face carrying just the embedding.
+        """
+        if self.models[0].models.get("recognition") is None:
+            raise ValueError("This engine has no recognition model")
+        self.start()
+        request = _InferenceRequest(None, crops=crops)
+        self._queue.put(request)
+        return request.future
+
+    def _collect_batch(self) -> List[_InferenceRequest]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, model):
+        cores = getattr(model, "cores", None)
+        if cores and hasattr(os, "sched_setaffinity"):
+            # Pins this worker thread (the ORT caller thread) to its slot's cores
+            os.sched_setaffinity(0, cores)
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process_batch(model, batch)
+            except Exception as e:
+                for request in batch:
+                    request.img = None
+                    request.crops = None
+                    if not request.future.done():
+                        request.future.set_exception(e.with_traceback(None))
+
+    def _process_batch(self, model, batch: List[_InferenceRequest]):
+        started_at = time.perf_counter()
+        det_model = model.det_model
+        rec_model = model.models.get("recognition")
+
+        # Detection runs per image, alignment crops are gathered for the batch
+        pending = []
+        crops = []
+        owners = []
+        for request in batch:
+            if request.crops is not None:
+                faces = [Face() for _ in range(len(request.crops))]
+                crops.extend(request.crops)
+                owners.extend(faces)
+                pending.append((request, faces))
+                continue
+            try:
+                if request.faces is not None:
+                    bboxes, kpss = _supplied_faces(request.faces)
+                else:
+                    bboxes, kpss = detect_faces(det_model, request.img)
+                faces = []
+                aligned = []
+                for i in range(bboxes.shape[0]):
+                    kps = kpss[i] if kpss is not None else None
+                    face = Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4])
+                    faces.append(face)
+                    if rec_model is not None and kps is not None:
+                        face.crop = face_align.norm_crop(
+                            request.img,
+                            landmark=kps,
+                            image_size=rec_model.input_size[0],
+                        )
+                        aligned.append(face)
+            except Exception as e:
+                request.img = None
+                # The traceback's frames hold the image, which may be a view
+                # of a shared-memory buffer the caller closes
+                request.future.set_exception(e.with_traceback(None))
+                continue
+            crops.extend(face.crop for face in aligned)
+            owners.extend(aligned)
+            pending.append((request, faces))
+
+        # Drop image references before resolving, callers may release the buffer
+        for request in batch:
+            request.img = None
+            request.crops = None
+
+        # One ONNX call embeds every face of every image in the batch
+        if crops:
+            try:
+                feats = rec_model.get_feat(crops)
+            except Exception as e:
+                for request, _ in pending:
+                    request.future.set_exception(e)
+                return
+            for face, feat in zip(owners, feats):
+                face.embedding = feat.flatten()
+
+        for request, faces in pending:
+            request.future.set_result(faces)
+
+        self._record_batch(batch, len(crops), started_at)
+
+    def _record_batch(
+        self, batch: List[_InferenceRequest], faces_count: int, started_at: float
+    ):
+        finished_at = time.perf_counter()
+        stats = {
+            "images": len(batch),
+            "faces": faces_count,
+            "occupancy": round(len(batch) / self.max_batch_size, 4),
+            "queue_wait_ms": round(
+                max(started_at - r.enqueued_at for r in batch) * 1000, 3
+            ),
+            "inference_ms": round((finished_at - started_at) * 1000, 3),
+        }
+        with self._lock:
+            self._batch_stats.append(stats)
+            self._totals["batches"] += 1
+            self._totals["images"] += len(batch)
+            self._totals["faces"] += faces_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return batching knobs, totals and per-batch occupancy of recent batches"""
+        with self._lock:
+            recent = list(self._batch_stats)
+            totals = dict(self._totals)
+        avg_occupancy = (
+            sum(s["occupancy"] for s in recent) / len(recent) if recent else 0.0
+        )
+        return {
+            "workers": len(self.models),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_size": self._queue.qsize(),
+            "totals": totals,
+            "avg_occupancy": round(avg_occupancy, 4),
+            "recent_batches": recent,
+        }
@@ -1,41 +1,135 @@
-import insightface
-from insightface.app import FaceAnalysis
-import cv2
-from pymilvus import Collection, FieldSchema, CollectionSchema, DataType, connections
-
-model = FaceAnalysis(
-    name="buffalo_l",
-    providers=["CUDAExecutionProvider", "CPUExecutionProvider"],
-    root=".",
-    allowed_modules=["detection", "recognition"],
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from core.config import (
+    DETECT_ONLY_POOL_SIZE,
+    EMBED_ONLY_POOL_SIZE,
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_WAIT_MS,
+    INSIGHTFACE_CTX_ID,
+    INSIGHTFACE_DET_SIZE,
+    INSIGHTFACE_MODEL_NAME,
+    MODEL_POOL_SIZE,
+    ORT_INTER_OP_THREADS,
+    ORT_INTRA_OP_THREADS,
+    ORT_PIN_CORES,
 )
+from integrates.inference_engine import BatchingInferenceEngine
+from integrates.opencv import ImageInput, load_image
+from integrates.model_pool import create_model_pool
 
+PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+DET_SIZE = (INSIGHTFACE_DET_SIZE, INSIGHTFACE_DET_SIZE)
 
-def face_detection(image_path: str) -> list:
-    """Face detection using InsightFace with proper data conversion"""
-    try:
-        model.prepare(ctx_id=0, det_size=(640, 640))
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Image not found or cannot be read: {image_path}")
-
-        # Get faces from InsightFace
-        faces = model.get(img)
-
-        # Convert numpy arrays to JSON-serializable format
-        serializable_faces = []
-        for face in faces:
-            face_data = {}
-            for key, value in face.items():
-                if hasattr(value, "tolist"):  # numpy array
-                    face_data[key] = value.tolist()
-                elif hasattr(value, "item"):  # numpy scalar
-                    face_data[key] = value.item()
-                else:
+# full: detect + embed, detect: boxes/kps only, embed: caller-supplied kps
+MODES = ("full", "detect", "embed")
+MODE_MODULES = {
+    "full": ["detection", "recognition"],
+    "detect": ["detection"],
+    "embed": ["recognition"],
+}
+MODE_POOL_SIZES = {
+    "full": MODEL_POOL_SIZE,
+    "detect": DETECT_ONLY_POOL_SIZE,
+    "embed": EMBED_ONLY_POOL_SIZE,
+}
+
+# Global engine instances, one per (mode, model pack)
+inference_engines: Dict[Tuple[str, str], BatchingInferenceEngine] = {}
+_engine_lock = threading.Lock()
+_process_slot = {"count": 1, "index": 0}
+
+
+def init_models(
+    process_count: int = 1,
+    process_index: int = 0,
+    mode: str = "full",
+    model_name: Optional[str] = None,
+) -> BatchingInferenceEngine:
+    """
+    Load, prepare and warm a mode's model pool once, then start its engine.
+    Another `model_name` (e.g. a new recognition model to re-embed stored
+    crops with) gets its own pool next to the serving one.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+    model_name = model_name or INSIGHTFACE_MODEL_NAME
+    key = (mode, model_name)
+    with _engine_lock:
+        _process_slot.update(count=process_count, index=process_index)
+        if key not in inference_engines:
+            slots = create_model_pool(
+                name=model_name,
+                root=".",
+                allowed_modules=MODE_MODULES[mode],
+                providers=PROVIDERS,
+                pool_size=MODE_POOL_SIZES[mode],
+                intra_op_threads=ORT_INTRA_OP_THREADS,
+                inter_op_threads=ORT_INTER_OP_THREADS,
+                pin_cores=ORT_PIN_CORES,
+                process_count=process_count,
+                process_index=process_index,
+            )
+            for slot in slots:
+                slot.prepare(ctx_id=INSIGHTFACE_CTX_ID, det_size=DET_SIZE)
+                slot.warm_up(det_size=DET_SIZE, rec_batch_size=INFERENCE_MAX_BATCH_SIZE)
+            engine = BatchingInferenceEngine(
+                slots,
+                max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                max_wait_ms=INFERENCE_MAX_WAIT_MS,
+            )
+            engine.start()
+            inference_engines[key] = engine
+    return inference_engines[key]
+
+
+def get_inference_engine(
+    mode: str = "full", model_name: Optional[str] = None
+) -> BatchingInferenceEngine:
+    """Get a mode's batching engine, initializing its models on first use"""
+    engine = inference_engines.get((mode, model_name or INSIGHTFACE_MODEL_NAME))
+    if engine is None:
+        return init_models(
+            _process_slot["count"], _process_slot["index"], mode, model_name
+        )
+    return engine
+
+
+def serialize_faces(faces, keep_crops: bool = False) -> list:
+    """
+    Convert numpy arrays to JSON-serializable format. Aligned crops are
+    dropped, or kept as uint8 arrays for the crop store with `keep_crops`.
+    """
+    serializable_faces = []
+    for face in faces:
+        face_data = {}
+        for key, value in face.items():
+            if key == "crop":
+                if keep_crops:
                     face_data[key] = value
-            serializable_faces.append(face_data)
+            elif hasattr(value, "tolist"):  # numpy array
+                face_data[key] = value.tolist()
+            elif hasattr(value, "item"):  # numpy scalar
+                face_data[key] = value.item()
+            else:
+                face_data[key] = value
+        serializable_faces.append(face_data)
+    return serializable_faces
+
+
+def detect_image(img, mode: str = "full", faces: Optional[List[Dict]] = None) -> list:
+    """Run a decoded BGR image through the mode's batching engine"""
+    faces = get_inference_engine(mode).submit(img, faces).result()
+    return serialize_faces(faces)
+
+
+def face_detection(image: ImageInput) -> list:
+    """Face detection using InsightFace on a path, encoded bytes or ndarray"""
+    try:
+        img = load_image(image)
 
-        return serializable_faces
+        # Get faces from the batching engine
+        return detect_image(img)
 
     except Exception as e:
         raise e
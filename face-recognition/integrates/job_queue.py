@@ -0,0 +1,241 @@
+"""
+Durable local queue of detection jobs.
+
+One SQLite file holds every job with its priority, state and attempts, so
+accepted work survives a restart: jobs left running by a crashed process are
+put back in the queue when it starts again, or failed once they used up their
+attempts (a job that crashes the process would otherwise do so on every
+start). Workers claim the oldest job of
+the highest priority they are allowed to take; picking and marking a job
+happen under one lock, so no two workers ever run the same job.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import JOB_MAX_ATTEMPTS, JOB_QUEUE_PATH
+
+PRIORITIES = {"low": 0, "normal": 1, "high": 2}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobConflictError(Exception):
+    def __init__(self, job: Dict[str, Any]):
+        super().__init__(f"Image {job['image_id']} has job {job['id']} {job['state']}")
+        self.job = job
+
+
+class JobQueue:
+    def __init__(self, path: str, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, "
+            "image_id TEXT, priority INTEGER, payload TEXT, state TEXT, "
+            "attempts INTEGER DEFAULT 0, error TEXT, result TEXT, "
+            "created_at REAL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority, seq)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_image ON jobs (image_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("seq")
+        job["priority"] = PRIORITY_NAMES[job["priority"]]
+        job["payload"] = json.loads(job["payload"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(
+        self, image_id: str, payload: Dict[str, Any], priority: str = "normal"
+    ) -> Dict[str, Any]:
+        """
+        Queue a job for an image, or return the image's job that is already
+        queued or running with the same payload, so a retried request doesn't
+        detect twice. JobConflictError if that job has another payload.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE image_id = ? AND state IN (?, ?) "
+                "ORDER BY seq LIMIT 1",
+                (image_id, *ACTIVE_STATES),
+            ).fetchone()
+            if row is not None:
+                job = self._to_dict(row)
+                # Compared as stored: JSON turns tuples into lists
+                if job["payload"] != json.loads(json.dumps(payload)):
+                    raise JobConflictError(job)
+                return job
+            job_id = uuid.uuid4().hex
+            self._conn.execute(
+                "INSERT INTO jobs (id, image_id, priority, payload, state, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (
+                    job_id,
+                    image_id,
+                    PRIORITIES[priority],
+                    json.dumps(payload),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def claim(self, min_priority: str = "low") -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest queued job of the highest priority that has attempts
+        left as running
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq FROM jobs WHERE state = 'queued' AND priority >= ? "
+                "AND attempts < ? ORDER BY priority DESC, seq LIMIT 1",
+                (PRIORITIES[min_priority], self.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1, "
+                "started_at = ? WHERE seq = ?",
+                (time.time(), row["seq"]),
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE seq = ?", (row["seq"],)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, "succeeded", result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str, retry: bool = False):
+        """Record a failed attempt; retry puts the job back in the queue"""
+        if retry:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'queued', error = ? WHERE id = ?",
+                    (error, job_id),
+                )
+                self._conn.commit()
+            return
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(
+        self,
+        job_id: str,
+        state: str,
+        error: Optional[str] = None,
+        result: Optional[str] = None,
+    ):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, result = ?, finished_at = ? "
+                "WHERE id = ?",
+                (state, error, result, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row)
+
+    def requeue_running(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Put back jobs a stopped process was running and fail those that used
+        up their attempts; returns how many were requeued and the failed jobs
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'queued' "
+                "WHERE state = 'running' AND attempts < ?",
+                (self.max_attempts,),
+            )
+            requeued = cursor.rowcount
+            seqs = [
+                row["seq"]
+                for row in self._conn.execute(
+                    "SELECT seq FROM jobs WHERE state = 'running'"
+                ).fetchall()
+            ]
+            self._conn.execute(
+                "UPDATE jobs SET state = 'failed', error = ?, finished_at = ? "
+                "WHERE state = 'running'",
+                (
+                    f"Process stopped during each of {self.max_attempts} attempts",
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+            rows = [
+                self._conn.execute(
+                    "SELECT * FROM jobs WHERE seq = ?", (seq,)
+                ).fetchone()
+                for seq in seqs
+            ]
+        return requeued, [self._to_dict(row) for row in rows]
+
+    def prune(self, older_than: float) -> int:
+        """Delete jobs that finished before the given timestamp"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE state NOT IN (?, ?) AND finished_at < ?",
+                (*ACTIVE_STATES, older_than),
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, priority, COUNT(*) FROM jobs GROUP BY state, priority"
+            ).fetchall()
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE state = 'queued'"
+            ).fetchone()[0]
+        states: Dict[str, Dict[str, int]] = {}
+        for state, priority, count in rows:
+            states.setdefault(state, {})[PRIORITY_NAMES[priority]] = count
+        return {
+            "states": states,
+            "oldest_queued_seconds": (
+                round(time.time() - oldest, 2) if oldest is not None else None
+            ),
+        }
+
+
+# Global queue instance
+job_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Get the global job queue with lazy initialization"""
+    global job_queue
+    with _queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(JOB_QUEUE_PATH)
+    return job_queue
@@ -1,7 +1,9 @@
 import os
+import re
 import sys
 import json
 import uuid
+import threading
 import numpy as np
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -9,7 +11,23 @@ from datetime import datetime
 from core.config import (
     MILVUS_CLOUD_ENDPOINT,
     MILVUS_CLOUD_TOKEN,
+    MILVUS_FLUSH_POLICY,
+    MILVUS_FLUSH_INTERVAL_ROWS,
+    MILVUS_COMPACT_INTERVAL_ROWS,
+    MILVUS_INDEX_TYPE,
+    MILVUS_INDEX_PARAMS,
+    MILVUS_SEARCH_PARAMS,
+    EMBEDDING_STORAGE_MODE,
+    EMBEDDING_RERANK_FACTOR,
+    VECTOR_CACHE_ENABLED,
 )
+from integrates.embedding_store import (
+    embedding_store_path,
+    get_embedding_store,
+    rerank_exact,
+)
+from integrates.quantization import STORAGE_MODES, encode
+from integrates.vector_cache import get_vector_cache
 
 try:
     from pymilvus import (
@@ -26,35 +44,300 @@ except ImportError as e:
     MILVUS_AVAILABLE = False
     print(f"Import warning: {e}")
 
+# Reads and writes go through this name; it is an alias of the serving
+# version <name>_v1, <name>_v2, ... so a migration can switch it atomically
 MILVUS_CLOUD_COLLECTION_NAME = "face_recognition"
 EMBEDDING_DIM = 512  # InsightFace embedding dimension
+# Scalar metadata stored next to each embedding, playground_id is the
+# partition key so tenant-scoped searches only scan that tenant's partition
+METADATA_FIELDS = ["image_id", "user_id", "playground_id", "person_id"]
+SCALAR_INDEX_FIELDS = ["image_id", "user_id", "person_id"]
+METADATA_MAX_LENGTH = 64
+
+# Namespace of the deterministic ids of detected faces
+FACE_ID_NAMESPACE = uuid.UUID("6f1c1f63-3f43-4c55-9a54-0c1f5e0f3b27")
+
+# Default (build params, search params) per index type
+INDEX_PRESETS = {
+    "FLAT": ({}, {}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_PQ": ({"nlist": 1024, "m": 64, "nbits": 8}, {"nprobe": 16}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "DISKANN": ({}, {"search_list": 100}),
+    "BIN_FLAT": ({}, {}),
+    "BIN_IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+}
+
+# Index type actually built for a configured type in each compact storage mode
+COMPACT_INDEX_TYPES = {
+    "int8": {"FLAT": "IVF_SQ8", "IVF_FLAT": "IVF_SQ8"},
+    "binary": {"FLAT": "BIN_FLAT", "BIN_FLAT": "BIN_FLAT"},
+}
+
+
+def _json_params(value) -> Dict[str, Any]:
+    if isinstance(value, str):
+        return json.loads(value) if value.strip() else {}
+    return dict(value or {})
+
+
+def storage_index_type(index_type: str, storage_mode: str) -> str:
+    """int8 stores IVF_SQ8 codes, binary always needs a BIN_* index"""
+    if storage_mode == "binary":
+        return COMPACT_INDEX_TYPES["binary"].get(index_type, "BIN_IVF_FLAT")
+    return COMPACT_INDEX_TYPES.get(storage_mode, {}).get(index_type, index_type)
+
+
+def resolve_index_config(
+    index_type: Optional[str] = None,
+    index_params: Optional[Any] = None,
+    search_params: Optional[Any] = None,
+    storage_mode: str = "float",
+) -> Dict[str, Any]:
+    """Merge explicit or env index settings over the defaults of the index type"""
+    index_type = storage_index_type(
+        (index_type or MILVUS_INDEX_TYPE).upper(), storage_mode
+    )
+    if index_type not in INDEX_PRESETS:
+        raise ValueError(
+            f"Unsupported index type {index_type}, expected one of {list(INDEX_PRESETS)}"
+        )
+    build_defaults, search_defaults = INDEX_PRESETS[index_type]
+    # Env overrides only apply to the configured default index type
+    env_applies = index_type == MILVUS_INDEX_TYPE
+    return {
+        "index_type": index_type,
+        "build": {
+            **build_defaults,
+            **_json_params(MILVUS_INDEX_PARAMS if env_applies else None),
+            **_json_params(index_params),
+        },
+        "search": {
+            **search_defaults,
+            **_json_params(MILVUS_SEARCH_PARAMS if env_applies else None),
+            **_json_params(search_params),
+        },
+    }
 
 
 class MilvusClient:
-    def __init__(self):
-        self.collection_name = MILVUS_CLOUD_COLLECTION_NAME
+    def __init__(
+        self,
+        collection_name: str = MILVUS_CLOUD_COLLECTION_NAME,
+        index_type: Optional[str] = None,
+        index_params: Optional[Dict[str, Any]] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        uri: Optional[str] = None,
+        token: Optional[str] = None,
+        storage_mode: Optional[str] = None,
+        local_stores: bool = True,
+        alias: bool = True,
+    ):
+        self.storage_mode = storage_mode or EMBEDDING_STORAGE_MODE
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(
+                f"Unsupported storage mode {self.storage_mode}, expected one of {STORAGE_MODES}"
+            )
+        # Binary codes need their own schema, so they live in their own
+        # collection; a plain (alias=False) name, e.g. a version, is used as is
+        self.collection_name = (
+            f"{collection_name}_binary"
+            if self.storage_mode == "binary" and alias
+            else collection_name
+        )
+        # Float collection of the same name, served before switching to binary
+        self.float_collection_name = (
+            collection_name if self.storage_mode == "binary" and alias else None
+        )
+        # Binary collection empty while the float one has faces
+        self.empty_after_mode_switch = False
+        self.metric_type = "HAMMING" if self.storage_mode == "binary" else "COSINE"
+        self.index_config = resolve_index_config(
+            index_type, index_params, search_params, self.storage_mode
+        )
+        # alias=True serves collection_name as an alias of a versioned
+        # collection (created as <name>_v1); False uses a plain collection
+        self.alias = alias
+        # Collection the name currently resolves to, set once ready
+        self.physical_name: Optional[str] = None
+        # Full-precision vectors for re-ranking binary first-pass results,
+        # one store per collection version; int8 re-ranks with the float
+        # vectors Milvus keeps (only its index is SQ8)
+        self.embedding_store = (
+            get_embedding_store(embedding_store_path(self.collection_name))
+            if self.storage_mode == "binary"
+            else None
+        )
+        # Defaults to Milvus Cloud, a local path uses Milvus Lite
+        self.uri = uri
+        self.token = token
         self.collection = None
         self.connected = False
+        # False for collections created before the metadata fields existed
+        self.has_metadata = False
+        # Concurrent first requests must not race into connect()/load()
+        self._ready_lock = threading.Lock()
+
+        # Rows inserted since the last flush / compaction request
+        self._insert_lock = threading.Lock()
+        self._rows_since_flush = 0
+        self._rows_since_compact = 0
 
         if not MILVUS_AVAILABLE:
             raise ImportError("pymilvus not available - check installation")
 
+        # local_stores=False keeps a secondary collection (e.g. one being
+        # filled by a re-embed job) out of the shared vector cache
+        self.vector_cache = (
+            get_vector_cache(EMBEDDING_DIM)
+            if VECTOR_CACHE_ENABLED and local_stores
+            else None
+        )
+
     def _ensure_collection(self):
         """Ensure collection exists and is loaded"""
         if not utility.has_collection(self.collection_name):
-            self._create_collection()
+            if self.alias:
+                # New deployments start versioned, behind the alias
+                self._create_collection(self.version_name(1))
+                utility.create_alias(self.version_name(1), self.collection_name)
+                self.collection = Collection(self.collection_name)
+            else:
+                self._create_collection()
         else:
             self.collection = Collection(self.collection_name)
             self.collection.load()
+        self._bind_version()
+        self._check_mode_switch()
+
+    def _check_mode_switch(self):
+        """
+        Switching EMBEDDING_STORAGE_MODE to binary serves <name>_binary, which
+        starts empty: faces stored in the float collection aren't searched
+        until they are migrated or re-detected.
+        """
+        if self.float_collection_name is None or self.collection.num_entities:
+            return
+        if not utility.has_collection(self.float_collection_name):
+            return
+        float_faces = Collection(self.float_collection_name).num_entities
+        self.empty_after_mode_switch = float_faces > 0
+        if self.empty_after_mode_switch:
+            print(
+                f"Warning: {self.collection_name} is empty while "
+                f"{self.float_collection_name} holds {float_faces} faces; searches "
+                "won't find them until they are re-detected in binary mode"
+            )
+
+    def _bind_version(self):
+        """Schema, index and store settings of the version the name resolves to"""
+        self.physical_name = self.collection.describe()["collection_name"]
+        self._check_metadata()
+        for index in self.collection.indexes:
+            index_type = index.params.get("index_type")
+            # Search with the params of the index this version was built with
+            if index.field_name == "embedding" and index_type:
+                if index_type != self.index_config["index_type"]:
+                    self.index_config = resolve_index_config(
+                        index_type, storage_mode=self.storage_mode
+                    )
+        if self.storage_mode == "binary":
+            self.embedding_store = get_embedding_store(
+                embedding_store_path(self.physical_name)
+            )
+            if self.vector_cache is not None:
+                self.vector_cache.embedding_store = self.embedding_store
+
+    def version_name(self, version: int) -> str:
+        return f"{self.collection_name}_v{version}"
+
+    @staticmethod
+    def version_of(physical_name: Optional[str]) -> int:
+        """Version number of a <name>_vN collection, 0 when unversioned"""
+        match = re.search(r"_v(\d+)$", physical_name or "")
+        return int(match.group(1)) if match else 0
+
+    def adopt_legacy(self):
+        """
+        Put a collection created before versioning behind the alias as _v1.
+        Renaming and aliasing are metadata operations, requests in between
+        fail fast and are retried by the usual collection-not-found path.
+        """
+        self._ensure_ready()
+        if not self.alias or self.physical_name != self.collection_name:
+            return
+        with self._ready_lock:
+            legacy = self.version_name(1)
+            utility.rename_collection(self.collection_name, legacy)
+            Collection(legacy).load()
+            utility.create_alias(legacy, self.collection_name)
+            self.collection = Collection(self.collection_name)
+            self._bind_version()
+
+    def next_version(self) -> str:
+        """Name of the first unused version after the serving one"""
+        self._ensure_ready()
+        version = max(self.version_of(self.physical_name), 1) + 1
+        while utility.has_collection(self.version_name(version)):
+            version += 1
+        return self.version_name(version)
+
+    def switch_version(
+        self, physical_name: str, index_config: Optional[Dict[str, Any]] = None
+    ):
+        """Atomically point the alias at another version and serve from it"""
+        self._ensure_ready()
+        utility.alter_alias(physical_name, self.collection_name)
+        with self._ready_lock:
+            if index_config is not None:
+                self.index_config = index_config
+            self.collection = Collection(self.collection_name)
+            self._bind_version()
+        if self.vector_cache is not None:
+            # Cached playgrounds hold the previous version's vectors
+            self.vector_cache.invalidate(self.embedding_store)
 
-    def _create_collection(self):
+    def _check_metadata(self):
+        field_names = {field.name for field in self.collection.schema.fields}
+        self.has_metadata = all(name in field_names for name in METADATA_FIELDS)
+        if not self.has_metadata:
+            print(
+                f"Collection {self.collection_name} has no metadata fields, "
+                "filtered searches are unavailable until it is recreated"
+            )
+
+    def _create_collection(self, name: Optional[str] = None):
         """Create new collection with schema and index"""
         fields = [
             FieldSchema(
                 name="id", dtype=DataType.VARCHAR, max_length=100, is_primary=True
             ),
             FieldSchema(
-                name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM
+                name="embedding",
+                dtype=(
+                    DataType.BINARY_VECTOR
+                    if self.storage_mode == "binary"
+                    else DataType.FLOAT_VECTOR
+                ),
+                dim=EMBEDDING_DIM,
+            ),
+            FieldSchema(
+                name="image_id", dtype=DataType.VARCHAR, max_length=METADATA_MAX_LENGTH
+            ),
+            FieldSchema(
+                name="user_id", dtype=DataType.VARCHAR, max_length=METADATA_MAX_LENGTH
+            ),
+            FieldSchema(
+                name="playground_id",
+                dtype=DataType.VARCHAR,
+                max_length=METADATA_MAX_LENGTH,
+                is_partition_key=True,
+            ),
+            FieldSchema(
+                name="person_id",
+                dtype=DataType.VARCHAR,
+                max_length=METADATA_MAX_LENGTH,
             ),
         ]
 
@@ -63,39 +346,77 @@ class MilvusClient:
         )
 
         # Create collection
-        self.collection = Collection(name=self.collection_name, schema=schema)
+        self.collection = Collection(name=name or self.collection_name, schema=schema)
 
         # Create index for vector search
         index_params = {
-            "metric_type": "COSINE",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 1024},
+            "metric_type": self.metric_type,
+            "index_type": self.index_config["index_type"],
+            "params": self.index_config["build"],
         }
 
         self.collection.create_index(field_name="embedding", index_params=index_params)
 
+        # Scalar indexes keep filter expressions cheap
+        for field_name in SCALAR_INDEX_FIELDS:
+            self.collection.create_index(
+                field_name=field_name, index_params={"index_type": "INVERTED"}
+            )
+
         self.collection.load()
+        self.has_metadata = True
 
     def _connect(self):
         """Connect to Milvus cloud"""
-        connections.connect(
-            uri=MILVUS_CLOUD_ENDPOINT,
-            token=MILVUS_CLOUD_TOKEN,
-            secure=True,
-        )
+        if self.uri:
+            connections.connect(uri=self.uri, token=self.token or "")
+        else:
+            connections.connect(
+                uri=MILVUS_CLOUD_ENDPOINT,
+                token=MILVUS_CLOUD_TOKEN,
+                secure=True,
+            )
         self.connected = True
 
+    def _search_params(self, limit: int) -> Dict[str, Any]:
+        params = dict(self.index_config["search"])
+        # Graph indexes need a candidate list at least as long as the result
+        if "ef" in params:
+            params["ef"] = max(params["ef"], limit)
+        if "search_list" in params:
+            params["search_list"] = max(params["search_list"], limit)
+        return {"metric_type": self.metric_type, "params": params}
+
     def _ensure_ready(self):
         """Ensure client is connected and collection is ready"""
-        if not self.connected:
-            self._connect()
+        if self.connected and self.collection:
+            return
+        with self._ready_lock:
+            if not self.connected:
+                self._connect()
+
+            if not self.collection:
+                self._ensure_collection()
 
-        if not self.collection:
-            self._ensure_collection()
+    def _reset_collection(self):
+        with self._ready_lock:
+            self.collection = None
 
     def force_create_collection(self):
-        """Force create collection even if it exists"""
+        """
+        Start over with an empty collection. Behind an alias this creates a
+        new version and switches to it, older versions are kept (drop them
+        with drop_version); a plain collection is dropped and recreated.
+        """
         try:
+            if self.alias:
+                self.adopt_legacy()
+                version = self.next_version()
+                self._create_collection(version)
+                self.switch_version(version)
+                print(f"Collection {self.collection_name} now serves {version}")
+                return
+
             # Drop existing collection if it exists
             if utility.has_collection(self.collection_name):
                 utility.drop_collection(self.collection_name)
@@ -106,41 +427,76 @@ class MilvusClient:
             print(f"Error force creating collection: {e}")
             raise e
 
-    def save_face_embedding(self, embedding: List[float]) -> str:
+    def drop_version(self, physical_name: str):
+        """Drop a version that is no longer served, e.g. after a migration"""
+        self._ensure_ready()
+        if physical_name == self.physical_name:
+            raise ValueError(f"{physical_name} is the serving version")
+        utility.drop_collection(physical_name)
+
+    def save_face_embedding(
+        self,
+        embedding: List[float],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        person_id: Optional[str] = None,
+    ) -> str:
         """Save face embedding to Milvus"""
-        try:
-            self._ensure_ready()
+        return self.save_face_embeddings(
+            [embedding],
+            playground_id,
+            image_id=image_id,
+            user_id=user_id,
+            person_ids=[person_id] if person_id else None,
+        )[0]
 
-            # Generate unique ID for this face
-            face_id = str(uuid.uuid4())
+    def save_face_embeddings(
+        self,
+        embeddings: List[List[float]],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        person_ids: Optional[List[str]] = None,
+        face_ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Save many face embeddings in a single write, without a blocking flush.
+        Given face_ids (e.g. face_ids_for_image) are upserted, so writing the
+        same faces again replaces them instead of adding duplicates.
+        """
+        if not embeddings:
+            return []
 
-            # Prepare data for insertion
-            entities = [
-                [face_id],  # id
-                [embedding],  # embedding
-            ]
+        replace = face_ids is not None
+        # Generate unique IDs for these faces
+        face_ids = face_ids or [str(uuid.uuid4()) for _ in embeddings]
+
+        def build_rows():
+            return self.build_rows(
+                face_ids, embeddings, playground_id, image_id, user_id, person_ids
+            )
 
-            # Insert data
-            self.collection.insert(entities)
-            self.collection.flush()
+        def write(rows):
+            if replace:
+                self.collection.upsert(rows)
+            else:
+                self.collection.insert(rows)
 
-            return face_id
+        try:
+            self._ensure_ready()
+            write(build_rows())
 
         except Exception as e:
             # If collection not found error, try to recreate
             if "collection not found" in str(e).lower():
                 print(f"Collection not found, attempting to create: {e}")
                 try:
-                    self.collection = None  # Reset collection
-                    self._ensure_collection()  # Recreate collection
+                    self._reset_collection()  # Reset collection
+                    self._ensure_ready()  # Recreate collection
 
                     # Retry insertion
-                    face_id = str(uuid.uuid4())
-                    entities = [[face_id], [embedding]]
-                    self.collection.insert(entities)
-                    self.collection.flush()
-
-                    return face_id
+                    write(build_rows())
                 except Exception as retry_error:
                     print(f"Retry failed: {retry_error}")
                     raise retry_error
@@ -148,70 +504,543 @@ class MilvusClient:
                 print(f"Save embedding error: {e}")
                 raise e
 
-    def search_similar_faces(
-        self, embedding: List[float], limit: int = 5
+        self.after_write(face_ids, embeddings, playground_id, replace)
+        return face_ids
+
+    def build_rows(
+        self,
+        face_ids: List[str],
+        embeddings: List[List[float]],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        person_ids: Optional[List[str]] = None,
     ) -> List[Dict[str, Any]]:
-        """Search for similar face embeddings"""
+        """Insert rows in the collection's schema (metadata, binary packing)"""
+        person_ids = person_ids or ["unknown"] * len(embeddings)
+        if self.storage_mode == "binary":
+            # Milvus takes each binary vector as packed bytes
+            stored = [code.tobytes() for code in encode(embeddings, "binary")]
+        else:
+            stored = embeddings
+
+        rows = []
+        for face_id, embedding, person_id in zip(face_ids, stored, person_ids):
+            row = {"id": face_id, "embedding": embedding}
+            if self.has_metadata:
+                row.update(
+                    image_id=image_id or "",
+                    user_id=user_id or "",
+                    playground_id=playground_id or "",
+                    person_id=person_id or "unknown",
+                )
+            rows.append(row)
+        return rows
+
+    def after_write(
+        self,
+        face_ids: List[str],
+        embeddings: List[List[float]],
+        playground_id: Optional[str] = None,
+        replace: bool = False,
+    ):
+        """Flush policy, re-rank store and local cache bookkeeping after a write"""
+        self._after_insert(len(face_ids))
+        if self.embedding_store is not None:
+            self.embedding_store.put_many(face_ids, embeddings)
+        if self.vector_cache is not None:
+            # Keep a warmed playground index in step with Milvus
+            self.vector_cache.add(playground_id, face_ids, embeddings, replace)
+
+    def delete_faces(
+        self,
+        face_ids: List[str],
+        playground_id: Optional[str] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        """Delete faces by id, also from the playground's warmed cache"""
+        if not face_ids:
+            return 0
+        self._ensure_ready()
+        for start in range(0, len(face_ids), chunk_size):
+            chunk = face_ids[start : start + chunk_size]
+            self.collection.delete(expr=f"id in {json.dumps(chunk)}")
+        if self.vector_cache is not None:
+            self.vector_cache.remove(playground_id, face_ids)
+        return len(face_ids)
+
+    def _after_insert(self, rows: int):
+        """Apply the configured flush/compaction policy after an insert"""
+        with self._insert_lock:
+            self._rows_since_flush += rows
+            self._rows_since_compact += rows
+
+            flush = MILVUS_FLUSH_POLICY == "sync" or (
+                MILVUS_FLUSH_POLICY == "async"
+                and self._rows_since_flush >= MILVUS_FLUSH_INTERVAL_ROWS
+            )
+            compact = (
+                MILVUS_COMPACT_INTERVAL_ROWS > 0
+                and self._rows_since_compact >= MILVUS_COMPACT_INTERVAL_ROWS
+            )
+            if flush:
+                self._rows_since_flush = 0
+            if compact:
+                self._rows_since_compact = 0
+
         try:
-            self._ensure_ready()
+            if flush:
+                # Async flush seals segments without waiting for persistence
+                self.collection.flush(_async=MILVUS_FLUSH_POLICY == "async")
+            if compact:
+                # Compaction runs server-side, this only schedules it
+                self.collection.compact()
+        except Exception as e:
+            print(f"Flush/compaction error: {e}")
 
-            search_params = {"metric_type": "COSINE", "params": {"nprobe": 16}}
+    def fetch_embeddings(
+        self, face_ids: List[str], chunk_size: int = 1000
+    ) -> Dict[str, List[float]]:
+        """Fetch stored embeddings by id, used to warm the local vector cache"""
+        if self.storage_mode == "binary":
+            # Milvus only holds sign bits, the float vectors are in the store
+            vectors = self.embedding_store.get_many(face_ids)
+            if len(vectors) < len(set(face_ids)):
+                print(
+                    f"{len(set(face_ids)) - len(vectors)} of {len(set(face_ids))} "
+                    f"faces have no float vector in this host's embedding store"
+                )
+            return {face_id: vector.tolist() for face_id, vector in vectors.items()}
+        self._ensure_ready()
+        embeddings = {}
+        for start in range(0, len(face_ids), chunk_size):
+            chunk = face_ids[start : start + chunk_size]
+            rows = self.collection.query(
+                expr=f"id in {json.dumps(chunk)}",
+                output_fields=["id", "embedding"],
+            )
+            for row in rows:
+                embeddings[row["id"]] = row["embedding"]
+        return embeddings
 
-            results = self.collection.search(
-                data=[embedding],
-                anns_field="embedding",
-                param=search_params,
-                limit=limit,
-                output_fields=["id"],
+    def fetch_metadata(
+        self, face_ids: List[str], chunk_size: int = 1000
+    ) -> Dict[str, Dict[str, Any]]:
+        """Metadata fields of stored faces by id, empty without metadata fields"""
+        self._ensure_ready()
+        if not self.has_metadata:
+            return {face_id: {} for face_id in face_ids}
+        metadata = {}
+        for start in range(0, len(face_ids), chunk_size):
+            chunk = face_ids[start : start + chunk_size]
+            rows = self.collection.query(
+                expr=f"id in {json.dumps(chunk)}",
+                output_fields=["id", *METADATA_FIELDS],
             )
+            for row in rows:
+                metadata[row["id"]] = {name: row.get(name) for name in METADATA_FIELDS}
+        return metadata
 
-            # Format results
-            similar_faces = []
-            for hit in results[0]:
-                similar_faces.append(
+    def upsert_face_embeddings(
+        self,
+        face_ids: List[str],
+        embeddings: List[List[float]],
+        metadata: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> int:
+        """Write embeddings under existing ids, keeping each face's metadata"""
+        if not face_ids:
+            return 0
+        self._ensure_ready()
+        rows = self.build_rows(face_ids, embeddings)
+        if self.has_metadata and metadata:
+            for row in rows:
+                row.update(
                     {
-                        "id": hit.entity.get("id"),
-                        "distance": hit.distance,
-                        "score": 1.0
-                        - hit.distance,  # Convert distance to similarity score
+                        name: value
+                        for name, value in metadata.get(row["id"], {}).items()
+                        if value is not None
                     }
                 )
+        self.collection.upsert(rows)
+        self._after_insert(len(rows))
+        if self.embedding_store is not None:
+            self.embedding_store.put_many(face_ids, embeddings)
+        return len(rows)
+
+    def update_metadata(
+        self, updates: Dict[str, Dict[str, Any]], chunk_size: int = 1000
+    ) -> int:
+        """
+        Rewrite metadata fields of stored faces, e.g. person_id when a face is
+        tagged. Rows are read and upserted with their stored vectors as is.
+        """
+        self._ensure_ready()
+        if not self.has_metadata or not updates:
+            return 0
+        face_ids = list(updates)
+        written = 0
+        for start in range(0, len(face_ids), chunk_size):
+            chunk = face_ids[start : start + chunk_size]
+            rows = self.collection.query(
+                expr=f"id in {json.dumps(chunk)}",
+                output_fields=["id", "embedding", *METADATA_FIELDS],
+            )
+            for row in rows:
+                embedding = row["embedding"]
+                if self.storage_mode == "binary" and isinstance(embedding, list):
+                    # Binary vectors come back as a list holding the packed bytes
+                    embedding = embedding[0]
+                row["embedding"] = embedding
+                row.update(updates[row["id"]])
+            if rows:
+                self.collection.upsert(rows)
+                written += len(rows)
+        self._after_insert(written)
+        return written
+
+    def iter_rows(self, batch_size: int = 1000):
+        """
+        Yield (ids, float embeddings, id -> metadata) batches of the whole
+        collection, e.g. to copy it into a version with another index.
+        """
+        self._ensure_ready()
+        fields = ["id"] + (METADATA_FIELDS if self.has_metadata else [])
+        if self.storage_mode != "binary":
+            fields.append("embedding")
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size, expr='id != ""', output_fields=fields
+        )
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                if self.storage_mode == "binary":
+                    # Milvus only holds sign bits, the float vectors are in the
+                    # store; a copy without them would silently lose faces
+                    vectors = self.embedding_store.get_many(ids)
+                    if len(vectors) < len(set(ids)):
+                        raise RuntimeError(
+                            f"{len(set(ids)) - len(vectors)} faces of "
+                            f"{self.physical_name} have no float vector in this "
+                            "host's embedding store, copy the store from the host "
+                            "that wrote them"
+                        )
+                    embeddings = [vectors[face_id].tolist() for face_id in ids]
+                else:
+                    embeddings = [list(row["embedding"]) for row in rows]
+                metadata = {
+                    row["id"]: {name: row.get(name) for name in METADATA_FIELDS}
+                    for row in rows
+                    if self.has_metadata
+                }
+                yield ids, embeddings, metadata
+        finally:
+            iterator.close()
+
+    def faces_missing_from(
+        self, other: "MilvusClient", batch_size: int = 1000
+    ) -> Dict[str, str]:
+        """
+        Image id of every face in this collection that has no row in the
+        other one, e.g. faces a re-embed migration had no crop for.
+        """
+        self._ensure_ready()
+        other._ensure_ready()
+        fields = ["id"] + (["image_id"] if self.has_metadata else [])
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size, expr='id != ""', output_fields=fields
+        )
+        missing = {}
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                ids = [row["id"] for row in rows]
+                found = other.collection.query(
+                    expr=f"id in {json.dumps(ids)}", output_fields=["id"]
+                )
+                found = {row["id"] for row in found}
+                for row in rows:
+                    if row["id"] not in found:
+                        missing[row["id"]] = row.get("image_id") or ""
+        finally:
+            iterator.close()
+        return missing
+
+    def fetch_playground_embeddings(
+        self, playground_id: str, batch_size: int = 1000
+    ) -> Dict[str, List[float]]:
+        """Fetch every embedding of one playground partition"""
+        self._ensure_ready()
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size,
+            expr=build_filter_expr(playground_id=playground_id),
+            output_fields=(
+                ["id"] if self.storage_mode == "binary" else ["id", "embedding"]
+            ),
+        )
+        embeddings = {}
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                for row in rows:
+                    embeddings[row["id"]] = row.get("embedding")
+        finally:
+            iterator.close()
+        if self.storage_mode == "binary":
+            return self.fetch_embeddings(list(embeddings))
+        return embeddings
+
+    def search_similar_faces(
+        self,
+        embedding: List[float],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Search for similar face embeddings"""
+        return self.search_similar_faces_batch(
+            [embedding], limit, playground_id, filter
+        )[0]
+
+    def search_similar_faces_batch(
+        self,
+        embeddings: List[List[float]],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search all query vectors in one call, results aligned to the inputs.
+        `filter` is a Milvus boolean expression over the metadata fields,
+        e.g. 'person_id != "unknown"' (person_id is kept in step by /tag-face);
+        playground_id restricts the search to that partition.
+        """
+        if not embeddings:
+            return []
+
+        # The local cache can't evaluate filter expressions
+        if self.vector_cache is not None and playground_id and not filter:
+            # Warmed playgrounds are answered in-process, misses go to Milvus
+            local = self.vector_cache.search(playground_id, embeddings, limit)
+            if local is not None:
+                return local
 
-            return similar_faces
+        try:
+            self._ensure_ready()
+
+            request = self.search_request(embeddings, limit)
+            results = self.collection.search(
+                data=request["data"],
+                anns_field="embedding",
+                param=request["param"],
+                limit=request["limit"],
+                expr=self.search_expr(playground_id, filter),
+                output_fields=request["output_fields"],
+            )
+
+            return self.format_results(
+                embeddings,
+                [
+                    [(hit.entity.get("id"), hit.distance) for hit in hits]
+                    for hits in results
+                ],
+                limit,
+                {
+                    hit.entity.get("id"): hit.entity.get("embedding")
+                    for hits in results
+                    for hit in hits
+                    if "embedding" in request["output_fields"]
+                },
+            )
 
         except Exception as e:
             # If collection not found error, try to recreate
             if "collection not found" in str(e).lower():
                 print(f"Collection not found during search, attempting to create: {e}")
-                self.collection = None  # Reset collection
-                self._ensure_collection()  # Recreate collection
-                return []  # Return empty results for newly created collection
+                self._reset_collection()  # Reset collection
+                self._ensure_ready()  # Recreate collection
+                # Return empty results for newly created collection
+                return [[] for _ in embeddings]
             else:
                 print(f"Search error: {e}")
                 raise e
 
+    def search_expr(
+        self, playground_id: Optional[str] = None, filter: Optional[str] = None
+    ) -> Optional[str]:
+        if self.has_metadata:
+            return build_filter_expr(playground_id=playground_id, filter=filter)
+        if filter:
+            raise ValueError(
+                f"Collection {self.collection_name} has no metadata fields to filter on"
+            )
+        # Legacy collection: playground scoping is only possible locally
+        return None
+
+    def search_request(
+        self, embeddings: List[List[float]], limit: int
+    ) -> Dict[str, Any]:
+        """
+        Query data, params, limit and output fields; compact modes over-fetch
+        for re-ranking, int8 with the stored float vectors of the candidates
+        """
+        if self.storage_mode == "float":
+            return {
+                "data": embeddings,
+                "param": self._search_params(limit),
+                "limit": limit,
+                "output_fields": ["id"],
+            }
+        candidates = limit * EMBEDDING_RERANK_FACTOR
+        return {
+            "output_fields": (
+                ["id"] if self.storage_mode == "binary" else ["id", "embedding"]
+            ),
+            "data": (
+                [code.tobytes() for code in encode(embeddings, "binary")]
+                if self.storage_mode == "binary"
+                else embeddings
+            ),
+            "param": self._search_params(candidates),
+            "limit": candidates,
+        }
+
+    def format_results(
+        self,
+        embeddings: List[List[float]],
+        hits: List[List[tuple]],
+        limit: int,
+        vectors: Optional[Dict[str, List[float]]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Turn (id, distance) hits per query into result dicts, re-ranking
+        compact first-pass candidates against full-precision vectors: the
+        returned ones in int8 mode, the embedding store's in binary mode.
+        """
+        if self.storage_mode == "float":
+            # Format results, one list of hits per query vector
+            return [
+                [
+                    {
+                        "id": face_id,
+                        "distance": distance,
+                        "score": 1.0 - distance,  # Convert distance to similarity score
+                    }
+                    for face_id, distance in query_hits
+                ]
+                for query_hits in hits
+            ]
+
+        binary = self.storage_mode == "binary"
+        similar_faces = []
+        for embedding, query_hits in zip(embeddings, hits):
+            approximate = [
+                (
+                    face_id,
+                    # Sign-bit Hamming distance estimates the angle between vectors
+                    (
+                        float(np.cos(np.pi * distance / EMBEDDING_DIM))
+                        if binary
+                        else distance
+                    ),
+                )
+                for face_id, distance in query_hits
+            ]
+            reranked = (
+                self.embedding_store.rerank(embedding, approximate, limit)
+                if binary
+                else rerank_exact(embedding, approximate, vectors or {}, limit)
+            )
+            similar_faces.append(
+                [
+                    {"id": face_id, "distance": similarity, "score": 1.0 - similarity}
+                    for face_id, similarity in reranked
+                ]
+            )
+        return similar_faces
+
+
+def build_filter_expr(
+    filter: Optional[str] = None, **equals: Optional[str]
+) -> Optional[str]:
+    """AND together exact-match conditions on metadata fields and a raw expression"""
+    clauses = [
+        f"{field} == {json.dumps(value)}"
+        for field, value in equals.items()
+        if value is not None
+    ]
+    if filter:
+        clauses.append(f"({filter})")
+    return " and ".join(clauses) or None
+
 
 # Global client instance
 milvus_client = None
+_client_lock = threading.Lock()
+
+
+def face_ids_for_image(image_id: str, count: int) -> List[str]:
+    """
+    Deterministic milvus ids of an image's detected faces, by detection
+    order: re-detecting the image upserts the same rows instead of adding
+    duplicate vectors. The order can change between runs, so tags follow
+    the bbox (see save_detection_results), not the id.
+    """
+    return [
+        str(uuid.uuid5(FACE_ID_NAMESPACE, f"{image_id}/{index}"))
+        for index in range(count)
+    ]
 
 
 def get_face_milvus_client():
     """Get the global Milvus client instance with lazy initialization"""
     global milvus_client
     if milvus_client is None:
-        milvus_client = MilvusClient()
+        with _client_lock:
+            if milvus_client is None:
+                milvus_client = MilvusClient()
     return milvus_client
 
 
-def save_face_to_milvus(embedding: List[float]) -> str:
+def save_face_to_milvus(
+    embedding: List[float], playground_id: Optional[str] = None, **metadata
+) -> str:
     """Convenience function to save face embedding"""
     client = get_face_milvus_client()
-    return client.save_face_embedding(embedding)
+    return client.save_face_embedding(embedding, playground_id, **metadata)
+
+
+def save_faces_to_milvus(
+    embeddings: List[List[float]], playground_id: Optional[str] = None, **metadata
+) -> List[str]:
+    """Convenience function to save many face embeddings in one insert"""
+    client = get_face_milvus_client()
+    return client.save_face_embeddings(embeddings, playground_id, **metadata)
 
 
 def search_similar_faces_in_milvus(
-    embedding: List[float], limit: int = 5
+    embedding: List[float],
+    limit: int = 5,
+    playground_id: Optional[str] = None,
+    filter: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Convenience function to search for similar faces"""
     client = get_face_milvus_client()
-    return client.search_similar_faces(embedding, limit)
+    return client.search_similar_faces(embedding, limit, playground_id, filter)
+
+
+def search_similar_faces_batch_in_milvus(
+    embeddings: List[List[float]],
+    limit: int = 5,
+    playground_id: Optional[str] = None,
+    filter: Optional[str] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Convenience function to search many query vectors in one call"""
+    client = get_face_milvus_client()
+    return client.search_similar_faces_batch(embeddings, limit, playground_id, filter)
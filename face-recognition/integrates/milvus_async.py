@@ -0,0 +1,274 @@
+"""
+Asyncio-native Milvus access for the API routes.
+
+Inserts and searches go through a small pool of pymilvus AsyncMilvusClient
+connections with a timeout on every call. Schema creation and the collection
+load still run once through the ORM client in integrates/milvus.py, guarded
+by an asyncio lock and normally triggered at startup, so no user request pays
+for them.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from core.config import (
+    MILVUS_ASYNC_POOL_SIZE,
+    MILVUS_CLOUD_ENDPOINT,
+    MILVUS_CLOUD_TOKEN,
+    MILVUS_LOAD_TIMEOUT_SECONDS,
+    MILVUS_TIMEOUT_SECONDS,
+)
+from integrates.milvus import MilvusClient, get_face_milvus_client
+
+try:
+    from pymilvus import AsyncMilvusClient
+except ImportError as e:
+    AsyncMilvusClient = None
+    print(f"Import warning: {e}")
+
+
+class AsyncMilvusPool:
+    def __init__(
+        self,
+        sync_client: MilvusClient,
+        pool_size: int = MILVUS_ASYNC_POOL_SIZE,
+        timeout: float = MILVUS_TIMEOUT_SECONDS,
+        load_timeout: float = MILVUS_LOAD_TIMEOUT_SECONDS,
+    ):
+        if AsyncMilvusClient is None:
+            raise ImportError("pymilvus AsyncMilvusClient not available")
+        self.sync = sync_client
+        self.pool_size = max(pool_size, 1)
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+
+        self._clients: List[AsyncMilvusClient] = []
+        self._round_robin = None
+        self._ready = False
+        self._ready_lock: Optional[asyncio.Lock] = None
+        self.ready_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def collection_name(self) -> str:
+        return self.sync.collection_name
+
+    async def ensure_ready(self):
+        """Connect, create/load the collection and open the pool exactly once"""
+        if self._ready:
+            return
+        if self._ready_lock is None:
+            self._ready_lock = asyncio.Lock()
+        async with self._ready_lock:
+            if self._ready:
+                return
+            try:
+                await asyncio.wait_for(
+                    asyncio.to_thread(self.sync._ensure_ready), self.load_timeout
+                )
+                uri = self.sync.uri or MILVUS_CLOUD_ENDPOINT
+                token = (self.sync.token if self.sync.uri else MILVUS_CLOUD_TOKEN) or ""
+                # Recreating a dropped collection: the old pool's channels
+                # would otherwise stay open
+                await self._close_clients()
+                self._clients = [
+                    AsyncMilvusClient(uri=uri, token=token, timeout=self.timeout)
+                    for _ in range(self.pool_size)
+                ]
+                self._round_robin = itertools.cycle(self._clients)
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                raise
+            self._ready = True
+            self.ready_at = time.time()
+            self.last_error = None
+
+    async def _call(self, method: str, *args, **kwargs):
+        await self.ensure_ready()
+        client = next(self._round_robin)
+        try:
+            return await asyncio.wait_for(
+                getattr(client, method)(*args, timeout=self.timeout, **kwargs),
+                self.timeout,
+            )
+        except Exception as e:
+            if "collection not found" in str(e).lower():
+                # Let the next call recreate the collection
+                self.sync._reset_collection()
+                self._ready = False
+            raise
+
+    async def save_face_embeddings(
+        self,
+        embeddings: List[List[float]],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        person_ids: Optional[List[str]] = None,
+        face_ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Write all faces of an image in one call, without a blocking flush;
+        given face_ids are upserted, so a repeated write replaces its rows
+        """
+        if not embeddings:
+            return []
+        await self.ensure_ready()
+
+        replace = face_ids is not None
+        face_ids = face_ids or [str(uuid.uuid4()) for _ in embeddings]
+        rows = self.sync.build_rows(
+            face_ids, embeddings, playground_id, image_id, user_id, person_ids
+        )
+        await self._call("upsert" if replace else "insert", self.collection_name, rows)
+        await asyncio.to_thread(
+            self.sync.after_write, face_ids, embeddings, playground_id, replace
+        )
+        return face_ids
+
+    async def search_similar_faces_batch(
+        self,
+        embeddings: List[List[float]],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """Search all query vectors in one call, results aligned to the inputs"""
+        if not embeddings:
+            return []
+
+        vector_cache = self.sync.vector_cache
+        if vector_cache is not None and playground_id and not filter:
+            # Warmed playgrounds are answered in-process, misses go to Milvus
+            local = await asyncio.to_thread(
+                vector_cache.search, playground_id, embeddings, limit
+            )
+            if local is not None:
+                return local
+
+        await self.ensure_ready()
+        request = self.sync.search_request(embeddings, limit)
+        results = await self._call(
+            "search",
+            self.collection_name,
+            data=request["data"],
+            filter=self.sync.search_expr(playground_id, filter) or "",
+            limit=request["limit"],
+            output_fields=request["output_fields"],
+            search_params=request["param"],
+            anns_field="embedding",
+        )
+        hits = [[(hit["id"], hit["distance"]) for hit in query] for query in results]
+        if self.sync.embedding_store is None:
+            # int8 candidates come back with their float vectors
+            vectors = {
+                hit["id"]: hit["entity"]["embedding"]
+                for query in results
+                for hit in query
+                if "embedding" in hit.get("entity", {})
+            }
+            return self.sync.format_results(embeddings, hits, limit, vectors)
+        # Re-ranking reads the SQLite store, keep it off the event loop
+        return await asyncio.to_thread(
+            self.sync.format_results, embeddings, hits, limit
+        )
+
+    async def search_similar_faces(
+        self,
+        embedding: List[float],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return (
+            await self.search_similar_faces_batch(
+                [embedding], limit, playground_id, filter
+            )
+        )[0]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "loading": self._ready_lock is not None and self._ready_lock.locked(),
+            "collection": self.collection_name,
+            "storage_mode": self.sync.storage_mode,
+            "index_type": self.sync.index_config["index_type"],
+            "has_metadata": self.sync.has_metadata,
+            "empty_after_mode_switch": self.sync.empty_after_mode_switch,
+            "rerank_unverified": (
+                self.sync.embedding_store.unverified
+                if self.sync.embedding_store is not None
+                else None
+            ),
+            "pool_size": self.pool_size,
+            "timeout_seconds": self.timeout,
+            "ready_at": self.ready_at,
+            "error": self.last_error,
+        }
+
+    async def close(self):
+        self._ready = False
+        await self._close_clients()
+
+    async def _close_clients(self):
+        clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Milvus close error: {e}")
+
+
+# Global pool instance
+async_milvus_pool: Optional[AsyncMilvusPool] = None
+_pool_lock = threading.Lock()
+_retry_task: Optional[asyncio.Task] = None
+
+
+def get_async_milvus_client() -> AsyncMilvusPool:
+    """Get the global async Milvus pool with lazy initialization"""
+    global async_milvus_pool
+    if async_milvus_pool is None:
+        with _pool_lock:
+            if async_milvus_pool is None:
+                async_milvus_pool = AsyncMilvusPool(get_face_milvus_client())
+    return async_milvus_pool
+
+
+async def _retry_milvus(delay: float = 1.0, max_delay: float = 60.0):
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await get_async_milvus_client().ensure_ready()
+            return
+        except Exception as e:
+            print(f"Milvus warm-up retry failed: {e}")
+            delay = min(delay * 2, max_delay)
+
+
+async def start_milvus():
+    """
+    Pay the connect/load cost at startup. On failure keep retrying in the
+    background: the readiness probe only reports, and a pod reported not
+    ready gets no request that would trigger the load.
+    """
+    global _retry_task
+    try:
+        await get_async_milvus_client().ensure_ready()
+    except Exception as e:
+        print(f"Milvus warm-up failed: {e}")
+        _retry_task = asyncio.create_task(_retry_milvus())
+
+
+async def close_async_milvus_client():
+    global async_milvus_pool, _retry_task
+    if _retry_task is not None:
+        _retry_task.cancel()
+        _retry_task = None
+    pool, async_milvus_pool = async_milvus_pool, None
+    if pool is not None:
+        await pool.close()
@@ -0,0 +1,154 @@
+"""
+Pool of prepared and warmed InsightFace model sessions.
+
+Each slot owns its own ONNX Runtime sessions with tuned intra/inter-op
+thread counts (and optional core pinning) so parallel batches don't queue
+behind one session or oversubscribe the CPU.
+"""
+
+import glob
+import os
+import os.path as osp
+from typing import Dict, List, Optional
+
+import numpy as np
+import onnxruntime
+from insightface.model_zoo.model_zoo import ModelRouter
+from insightface.utils.storage import ensure_available
+
+
+def available_cores() -> List[int]:
+    """Cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def build_session_options(
+    intra_op_threads: int,
+    inter_op_threads: int,
+    cores: Optional[List[int]] = None,
+    allow_spinning: bool = True,
+) -> onnxruntime.SessionOptions:
+    """Session options with explicit thread counts and optional thread affinity"""
+    so = onnxruntime.SessionOptions()
+    so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    so.intra_op_num_threads = intra_op_threads
+    so.inter_op_num_threads = inter_op_threads
+    if not allow_spinning:
+        so.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    if cores and intra_op_threads > 1:
+        # The calling thread is intra-op thread 0; ORT pins the remaining
+        # threads itself and expects 1-based logical processor ids
+        affinities = ";".join(str(core + 1) for core in cores[1:intra_op_threads])
+        if affinities:
+            so.add_session_config_entry(
+                "session.intra_op_thread_affinities", affinities
+            )
+    return so
+
+
+class ModelSlot:
+    """One set of detection and/or recognition sessions, prepared once"""
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        allowed_modules: List[str],
+        providers: List[str],
+        session_options: onnxruntime.SessionOptions,
+        cores: Optional[List[int]] = None,
+    ):
+        self.cores = cores
+        self.models: Dict[str, object] = {}
+
+        model_dir = ensure_available("models", name, root=root)
+        for onnx_file in sorted(glob.glob(osp.join(model_dir, "*.onnx"))):
+            model = ModelRouter(onnx_file).get_model(
+                sess_options=session_options, providers=providers
+            )
+            if model is None or model.taskname not in allowed_modules:
+                continue
+            if model.taskname not in self.models:
+                self.models[model.taskname] = model
+
+        missing = [module for module in allowed_modules if module not in self.models]
+        if missing:
+            raise RuntimeError(f"No {', '.join(missing)} model found in {model_dir}")
+        # None for embed-only slots, which align caller-supplied keypoints
+        self.det_model = self.models.get("detection")
+
+    def prepare(self, ctx_id: int, det_size=(640, 640), det_thresh: float = 0.5):
+        for taskname, model in self.models.items():
+            if taskname == "detection":
+                model.prepare(ctx_id, input_size=det_size, det_thresh=det_thresh)
+            else:
+                model.prepare(ctx_id)
+
+    def warm_up(self, det_size=(640, 640), rec_batch_size: int = 1):
+        """Run inference on a synthetic image so the first request isn't cold"""
+        rng = np.random.default_rng(0)
+        if self.det_model is not None:
+            img = rng.integers(
+                0, 255, size=(det_size[1], det_size[0], 3), dtype=np.uint8
+            )
+            self.det_model.detect(img, max_num=0, metric="default")
+
+        rec_model = self.models.get("recognition")
+        if rec_model is not None:
+            size = rec_model.input_size[0]
+            crop = rng.integers(0, 255, size=(size, size, 3), dtype=np.uint8)
+            rec_model.get_feat([crop] * max(rec_batch_size, 1))
+
+
+def create_model_pool(
+    name: str,
+    root: str,
+    allowed_modules: List[str],
+    providers: List[str],
+    pool_size: int = 1,
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 1,
+    pin_cores: bool = False,
+    process_count: int = 1,
+    process_index: int = 0,
+) -> List[ModelSlot]:
+    """
+    Create `pool_size` model slots splitting the available cores between them.
+    When several worker processes each own a pool, `process_count` and
+    `process_index` keep their threads (and pinned cores) from overlapping.
+    """
+    pool_size = max(pool_size, 1)
+    cores = available_cores()
+    total_slots = pool_size * max(process_count, 1)
+    if intra_op_threads <= 0:
+        intra_op_threads = max(len(cores) // total_slots, 1)
+
+    slots = []
+    for i in range(pool_size):
+        slot_cores = None
+        if pin_cores:
+            slot_index = process_index * pool_size + i
+            start = (slot_index * intra_op_threads) % len(cores)
+            slot_cores = [
+                cores[(start + j) % len(cores)] for j in range(intra_op_threads)
+            ]
+        session_options = build_session_options(
+            intra_op_threads,
+            inter_op_threads,
+            cores=slot_cores,
+            allow_spinning=total_slots == 1,
+        )
+        slots.append(
+            ModelSlot(
+                name=name,
+                root=root,
+                allowed_modules=allowed_modules,
+                providers=providers,
+                session_options=session_options,
+                cores=slot_cores,
+            )
+        )
+    return slots
@@ -1,10 +1,22 @@
-from core.config import MONGODB_KEY, MONGODB_DB_NAME
-from pymongo import MongoClient
+from core.config import (
+    MONGODB_KEY,
+    MONGODB_DB_NAME,
+    MONGODB_MIN_POOL_SIZE,
+    MONGODB_MAX_POOL_SIZE,
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+)
+from pymongo import AsyncMongoClient, MongoClient, ReturnDocument
+
+POOL_OPTIONS = {
+    "minPoolSize": MONGODB_MIN_POOL_SIZE,
+    "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+    "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+}
 
 
 class MongoDBClient:
     def __init__(self, uri, db_name):
-        self.client = MongoClient(uri, tlsAllowInvalidCertificates=True)
+        self.client = MongoClient(uri, tlsAllowInvalidCertificates=True, **POOL_OPTIONS)
         self.db = self.client[db_name]
 
     def insert_one(self, collection_name, document):
@@ -28,6 +40,10 @@ class MongoDBClient:
         collection = self.db[collection_name]
         return collection.update_one(query, update_data)
 
+    def bulk_write(self, collection_name, requests, ordered=True):
+        collection = self.db[collection_name]
+        return collection.bulk_write(requests, ordered=ordered)
+
     def delete_one(self, collection_name, query):
         collection = self.db[collection_name]
         return collection.delete_one(query)
@@ -36,8 +52,74 @@ class MongoDBClient:
         self.client.close()
 
 
+class AsyncMongoDBClient:
+    """Event-loop native client (pymongo async API) for use inside async routes"""
+
+    def __init__(self, uri, db_name):
+        self.client = AsyncMongoClient(
+            uri, tlsAllowInvalidCertificates=True, **POOL_OPTIONS
+        )
+        self.db = self.client[db_name]
+
+    async def insert_one(self, collection_name, document):
+        collection = self.db[collection_name]
+        return await collection.insert_one(document)
+
+    async def find_one(self, collection_name, query, projection=None):
+        collection = self.db[collection_name]
+        return await collection.find_one(query, projection)
+
+    def find(self, collection_name, query, projection=None):
+        """Returns an AsyncCursor, iterate it with `async for`"""
+        collection = self.db[collection_name]
+        return collection.find(query, projection)
+
+    async def update_one(self, collection_name, query, update_data):
+        collection = self.db[collection_name]
+        return await collection.update_one(query, update_data)
+
+    async def bulk_write(self, collection_name, requests, ordered=True):
+        collection = self.db[collection_name]
+        return await collection.bulk_write(requests, ordered=ordered)
+
+    async def find_one_and_update(
+        self, collection_name, query, update_data, projection=None
+    ):
+        """Atomically update the first match, returns it after the update"""
+        collection = self.db[collection_name]
+        return await collection.find_one_and_update(
+            query,
+            update_data,
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete_one(self, collection_name, query):
+        collection = self.db[collection_name]
+        return await collection.delete_one(query)
+
+    async def close(self):
+        await self.client.close()
+
+
 client = MongoDBClient(uri=MONGODB_KEY, db_name=MONGODB_DB_NAME)
+async_client = None
 
 
 def get_client():
     return client
+
+
+def get_async_client():
+    """Get the global async client, created lazily on the running event loop"""
+    global async_client
+    if async_client is None:
+        async_client = AsyncMongoDBClient(uri=MONGODB_KEY, db_name=MONGODB_DB_NAME)
+    return async_client
+
+
+async def close_async_client():
+    global async_client
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
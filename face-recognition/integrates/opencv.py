@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+from typing import Optional, Tuple, Union
+
+ImageInput = Union[str, bytes, bytearray, memoryview, np.ndarray]
+
+# libjpeg scales these down during the DCT, far cheaper than decode + resize
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+# Start-of-frame markers carrying the JPEG dimensions (not DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7}
+JPEG_SOF_MARKERS |= {0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(
+    content: Union[bytes, bytearray, memoryview],
+) -> Optional[Tuple[int, int]]:
+    """(width, height) from the JPEG frame header, None for other formats"""
+    data = memoryview(content)
+    if bytes(data[:2]) != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5 : offset + 7], "big")
+            width = int.from_bytes(data[offset + 7 : offset + 9], "big")
+            return width, height
+        offset += 2 + int.from_bytes(data[offset + 2 : offset + 4], "big")
+    return None
+
+
+def decode_image(content: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """Decode encoded image bytes (JPEG/PNG/...) straight from memory to BGR"""
+    buffer = np.frombuffer(content, dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Image bytes cannot be decoded")
+    return img
+
+
+def decode_image_reduced(
+    content: Union[bytes, bytearray, memoryview], max_side: int
+) -> Tuple[np.ndarray, float]:
+    """
+    Decode a JPEG at 1/2, 1/4 or 1/8 scale when its long side stays at or
+    above max_side; returns the image and the factor back to original pixels.
+    """
+    size = jpeg_size(content) if max_side > 0 else None
+    if size is None:
+        return decode_image(content), 1.0
+    long_side = max(size)
+    factor = next((f for f in REDUCED_DECODE_FLAGS if long_side / f >= max_side), 1)
+    if factor == 1:
+        return decode_image(content), 1.0
+    buffer = np.frombuffer(content, dtype=np.uint8)
+    img = cv2.imdecode(buffer, REDUCED_DECODE_FLAGS[factor])
+    if img is None:
+        raise ValueError("Image bytes cannot be decoded")
+    # EXIF rotation may swap the axes, the long side doesn't change
+    return img, long_side / max(img.shape[:2])
+
+
+def load_image(image: ImageInput) -> np.ndarray:
+    """Accept a decoded ndarray, encoded bytes or a file path"""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(image)
+    img = cv2.imread(image)
+    if img is None:
+        raise ValueError(f"Image not found or cannot be read: {image}")
+    return img
@@ -0,0 +1,54 @@
+"""
+Compact embedding codes for first-pass similarity search.
+
+float:  float16 per dimension (2 bytes), near-lossless
+int8:   symmetric per-vector scalar quantization (1 byte per dimension)
+binary: sign bit per dimension (1 bit), scored asymmetrically against the
+        float query
+
+Codes only rank candidates; exact scores come from re-ranking the top
+candidates against full-precision vectors (see integrates/embedding_store.py).
+"""
+
+import numpy as np
+
+STORAGE_MODES = ("float", "int8", "binary")
+CODE_DTYPES = {"float": np.float16, "int8": np.int8, "binary": np.uint8}
+
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def code_width(mode: str, dim: int) -> int:
+    """Number of code elements stored per vector"""
+    return dim // 8 if mode == "binary" else dim
+
+
+def code_bytes(mode: str, dim: int) -> int:
+    """Bytes per stored vector in the given mode"""
+    return code_width(mode, dim) * np.dtype(CODE_DTYPES[mode]).itemsize
+
+
+def encode(vectors, mode: str) -> np.ndarray:
+    vectors = normalize(vectors)
+    if mode == "float":
+        return vectors.astype(np.float16)
+    if mode == "int8":
+        scale = 127.0 / np.maximum(np.abs(vectors).max(axis=1, keepdims=True), 1e-12)
+        return np.round(vectors * scale).astype(np.int8)
+    if mode == "binary":
+        return np.packbits(vectors > 0, axis=1)
+    raise ValueError(f"Unknown storage mode {mode}, expected one of {STORAGE_MODES}")
+
+
+def decode(codes: np.ndarray, mode: str, dim: int) -> np.ndarray:
+    """Approximate unit vectors, so a float query @ decoded.T estimates cosine"""
+    if mode == "binary":
+        signs = np.unpackbits(codes, axis=1, count=dim).astype(np.float32) * 2 - 1
+        return signs / np.sqrt(dim)
+    return normalize(codes.astype(np.float32))
@@ -0,0 +1,257 @@
+"""
+Async client of the Supabase storage REST API.
+
+Every call goes through one shared httpx.AsyncClient: pooled, HTTP/2 where
+the server speaks it (many downloads multiplex over a few connections),
+with explicit connection limits and connect/read/pool timeouts, instead of
+a blocking SDK call per worker thread. Downloads of many keys run with
+bounded concurrency. Optionally, a download still running after the recent
+p95 latency is requested a second time and the first response wins, which
+cuts the tail a single slow request or connection adds.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+
+from core.config import (
+    STORAGE_CONNECT_TIMEOUT_SECONDS,
+    STORAGE_DOWNLOAD_CONCURRENCY,
+    STORAGE_HEDGE_ENABLED,
+    STORAGE_HEDGE_MAX_RATIO,
+    STORAGE_HEDGE_MIN_DELAY_MS,
+    STORAGE_HEDGE_MIN_SAMPLES,
+    STORAGE_HEDGE_PERCENTILE,
+    STORAGE_HTTP2,
+    STORAGE_MAX_CONNECTIONS,
+    STORAGE_MAX_KEEPALIVE_CONNECTIONS,
+    STORAGE_POOL_TIMEOUT_SECONDS,
+    STORAGE_READ_TIMEOUT_SECONDS,
+    SUPABASE_BUCKET_NAME,
+    SUPABASE_KEY,
+    SUPABASE_URL,
+)
+
+# Recent download latencies the hedge delay is computed from
+LATENCY_WINDOW = 500
+
+
+class StorageError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StorageClient:
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        bucket: str,
+        http2: bool = STORAGE_HTTP2,
+        max_connections: int = STORAGE_MAX_CONNECTIONS,
+        max_keepalive_connections: int = STORAGE_MAX_KEEPALIVE_CONNECTIONS,
+        connect_timeout: float = STORAGE_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = STORAGE_READ_TIMEOUT_SECONDS,
+        pool_timeout: float = STORAGE_POOL_TIMEOUT_SECONDS,
+        download_concurrency: int = STORAGE_DOWNLOAD_CONCURRENCY,
+        hedge: bool = STORAGE_HEDGE_ENABLED,
+        hedge_percentile: float = STORAGE_HEDGE_PERCENTILE,
+        hedge_min_delay_ms: float = STORAGE_HEDGE_MIN_DELAY_MS,
+        hedge_min_samples: int = STORAGE_HEDGE_MIN_SAMPLES,
+        hedge_max_ratio: float = STORAGE_HEDGE_MAX_RATIO,
+    ):
+        if not url:
+            raise ValueError("Storage URL is not configured")
+        self.bucket = bucket
+        self.download_concurrency = max(download_concurrency, 1)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self.client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/storage/v1/",
+            headers={"apikey": key or "", "Authorization": f"Bearer {key or ''}"},
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(
+                read_timeout, connect=connect_timeout, pool=pool_timeout
+            ),
+        )
+
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.downloads = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.errors = 0
+
+    def _object_path(self, key: str) -> str:
+        return f"object/{self.bucket}/{quote(key.lstrip('/'))}"
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response):
+        if response.status_code < 400:
+            return
+        try:
+            body = response.json()
+            message = body.get("message") or body.get("error") or response.text
+        except ValueError:
+            message = response.text
+        raise StorageError(
+            f"Storage {response.status_code}: {message}", response.status_code
+        )
+
+    async def _get(self, key: str, record: bool = True) -> bytes:
+        started_at = time.perf_counter()
+        response = await self.client.get(self._object_path(key))
+        self._raise_for_status(response)
+        if record:
+            self._latencies.append(time.perf_counter() - started_at)
+        return response.content
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None while hedging is off or spent"""
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        # Hedges stay a small share of downloads
+        if self.hedged >= self.hedge_max_ratio * max(self.downloads, 1):
+            return None
+        percentile = float(np.percentile(self._latencies, self.hedge_percentile))
+        return max(percentile, self.hedge_min_delay)
+
+    async def download(self, key: str, hedge: bool = True) -> bytes:
+        """
+        Object bytes, hedged with a second request once the delay passes.
+        hedge=False for objects much larger than the usual download (e.g.
+        crop chunks): they would always pass the delay, and their latency
+        is kept out of the samples it is computed from.
+        """
+        try:
+            if not hedge:
+                return await self._get(key, record=False)
+            # Only hedgeable downloads count towards the hedge budget
+            self.downloads += 1
+            delay = self.hedge_delay()
+            first = asyncio.create_task(self._get(key))
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            self.hedged += 1
+            second = asyncio.create_task(self._get(key))
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        if task.exception() is None:
+                            if task is second:
+                                self.hedge_wins += 1
+                            return task.result()
+                        error = task.exception()
+                raise error
+            finally:
+                # The loser is cancelled, its stream is closed by httpx
+                for task in pending:
+                    task.cancel()
+        except Exception:
+            self.errors += 1
+            raise
+
+    async def download_many(
+        self, keys: List[str], concurrency: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Download many keys at once, at most `concurrency` in flight. Returns
+        key -> bytes, or key -> the exception for keys that failed.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.download_concurrency)
+
+        async def fetch(key: str):
+            async with semaphore:
+                try:
+                    return await self.download(key)
+                except Exception as e:
+                    return e
+
+        results = await asyncio.gather(*(fetch(key) for key in keys))
+        return dict(zip(keys, results))
+
+    async def upload(
+        self,
+        key: str,
+        content: bytes,
+        mimetype: str = "application/octet-stream",
+        upsert: bool = False,
+    ) -> Dict[str, Any]:
+        response = await self.client.post(
+            self._object_path(key),
+            files={"file": (key.rsplit("/", 1)[-1], content, mimetype)},
+            data={"cacheControl": "3600"},
+            headers={"x-upsert": "true" if upsert else "false"},
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self._latencies)
+        return {
+            "downloads": self.downloads,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": (
+                round(self.hedge_delay() * 1000, 2)
+                if self.hedge_delay() is not None
+                else None
+            ),
+            "latency_ms": (
+                {
+                    f"p{p}": round(float(np.percentile(latencies, p)) * 1000, 2)
+                    for p in (50, 95, 99)
+                }
+                if latencies
+                else None
+            ),
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# Global client instance
+storage_client: Optional[StorageClient] = None
+_client_lock = threading.Lock()
+
+
+def get_storage_client() -> StorageClient:
+    """Get the shared storage client, created lazily on the running event loop"""
+    global storage_client
+    with _client_lock:
+        if storage_client is None:
+            storage_client = StorageClient(
+                SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET_NAME
+            )
+    return storage_client
+
+
+async def close_storage_client():
+    global storage_client
+    if storage_client is not None:
+        await storage_client.close()
+        storage_client = None
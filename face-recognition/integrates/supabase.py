@@ -1,11 +1,20 @@
 from supabase import create_client, Client
-from core.config import SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET_NAME
-from typing import Optional, Dict, Any
+from core.config import (
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    SUPABASE_BUCKET_NAME,
+    DEBUG_SAVE_DOWNLOADS,
+    DEBUG_DOWNLOAD_DIR,
+)
+from integrates.storage import get_storage_client
+from typing import Optional, Dict, Any, List
 from pathlib import Path
 import logging
 from uuid import uuid4
 import asyncio
 
+# Uploads and downloads go through the shared async storage client, the SDK
+# client only signs URLs
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 logger = logging.getLogger(__name__)
 
@@ -19,14 +28,11 @@ async def upload_file(
         return {"success": False, "error": "File content is empty"}
     storage_file_name = f"{uuid4()}-{file_name}"
     try:
-        response = await asyncio.to_thread(
-            supabase.storage.from_(SUPABASE_BUCKET_NAME).upload,
-            path=storage_file_name,
-            file=file_content,
-            file_options={"content-type": mimetype} if mimetype else None,
+        await get_storage_client().upload(
+            storage_file_name,
+            file_content,
+            mimetype=mimetype or "application/octet-stream",
         )
-        if hasattr(response, "error") and response.error:
-            return {"success": False, "error": str(response.error)}
         return {
             "success": True,
             "file_key": storage_file_name,
@@ -39,25 +45,87 @@ async def upload_file(
         return {"success": False, "error": str(e)}
 
 
+async def upload_object(
+    path: str, content: bytes, mimetype: str = "application/octet-stream"
+) -> Dict[str, Any]:
+    """Upload to a fixed path in the bucket, replacing an existing object"""
+    try:
+        await get_storage_client().upload(path, content, mimetype=mimetype, upsert=True)
+        return {"success": True, "file_key": path, "size": len(content)}
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return {"success": False, "error": str(e)}
+
+
+def _save_local_copy(content: bytes, file_key: str, local_path: str) -> str:
+    local_path = Path(local_path)
+    local_path.mkdir(parents=True, exist_ok=True)
+    file_path = local_path / file_key.split("/")[-1]
+    with open(file_path, "wb") as f:
+        f.write(content)
+    return str(file_path)
+
+
+async def _download_result(file_key: str, content: Any) -> Dict[str, Any]:
+    if isinstance(content, Exception):
+        logger.error(f"Download error: {content}")
+        return {"success": False, "error": str(content)}
+    if not content:
+        return {"success": False, "error": "Download failed or file not found"}
+    result = {
+        "success": True,
+        "file_name": file_key.split("/")[-1],
+        "content": content,
+        "bucket": SUPABASE_BUCKET_NAME,
+        "size": len(content),
+    }
+    if DEBUG_SAVE_DOWNLOADS:
+        result["local_path"] = await asyncio.to_thread(
+            _save_local_copy, content, file_key, DEBUG_DOWNLOAD_DIR
+        )
+    return result
+
+
+async def download_file_bytes(file_key: str, hedge: bool = True) -> Dict[str, Any]:
+    """
+    Download a file into memory; written to disk only in debug mode.
+    hedge=False for large objects, see StorageClient.download.
+    """
+    try:
+        content = await get_storage_client().download(file_key, hedge=hedge)
+    except Exception as e:
+        content = e
+    return await _download_result(file_key, content)
+
+
+async def download_files_bytes(file_keys: List[str]) -> List[Dict[str, Any]]:
+    """
+    Download many files at once over the shared connections, results in the
+    order of file_keys; one missing file doesn't fail the others
+    """
+    try:
+        contents = await get_storage_client().download_many(file_keys)
+    except Exception as e:
+        contents = {file_key: e for file_key in file_keys}
+    return [
+        await _download_result(file_key, contents[file_key]) for file_key in file_keys
+    ]
+
+
 async def download_file(
     file_key: str, local_path: Optional[str] = "temp/download"
 ) -> Dict[str, Any]:
     try:
-        file_key = f"{file_key}"
-        content = await asyncio.to_thread(
-            supabase.storage.from_(SUPABASE_BUCKET_NAME).download, file_key
-        )
+        content = await get_storage_client().download(file_key)
         if not content:
             return {"success": False, "error": "Download failed or file not found"}
-        local_path = Path(local_path)
-        local_path.mkdir(parents=True, exist_ok=True)
-        file_path = local_path / file_key.split("/")[-1]
-        with open(file_path, "wb") as f:
-            f.write(content)
+        file_path = await asyncio.to_thread(
+            _save_local_copy, content, file_key, local_path
+        )
         return {
             "success": True,
             "file_name": file_key.split("/")[-1],
-            "local_path": str(file_path),
+            "local_path": file_path,
             "bucket": SUPABASE_BUCKET_NAME,
             "size": len(content),
         }
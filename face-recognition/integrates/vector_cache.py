@@ -0,0 +1,637 @@
+"""
+In-process ANN cache of face embeddings, one index per playground.
+
+Embeddings are L2-normalized and kept in memory-mapped matrices on disk,
+float16 by default or int8/binary codes in a compact storage mode (binary
+codes re-ranked against the full-precision embedding store, int8 scores are
+close enough to serve as they are). Small playgrounds are searched
+brute force; larger ones get an IVF structure (spherical k-means coarse
+quantizer, re-scoring of the probed lists), trained while warming and
+retrained in the background as the index grows, never on a search. A
+playground is answered locally only once it has been fully warmed; until
+then, or when it is too large to cache, callers fall back to Milvus. Inserts
+and removals made around a warm are replayed into its snapshot, which is
+read from Mongo or Milvus and can miss faces written meanwhile.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    EMBEDDING_RERANK_FACTOR,
+    EMBEDDING_STORAGE_MODE,
+    VECTOR_CACHE_BRUTE_FORCE_MAX,
+    VECTOR_CACHE_DIR,
+    VECTOR_CACHE_MAX_SIZE,
+    VECTOR_CACHE_NPROBE,
+    VECTOR_CACHE_TTL_SECONDS,
+    VECTOR_CACHE_WARM_GRACE_SECONDS,
+)
+from integrates.embedding_store import EmbeddingStore, get_embedding_store
+from integrates.quantization import (
+    CODE_DTYPES,
+    code_bytes,
+    code_width,
+    decode,
+    encode,
+    normalize,
+)
+
+SCORE_CHUNK_ROWS = 65536
+# Id of a removed row in memory, skipped by searches until the next warm
+# drops it; on disk removed rows are appended to a separate file
+REMOVED_ID = "-"
+
+
+def _file_stem(playground_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", playground_id)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores per row, best first"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class PlaygroundIndex:
+    def __init__(
+        self, directory: Path, playground_id: str, dim: int, storage_mode: str
+    ):
+        self.dim = dim
+        self.playground_id = playground_id
+        self.storage_mode = storage_mode
+        self.width = code_width(storage_mode, dim)
+        self.dtype = CODE_DTYPES[storage_mode]
+        stem = _file_stem(playground_id)
+        self.matrix_path = directory / f"{stem}.{storage_mode}"
+        self.ids_path = directory / f"{stem}.ids"
+        self.removed_path = directory / f"{stem}.removed"
+        self.meta_path = directory / f"{stem}.json"
+        self.lock = threading.RLock()
+
+        self.ids: List[str] = []
+        # face id -> row of every cached face that isn't removed
+        self.rows: Dict[str, int] = {}
+        self.size = 0
+        self.capacity = 0
+        self.matrix: Optional[np.memmap] = None
+        self.complete = False
+        self.warmed_at = 0.0
+        self.removed = 0
+
+        # IVF structure, rebuilt when the index doubles in size
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[np.ndarray] = []
+        self.ivf_size = 0
+        self._training = False
+        # Bumped by reset, a training started before it is discarded
+        self._generation = 0
+
+        self._load()
+
+    def _load(self):
+        if not (self.meta_path.exists() and self.ids_path.exists()):
+            return
+        meta = json.loads(self.meta_path.read_text())
+        if meta.get("storage_mode", "float") != self.storage_mode:
+            # Written in another storage mode, the next warm rebuilds it
+            return
+        self.ids = self.ids_path.read_text().split()
+        self.size = len(self.ids)
+        if self.removed_path.exists():
+            for line in self.removed_path.read_text().split():
+                if int(line) < self.size:
+                    self.ids[int(line)] = REMOVED_ID
+        self.removed = self.ids.count(REMOVED_ID)
+        self.rows = {
+            face_id: row
+            for row, face_id in enumerate(self.ids)
+            if face_id != REMOVED_ID
+        }
+        self.capacity = meta["capacity"]
+        # Never trusted after a restart: unflushed appends and in-place upserts
+        # may be missing from the files, and Milvus may have changed since
+        self.complete = False
+        self.warmed_at = meta.get("warmed_at", 0.0)
+        self.matrix = np.memmap(
+            self.matrix_path,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(self.capacity, self.width),
+        )
+
+    def _save_meta(self):
+        self.meta_path.write_text(
+            json.dumps(
+                {
+                    "capacity": self.capacity,
+                    "storage_mode": self.storage_mode,
+                    "complete": self.complete,
+                    "warmed_at": self.warmed_at,
+                }
+            )
+        )
+
+    def _reserve(self, rows: int):
+        if self.size + rows <= self.capacity:
+            return
+        capacity = max(self.capacity * 2, self.size + rows, 1024)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        # Growing the file in place keeps existing rows, no copy needed
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(capacity * code_bytes(self.storage_mode, self.dim))
+        self.matrix = np.memmap(
+            self.matrix_path, dtype=self.dtype, mode="r+", shape=(capacity, self.width)
+        )
+        self.capacity = capacity
+
+    def reset(self):
+        with self.lock:
+            self.ids = []
+            self.rows = {}
+            self.size = 0
+            self.removed = 0
+            self.complete = False
+            self.centroids = None
+            self.lists = []
+            self.ivf_size = 0
+            self._generation += 1
+            self.ids_path.write_text("")
+            self.removed_path.unlink(missing_ok=True)
+            self._save_meta()
+
+    def add(self, ids: List[str], embeddings) -> int:
+        if not ids:
+            return 0
+        codes = encode(embeddings, self.storage_mode)
+        with self.lock:
+            self._reserve(len(ids))
+            start = self.size
+            self.matrix[start : start + len(ids)] = codes
+            self.size += len(ids)
+            self.ids.extend(ids)
+            for offset, face_id in enumerate(ids):
+                self.rows[face_id] = start + offset
+            with open(self.ids_path, "a") as f:
+                f.write("\n".join(ids) + "\n")
+            if self.centroids is not None:
+                self._assign(start, self.size)
+            self._save_meta()
+        return len(ids)
+
+    def upsert(self, ids: List[str], embeddings) -> int:
+        """
+        Overwrite the rows of ids already cached and append the rest. A
+        replaced row keeps its IVF list: it is the same face re-detected.
+        """
+        if not ids:
+            return 0
+        codes = encode(embeddings, self.storage_mode)
+        with self.lock:
+            new = []
+            for position, face_id in enumerate(ids):
+                row = self.rows.get(face_id)
+                if row is not None:
+                    self.matrix[row] = codes[position]
+                else:
+                    new.append(position)
+            if new:
+                self.add([ids[i] for i in new], np.asarray(embeddings)[new])
+        return len(ids)
+
+    def remove(self, ids: List[str]) -> int:
+        """
+        Tombstone the rows of deleted faces. They stay in the matrix and IVF
+        lists, searches skip them, until the next warm.
+        """
+        with self.lock:
+            rows = [
+                self.rows.pop(face_id) for face_id in set(ids) if face_id in self.rows
+            ]
+            for row in rows:
+                self.ids[row] = REMOVED_ID
+            if rows:
+                self.removed += len(rows)
+                with open(self.removed_path, "a") as f:
+                    f.write("".join(f"{row}\n" for row in rows))
+        return len(rows)
+
+    def mark_complete(self):
+        with self.lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+            self.complete = True
+            self.warmed_at = time.time()
+            self._save_meta()
+
+    def is_fresh(self) -> bool:
+        if not self.complete:
+            return False
+        return (
+            VECTOR_CACHE_TTL_SECONDS <= 0
+            or time.time() - self.warmed_at < VECTOR_CACHE_TTL_SECONDS
+        )
+
+    def _vectors(self, codes: np.ndarray) -> np.ndarray:
+        return decode(np.asarray(codes), self.storage_mode, self.dim)
+
+    def _scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Cosine scores, decoding stored codes chunk by chunk to float32 for BLAS"""
+        if rows is not None:
+            return queries @ self._vectors(self.matrix[rows]).T
+        parts = []
+        for start in range(0, self.size, SCORE_CHUNK_ROWS):
+            chunk = self.matrix[start : min(start + SCORE_CHUNK_ROWS, self.size)]
+            parts.append(queries @ self._vectors(chunk).T)
+        return np.hstack(parts)
+
+    def needs_ivf(self) -> bool:
+        return self.size > VECTOR_CACHE_BRUTE_FORCE_MAX and (
+            self.centroids is None or self.size >= 2 * self.ivf_size
+        )
+
+    def train_ivf(self, iterations: int = 10, sample_size: int = 50000):
+        """
+        Spherical k-means on a sample of the index. Runs outside the lock,
+        searches keep using the previous structure (or brute force) meanwhile.
+        """
+        with self.lock:
+            generation, size, matrix = self._generation, self.size, self.matrix
+        if size == 0:
+            return
+        rng = np.random.default_rng(0)
+        nlist = int(min(max(4 * np.sqrt(size), 16), 4096))
+        sample_rows = rng.choice(size, size=min(sample_size, size), replace=False)
+        sample = self._vectors(matrix[np.sort(sample_rows)])
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._fill_lists(matrix, centroids, lists, 0, size)
+        with self.lock:
+            if self._generation != generation:
+                return
+            self.centroids = centroids
+            self.lists = lists
+            self.ivf_size = size
+            # Rows added while training
+            self._assign(size, self.size)
+
+    def _train_in_background(self):
+        with self.lock:
+            if self._training:
+                return
+            self._training = True
+
+        def run():
+            try:
+                self.train_ivf()
+            except Exception as e:
+                print(f"Vector cache IVF training error: {e}")
+            finally:
+                with self.lock:
+                    self._training = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _fill_lists(
+        self,
+        matrix: np.ndarray,
+        centroids: np.ndarray,
+        lists: List[np.ndarray],
+        start: int,
+        end: int,
+    ):
+        for chunk_start in range(start, end, SCORE_CHUNK_ROWS):
+            chunk_end = min(chunk_start + SCORE_CHUNK_ROWS, end)
+            chunk = self._vectors(matrix[chunk_start:chunk_end])
+            assignment = np.argmax(chunk @ centroids.T, axis=1)
+            for list_id in np.unique(assignment):
+                rows = np.nonzero(assignment == list_id)[0] + chunk_start
+                lists[list_id] = np.concatenate([lists[list_id], rows])
+
+    def _assign(self, start: int, end: int):
+        self._fill_lists(self.matrix, self.centroids, self.lists, start, end)
+
+    def search(self, queries, limit: int) -> List[List[Tuple[str, float]]]:
+        queries = normalize(queries)
+        with self.lock:
+            # Enough candidates to still return limit hits past removed rows
+            k = limit + self.removed
+            results = self._search(queries, k)
+        return [
+            [hit for hit in hits if hit[0] != REMOVED_ID][:limit] for hits in results
+        ]
+
+    def _search(self, queries: np.ndarray, limit: int) -> List[List[Tuple[str, float]]]:
+        with self.lock:
+            if self.size == 0:
+                return [[] for _ in range(len(queries))]
+            if self.needs_ivf():
+                self._train_in_background()
+            if self.size <= VECTOR_CACHE_BRUTE_FORCE_MAX or self.centroids is None:
+                scores = self._scores(queries)
+                top = _top_k(scores, limit)
+                return [
+                    [(self.ids[i], float(scores[q, i])) for i in top[q]]
+                    for q in range(len(queries))
+                ]
+
+            nprobe = min(VECTOR_CACHE_NPROBE, len(self.centroids))
+            probes = _top_k(queries @ self.centroids.T, nprobe)
+            results = []
+            for q, query in enumerate(queries):
+                rows = np.concatenate([self.lists[list_id] for list_id in probes[q]])
+                if len(rows) == 0:
+                    results.append([])
+                    continue
+                scores = self._scores(query[None, :], rows)
+                top = _top_k(scores, limit)[0]
+                results.append([(self.ids[rows[i]], float(scores[0, i])) for i in top])
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "removed": self.removed,
+            "complete": self.complete,
+            "fresh": self.is_fresh(),
+            "mode": (
+                "brute_force" if self.size <= VECTOR_CACHE_BRUTE_FORCE_MAX else "ivf"
+            ),
+            "ivf_lists": len(self.lists),
+            "ivf_training": self._training,
+            "storage_mode": self.storage_mode,
+            "bytes": self.size * code_bytes(self.storage_mode, self.dim),
+        }
+
+
+class VectorCache:
+    def __init__(
+        self,
+        directory: str,
+        dim: int,
+        storage_mode: str = "float",
+        embedding_store: Optional[EmbeddingStore] = None,
+        rerank_factor: int = EMBEDDING_RERANK_FACTOR,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.storage_mode = storage_mode
+        # Compact codes only rank candidates, exact scores come from the store
+        self.embedding_store = embedding_store
+        self.rerank_factor = rerank_factor
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, PlaygroundIndex] = {}
+        self._counters = {"hits": 0, "misses": 0}
+        # Recent inserts per playground, (time, ids, embeddings), removals
+        # with embeddings None, and the start times of warms in progress,
+        # which keep them from expiring
+        self._recent: Dict[str, deque] = {}
+        self._warms: Dict[str, List[float]] = {}
+
+    def _index(
+        self, playground_id: str, create: bool = False
+    ) -> Optional[PlaygroundIndex]:
+        with self._lock:
+            index = self._indexes.get(playground_id)
+            if index is None:
+                path = self.directory / f"{_file_stem(playground_id)}.json"
+                if not create and not path.exists():
+                    return None
+                index = PlaygroundIndex(
+                    self.directory, playground_id, self.dim, self.storage_mode
+                )
+                self._indexes[playground_id] = index
+            return index
+
+    def can_serve(self, playground_id: Optional[str]) -> bool:
+        if not playground_id:
+            return False
+        index = self._index(playground_id)
+        return index is not None and index.is_fresh()
+
+    def begin_warm(self, playground_id: str) -> float:
+        """
+        Call before reading a playground's snapshot; pass the returned start
+        time to load(), which replays inserts the snapshot may have missed.
+        """
+        started_at = time.time()
+        with self._lock:
+            self._warms.setdefault(playground_id, []).append(started_at)
+        return started_at
+
+    def end_warm(self, playground_id: str, started_at: float):
+        with self._lock:
+            warms = self._warms.get(playground_id, [])
+            if started_at in warms:
+                warms.remove(started_at)
+            if not warms:
+                self._warms.pop(playground_id, None)
+
+    def _log_insert(self, playground_id: str, ids: List[str], embeddings):
+        now = time.time()
+        cutoff = (
+            min([now] + self._warms.get(playground_id, []))
+            - VECTOR_CACHE_WARM_GRACE_SECONDS
+        )
+        recent = self._recent.setdefault(playground_id, deque())
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        recent.append((now, list(ids), embeddings))
+        while recent and recent[0][0] < cutoff:
+            recent.popleft()
+
+    def _inserts_since(self, playground_id: str, since: float) -> List[Tuple]:
+        with self._lock:
+            return [
+                (ids, embeddings)
+                for logged_at, ids, embeddings in self._recent.get(playground_id, [])
+                if logged_at >= since
+            ]
+
+    def load(
+        self,
+        playground_id: str,
+        ids: List[str],
+        embeddings,
+        started_at: Optional[float] = None,
+    ) -> bool:
+        """
+        Replace a playground's index with a full snapshot, False if too large.
+        With the start time from begin_warm(), inserts since shortly before it
+        are upserted on top. IVF lists are trained here, off the search path.
+        """
+        index = self._index(playground_id, create=True)
+        try:
+            with index.lock:
+                index.reset()
+                if len(ids) > VECTOR_CACHE_MAX_SIZE:
+                    return False
+                index.add(ids, embeddings)
+                if started_at is not None:
+                    since = started_at - VECTOR_CACHE_WARM_GRACE_SECONDS
+                    for insert_ids, insert_embeddings in self._inserts_since(
+                        playground_id, since
+                    ):
+                        if insert_embeddings is None:
+                            index.remove(insert_ids)
+                        else:
+                            index.upsert(insert_ids, insert_embeddings)
+                    if index.size > VECTOR_CACHE_MAX_SIZE:
+                        index.reset()
+                        return False
+                if index.needs_ivf():
+                    index.train_ivf()
+                index.mark_complete()
+            return True
+        finally:
+            if started_at is not None:
+                self.end_warm(playground_id, started_at)
+
+    def add(
+        self,
+        playground_id: Optional[str],
+        ids: List[str],
+        embeddings,
+        replace: bool = False,
+    ):
+        """
+        Keep a warmed index incrementally up to date with new inserts;
+        replace=True for upserts, whose ids may already be cached. Every
+        insert is also logged for a warm that is reading its snapshot.
+        """
+        if not playground_id or not ids:
+            return
+        with self._lock:
+            index = self._indexes.get(playground_id)
+            if index is None:
+                # Logged before any load can create the index and read the log
+                self._log_insert(playground_id, ids, embeddings)
+                return
+        # Under the index lock a load has either replayed this insert or
+        # finished, so it is applied exactly once
+        with index.lock:
+            with self._lock:
+                self._log_insert(playground_id, ids, embeddings)
+            if not index.complete:
+                return
+            if index.size + len(ids) > VECTOR_CACHE_MAX_SIZE:
+                # Too large to cache, searches fall back to Milvus from now on
+                index.reset()
+                return
+            if replace:
+                index.upsert(ids, embeddings)
+            else:
+                index.add(ids, embeddings)
+
+    def remove(self, playground_id: Optional[str], ids: List[str]):
+        """Skip deleted faces in a warmed index, logged for a warm like inserts"""
+        if not playground_id or not ids:
+            return
+        with self._lock:
+            index = self._indexes.get(playground_id)
+            if index is None:
+                self._log_insert(playground_id, ids, None)
+                return
+        with index.lock:
+            with self._lock:
+                self._log_insert(playground_id, ids, None)
+            if index.complete:
+                index.remove(ids)
+
+    def invalidate(self, embedding_store: Optional[EmbeddingStore] = None):
+        """
+        Drop every warmed playground, e.g. after the served collection version
+        changed; searches fall back to Milvus until playgrounds are re-warmed.
+        """
+        with self._lock:
+            indexes = list(self._indexes.values())
+            if embedding_store is not None:
+                self.embedding_store = embedding_store
+        for index in indexes:
+            index.reset()
+        # Playgrounds persisted on disk but not loaded in this process
+        for meta_path in self.directory.glob("*.json"):
+            meta = json.loads(meta_path.read_text())
+            if meta.get("complete"):
+                meta["complete"] = False
+                meta_path.write_text(json.dumps(meta))
+
+    def search(
+        self, playground_id: str, embeddings, limit: int
+    ) -> Optional[List[List[Dict[str, Any]]]]:
+        """Search a warmed playground locally, None on miss"""
+        if not self.can_serve(playground_id):
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        compact = self.storage_mode != "float" and self.embedding_store is not None
+        candidates = limit * self.rerank_factor if compact else limit
+        hits = self._index(playground_id).search(embeddings, candidates)
+        if compact:
+            hits = [
+                self.embedding_store.rerank(query, query_hits, limit)
+                for query, query_hits in zip(normalize(embeddings), hits)
+            ]
+        with self._lock:
+            self._counters["hits"] += 1
+        # Same shape as Milvus COSINE results: distance holds the similarity
+        return [
+            [
+                {"id": face_id, "distance": score, "score": 1.0 - score}
+                for face_id, score in query_hits
+            ]
+            for query_hits in hits
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            indexes = dict(self._indexes)
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "storage_mode": self.storage_mode,
+            "bytes_per_face": code_bytes(self.storage_mode, self.dim),
+            "playgrounds": {pid: index.stats() for pid, index in indexes.items()},
+        }
+
+
+# Global cache instance
+vector_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_vector_cache(dim: int) -> VectorCache:
+    """Get the global vector cache with lazy initialization"""
+    global vector_cache
+    with _cache_lock:
+        if vector_cache is None:
+            vector_cache = VectorCache(
+                VECTOR_CACHE_DIR,
+                dim,
+                storage_mode=EMBEDDING_STORAGE_MODE,
+                embedding_store=(
+                    get_embedding_store()
+                    if EMBEDDING_STORAGE_MODE == "binary"
+                    else None
+                ),
+            )
+    return vector_cache
@@ -1,66 +1,322 @@
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
 from typing import List
 import time
 from services.mongo_service import get_image_data, update_image_status
 from enums.images_enum import ImageStatusEnum
-from integrates.supabase import download_file
+from integrates.supabase import download_file_bytes
 from services.face_service import (
     face_detection_service,
+    validate_supplied_faces,
+    get_engine_stats_service,
+    get_cache_stats_service,
 )
-from schemas.image_schema import FaceDetectionRequest
+from schemas.image_schema import (
+    FaceDetectionRequest,
+    DetectRequest,
+    BatchFaceDetectionRequest,
+    TagFaceRequest,
+    ReembedRequest,
+    MigrationRequest,
+)
+from services.pipeline_service import DetectionPipeline, stream_detection_events
+from core.config import BATCH_MAX_IMAGES
 from services.milvus_service import MilvusService
-from services.mongo_service import update_image_faces
+from services.crop_service import (
+    start_reembed_service,
+    get_crop_stats_service,
+)
+from services.migration_service import (
+    start_migration_service,
+    switch_migration_service,
+    abort_migration_service,
+    get_migration_status_service,
+)
+from services.job_service import (
+    detect_image_service,
+    enqueue_detection_service,
+    get_job_service,
+    get_job_stats_service,
+)
+from services.suggestion_service import (
+    suggest_names_service,
+    build_centroid_index_service,
+    tag_face_service,
+    get_centroid_stats_service,
+)
 
 
 router = APIRouter()
 
 
+@router.get("/engine/stats")
+async def get_engine_stats():
+    """Batching knobs and per-batch occupancy of the inference engine"""
+    return JSONResponse(status_code=200, content=await get_engine_stats_service())
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and tier sizes of the detection result cache"""
+    return JSONResponse(status_code=200, content=get_cache_stats_service())
+
+
+@router.get("/milvus/ready")
+async def get_milvus_readiness():
+    """Readiness probe: 200 once the collection is connected and loaded"""
+    status = MilvusService().get_readiness()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@router.get("/vector-cache/stats")
+async def get_vector_cache_stats():
+    """Hit/miss counters and per-playground sizes of the local vector cache"""
+    return JSONResponse(
+        status_code=200, content=MilvusService().get_vector_cache_stats()
+    )
+
+
+@router.post("/vector-cache/{playground_id}/warm")
+async def warm_vector_cache(playground_id: str):
+    """Load a playground's embeddings so its searches are answered in-process"""
+    try:
+        result = await MilvusService().warm_playground_cache(playground_id)
+        return JSONResponse(status_code=200, content={"success": True, **result})
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Cache warm failed: {str(e)}"},
+        )
+
+
+@router.get("/centroids/stats")
+async def get_centroid_stats():
+    """Hit/miss counters and per-playground sizes of the person centroid index"""
+    return JSONResponse(status_code=200, content=get_centroid_stats_service())
+
+
+@router.post("/centroids/{playground_id}/build")
+async def build_centroid_index(playground_id: str):
+    """Rebuild a playground's person centroids from the current face tags"""
+    try:
+        result = await build_centroid_index_service(playground_id)
+        return JSONResponse(status_code=200, content={"success": True, **result})
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Centroid build failed: {str(e)}"},
+        )
+
+
+@router.post("/tag-face")
+async def tag_face(request: TagFaceRequest):
+    """Tag a detected face with a person and update that person's centroid"""
+    try:
+        result = await tag_face_service(
+            image_id=request.image_id,
+            milvus_id=request.milvus_id,
+            person_id=request.person_id,
+        )
+        return JSONResponse(status_code=200, content=result)
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Face tagging failed: {str(e)}"},
+        )
+
+
+@router.get("/crops/stats")
+async def get_crop_stats():
+    """Size of the aligned face-crop store and progress of the re-embed job"""
+    return JSONResponse(status_code=200, content=await get_crop_stats_service())
+
+
+@router.post("/crops/reembed")
+async def reembed_crops(request: ReembedRequest):
+    """Re-embed every stored crop with a recognition model into a new collection"""
+    try:
+        job = await start_reembed_service(
+            collection_name=request.collection_name,
+            model_name=request.model_name,
+            batch_size=request.batch_size,
+        )
+        return JSONResponse(status_code=202, content={"success": True, "job": job})
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Re-embed failed: {str(e)}"},
+        )
+
+
+@router.get("/migration/status")
+async def get_migration_status():
+    """Versions, backfill progress and throughput of the collection migration"""
+    return JSONResponse(
+        status_code=200,
+        content={"success": True, "migration": get_migration_status_service()},
+    )
+
+
+@router.post("/migration/start")
+async def start_migration(request: MigrationRequest):
+    """Create the next collection version and backfill it in the background"""
+    try:
+        migration = await start_migration_service(
+            model_name=request.model_name,
+            index_type=request.index_type,
+            index_params=request.index_params,
+            search_params=request.search_params,
+            batch_size=request.batch_size,
+            max_rows_per_second=request.max_rows_per_second,
+            auto_switch=request.auto_switch,
+        )
+        return JSONResponse(
+            status_code=202, content={"success": True, "migration": migration}
+        )
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Migration failed: {str(e)}"},
+        )
+
+
+@router.post("/migration/switch")
+async def switch_migration(
+    force: bool = Query(False, description="Switch even if faces are missing"),
+):
+    """Atomically serve reads from the backfilled version"""
+    try:
+        migration = await switch_migration_service(force=force)
+        return JSONResponse(
+            status_code=200, content={"success": True, "migration": migration}
+        )
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Migration switch failed: {str(e)}"},
+        )
+
+
+@router.post("/migration/abort")
+async def abort_migration():
+    """Stop the migration and drop the version being backfilled"""
+    try:
+        migration = await abort_migration_service()
+        return JSONResponse(
+            status_code=200, content={"success": True, "migration": migration}
+        )
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Migration abort failed: {str(e)}"},
+        )
+
+
+@router.get("/jobs/stats")
+async def get_job_stats():
+    """Queued / running / finished detection jobs per priority"""
+    return JSONResponse(
+        status_code=200,
+        content={"success": True, "jobs": await get_job_stats_service()},
+    )
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a queued detection job, with the status of its image"""
+    try:
+        job = await get_job_service(job_id)
+        return JSONResponse(status_code=200, content={"success": True, "job": job})
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+
+
 @router.post("/detect")
-async def detect_faces(request: FaceDetectionRequest):
+async def detect_faces(request: DetectRequest):
     """Basic face detection without name suggestions"""
+    supplied_faces = (
+        [face.model_dump() for face in request.faces] if request.faces else None
+    )
     try:
-        start_time = time.time()
-        # Get image data from MongoDB
-        data = await get_image_data(id=request.image_id)
-        # Download the image file from Supabase
-        result = await download_file(file_key=data["file_key"])
-        if not result["success"]:
-            await update_image_status(
-                id=request.image_id, status=ImageStatusEnum.FAILED
-            )
-            raise HTTPException(status_code=404, detail=result["error"])
-        # Perform face detection
-        faces = await face_detection_service(local_path=result["local_path"])
-        # Save faces embedding data to Milvus
-        milvus_service = MilvusService()
-        for face in faces:
-            embedding = face.get("embedding")
-            if embedding:
-                milvus_id = milvus_service.save_face_embedding(embedding=embedding)
-                face["milvusId"] = milvus_id
-
-                # Update individual face in MongoDB
-                await update_image_faces(
-                    id=request.image_id,
-                    milvus_id=milvus_id,
-                    face_data={
-                        "milvusId": milvus_id,
-                        "bbox": face.get("bbox", []),
-                        "personId": face.get("personId", "unknown"),
-                    },
-                )
-        execution_time = round(time.time() - start_time, 4)
-        # Update status and execution_time in MongoDB
-        await update_image_status(
-            id=request.image_id,
-            status=ImageStatusEnum.DETECTED,
-            execution_time=execution_time,
-        )
+        # Malformed supplied faces are the caller's error, not the image's
+        validate_supplied_faces(request.mode, supplied_faces)
+    except HTTPException as http_exc:
         return JSONResponse(
-            status_code=200,
-            content={"success": True, "faces": faces, "execution_time": execution_time},
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    if request.queue:
+        # Job mode: answer now, a worker runs the detection
+        try:
+            job = await enqueue_detection_service(
+                image_id=request.image_id,
+                mode=request.mode,
+                faces=supplied_faces,
+                priority=request.priority,
+            )
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "success": True,
+                    "job_id": job["id"],
+                    "status": job["state"],
+                    "job": job,
+                },
+            )
+        except HTTPException as http_exc:
+            return JSONResponse(
+                status_code=http_exc.status_code,
+                content={"success": False, "error": str(http_exc.detail)},
+            )
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"success": False, "error": f"Enqueue failed: {str(e)}"},
+            )
+    try:
+        content = await detect_image_service(
+            image_id=request.image_id, mode=request.mode, faces=supplied_faces
         )
+        return JSONResponse(status_code=200, content=content)
     except HTTPException as http_exc:
         await update_image_status(id=request.image_id, status=ImageStatusEnum.FAILED)
         return JSONResponse(
@@ -87,3 +343,125 @@ async def detect_faces(request: FaceDetectionRequest):
                 "error": f"Face detection failed: {str(e)}",
             },
         )
+
+
+@router.post("/suggest-tags")
+async def suggest_tags(request: FaceDetectionRequest):
+    """Face detection with per-face name suggestions from already tagged faces"""
+    try:
+        start_time = time.time()
+        data = await get_image_data(id=request.image_id)
+        result = await download_file_bytes(file_key=data["file_key"])
+        if not result["success"]:
+            raise HTTPException(status_code=404, detail=result["error"])
+        faces = await face_detection_service(image=result["content"])
+        embedded_faces = [face for face in faces if face.get("embedding")]
+        # All faces in one search; the image's own stored faces don't vote
+        suggestions = await suggest_names_service(
+            embeddings=[face["embedding"] for face in embedded_faces],
+            playground_id=data.get("playground_id"),
+            exclude_ids=[face.get("milvusId") for face in data.get("faces", [])],
+        )
+        execution_time = round(time.time() - start_time, 4)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": True,
+                "message": f"Detected {len(embedded_faces)} faces with name suggestions",
+                "faces": [
+                    {
+                        "face_index": index,
+                        "bbox": face.get("bbox", []),
+                        "confidence": face.get("det_score"),
+                        "name_suggestions": name_suggestions,
+                        "embedding": face["embedding"],
+                    }
+                    for index, (face, name_suggestions) in enumerate(
+                        zip(embedded_faces, suggestions)
+                    )
+                ],
+                "total_faces": len(embedded_faces),
+                "execution_time": execution_time,
+            },
+        )
+    except HTTPException as http_exc:
+        return JSONResponse(
+            status_code=http_exc.status_code,
+            content={"success": False, "error": str(http_exc.detail)},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"Tag suggestion failed: {str(e)}"},
+        )
+
+
+@router.post("/detect/batch")
+async def detect_faces_batch(request: BatchFaceDetectionRequest):
+    """Face detection for many images through the staged pipeline"""
+    if len(request.image_ids) > BATCH_MAX_IMAGES:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": f"At most {BATCH_MAX_IMAGES} images per batch",
+            },
+        )
+    try:
+        result = await DetectionPipeline().run(request.image_ids)
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": result["summary"]["failed"] == 0,
+                "results": result["results"],
+                "summary": result["summary"],
+            },
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "error": f"Batch face detection failed: {str(e)}",
+            },
+        )
+
+
+@router.post("/detect/stream")
+async def detect_faces_stream(
+    request: BatchFaceDetectionRequest,
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+):
+    """Stream one line per persisted face/image, then a summary (NDJSON or SSE)"""
+    if len(request.image_ids) > BATCH_MAX_IMAGES:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": f"At most {BATCH_MAX_IMAGES} images per batch",
+            },
+        )
+
+    async def event_lines():
+        try:
+            async for event in stream_detection_events(request.image_ids):
+                yield _format_event(event, format)
+        except Exception as e:
+            yield _format_event(
+                {"type": "error", "error": f"Face detection failed: {str(e)}"},
+                format,
+            )
+
+    return StreamingResponse(
+        event_lines(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        # Ask reverse proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _format_event(event: dict, format: str) -> str:
+    data = json.dumps(event, separators=(",", ":"))
+    if format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Query
 from fastapi.responses import JSONResponse
 from typing import Optional
 import time
+from integrates.storage import get_storage_client
 from integrates.supabase import upload_file, download_file, get_presigned_url
 
 router = APIRouter()
@@ -57,3 +58,9 @@ async def generate_presigned_url_endpoint(
         raise HTTPException(
             status_code=500, detail=f"Presigned URL generation failed: {str(e)}"
         )
+
+
+@router.get("/stats")
+async def get_storage_stats():
+    """Download latencies and hedging counters of the shared storage client"""
+    return JSONResponse(status_code=200, content=get_storage_client().stats())
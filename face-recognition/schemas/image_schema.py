@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 
@@ -40,12 +40,106 @@ class ImageResponse(ImageBase):
         from_attributes = True
 
 
+class SuppliedFace(BaseModel):
+    """Schema for a caller-supplied face to embed without detection"""
+
+    kps: List[List[float]] = Field(
+        ..., description="Five [x, y] landmarks: eyes, nose, mouth corners"
+    )
+    bbox: Optional[List[float]] = Field(
+        None, description="Bounding box [x1, y1, x2, y2], derived from kps if empty"
+    )
+    det_score: Optional[float] = Field(1.0, description="Detection confidence")
+
+
 class FaceDetectionRequest(BaseModel):
     """Schema for face detection request"""
 
     image_id: str = Field(..., description="Image ID to process")
 
 
+class DetectRequest(FaceDetectionRequest):
+    """Schema for /detect with a per-request inference mode"""
+
+    mode: str = Field(
+        "full",
+        pattern="^(full|detect|embed)$",
+        description="full: detect + embed, detect: no embeddings, "
+        "embed: align and embed the supplied faces only",
+    )
+    faces: Optional[List[SuppliedFace]] = Field(
+        None, description="Faces to embed, required in embed mode"
+    )
+    queue: bool = Field(
+        False,
+        description="Answer 202 with a job id and detect in the background; "
+        "poll /jobs/{job_id} or the image status",
+    )
+    priority: str = Field(
+        "normal",
+        pattern="^(high|normal|low)$",
+        description="Queue priority, high jobs also have reserved workers",
+    )
+
+
+class BatchFaceDetectionRequest(BaseModel):
+    """Schema for batch face detection request"""
+
+    image_ids: List[str] = Field(..., min_length=1, description="Image IDs to process")
+
+
+class TagFaceRequest(BaseModel):
+    """Schema for tagging a detected face with a person"""
+
+    image_id: str = Field(..., description="Image ID the face belongs to")
+    milvus_id: str = Field(..., description="Vector ID of the face in Milvus")
+    person_id: Optional[str] = Field(
+        None, description="Person ID to tag the face with, empty to untag"
+    )
+
+
+class ReembedRequest(BaseModel):
+    """Schema for re-embedding stored face crops into another collection"""
+
+    collection_name: str = Field(
+        ...,
+        min_length=1,
+        description="Milvus collection to write the new embeddings to",
+    )
+    model_name: Optional[str] = Field(
+        None,
+        description="InsightFace model pack to embed with, defaults to the serving one",
+    )
+    batch_size: Optional[int] = Field(
+        None, ge=1, description="Crops per recognition call"
+    )
+
+
+class MigrationRequest(BaseModel):
+    """Schema for migrating the face collection to a new version"""
+
+    model_name: Optional[str] = Field(
+        None,
+        description="InsightFace model pack of the new version, a different one re-embeds the stored crops",
+    )
+    index_type: Optional[str] = Field(
+        None, description="Milvus index type of the new version"
+    )
+    index_params: Optional[Dict[str, Any]] = Field(
+        None, description="Index build params of the new version"
+    )
+    search_params: Optional[Dict[str, Any]] = Field(
+        None, description="Search params of the new version"
+    )
+    batch_size: Optional[int] = Field(None, ge=1, description="Rows per backfill batch")
+    max_rows_per_second: Optional[float] = Field(
+        None, ge=0, description="Backfill throttle, 0 disables it"
+    )
+    auto_switch: bool = Field(
+        False, description="Switch reads to the new version once it is backfilled"
+    )
+
+
 class FaceDetectionResponse(BaseModel):
     """Schema for face detection response"""
 
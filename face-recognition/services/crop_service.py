@@ -0,0 +1,224 @@
+import asyncio
+import time
+import numpy as np
+from fastapi import HTTPException
+from typing import Awaitable, Callable, Dict, List, Optional
+from core.config import (
+    CROP_STORE_BACKEND,
+    CROP_STORE_ENABLED,
+    CROP_STORE_REMOTE_PREFIX,
+    INSIGHTFACE_MODEL_NAME,
+    REEMBED_BATCH_SIZE,
+)
+from integrates.crop_store import CropStore, get_crop_store
+from integrates.milvus import EMBEDDING_DIM, MilvusClient, get_face_milvus_client
+from integrates.supabase import download_file_bytes, upload_object
+
+# Strong references to fire-and-forget uploads, the loop only keeps weak ones
+_background_tasks = set()
+# Status of the last re-embed job
+_reembed_job: Dict = {"state": "idle"}
+
+
+def _remote_key(store: CropStore, chunk: int) -> str:
+    return f"{CROP_STORE_REMOTE_PREFIX}/{store.chunk_name(chunk)}"
+
+
+async def upload_sealed_chunks() -> int:
+    """Mirror every sealed, not yet uploaded chunk to Supabase"""
+    store = get_crop_store()
+    uploaded = 0
+    for chunk in await asyncio.to_thread(store.pending_uploads):
+        content = await asyncio.to_thread(store.chunk_path(chunk).read_bytes)
+        result = await upload_object(_remote_key(store, chunk), content)
+        if not result["success"]:
+            print(f"Crop chunk {chunk} upload error: {result['error']}")
+            continue
+        await asyncio.to_thread(store.mark_uploaded, chunk)
+        uploaded += 1
+    return uploaded
+
+
+async def ensure_local_chunk(store: CropStore, chunk: int):
+    """Download a chunk that only exists in Supabase back to local disk"""
+    if store.chunk_path(chunk).exists():
+        return
+    if CROP_STORE_BACKEND != "supabase":
+        raise FileNotFoundError(f"Crop chunk {chunk} is missing locally")
+    # Chunks are ~150 MB, far slower than the images the hedge delay is for
+    result = await download_file_bytes(file_key=_remote_key(store, chunk), hedge=False)
+    if not result["success"]:
+        raise FileNotFoundError(f"Crop chunk {chunk}: {result['error']}")
+    await asyncio.to_thread(store.install_chunk, chunk, result["content"])
+
+
+async def save_face_crops_service(faces: List[Dict]) -> int:
+    """
+    Move the aligned crops out of detected faces into the crop store, keyed
+    by the faces' milvusId. Always strips crops so faces stay serializable;
+    a failed write is logged, detection results don't depend on it.
+    """
+    pairs = [
+        (face.get("milvusId"), crop)
+        for face in faces
+        if (crop := face.pop("crop", None)) is not None
+    ]
+    pairs = [(milvus_id, crop) for milvus_id, crop in pairs if milvus_id]
+    if not CROP_STORE_ENABLED or not pairs:
+        return 0
+    store = get_crop_store()
+    try:
+        sealed = await asyncio.to_thread(
+            store.put_many,
+            [milvus_id for milvus_id, _ in pairs],
+            np.stack([crop for _, crop in pairs]),
+        )
+    except Exception as e:
+        print(f"Save face crops error: {e}")
+        return 0
+    if sealed and CROP_STORE_BACKEND == "supabase":
+        task = asyncio.create_task(upload_sealed_chunks())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return len(pairs)
+
+
+async def reembed_crops(
+    store: CropStore,
+    embed: Callable[[np.ndarray], Awaitable[np.ndarray]],
+    write: Callable[[List[str], np.ndarray], Awaitable[int]],
+    batch_size: int = REEMBED_BATCH_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict:
+    """
+    Feed every stored crop, chunk by chunk, straight into `embed` and hand
+    the (ids, embeddings) batches to `write`: no download, decode or
+    detection. `progress(read, written)` is called after every batch.
+    """
+    read = written = 0
+    for chunk in await asyncio.to_thread(store.chunk_ids):
+        await ensure_local_chunk(store, chunk)
+        batches = store.iter_chunk(chunk, batch_size)
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            ids, crops = batch
+            embeddings = await embed(crops)
+            written += await write(ids, embeddings)
+            read += len(ids)
+            if progress is not None:
+                progress(read, written)
+    return {"crops": read, "written": written}
+
+
+async def embed_crops(model_name: str, crops: np.ndarray) -> np.ndarray:
+    """Embed aligned crops with a model's recognition-only sessions"""
+    from integrates.insightface import get_inference_engine
+
+    # No detector is loaded, the engine is created on first use
+    engine = await asyncio.to_thread(get_inference_engine, "embed", model_name)
+    faces = await asyncio.wrap_future(engine.submit_crops(crops))
+    embeddings = np.stack([face.embedding for face in faces])
+    if embeddings.shape[1] != EMBEDDING_DIM:
+        raise ValueError(
+            f"{model_name} embeds to {embeddings.shape[1]} dims, "
+            f"the collection schema has {EMBEDDING_DIM}"
+        )
+    return embeddings
+
+
+async def _run_reembed(job: Dict, model_name: str, target: MilvusClient):
+    source = get_face_milvus_client()
+
+    async def embed(crops: np.ndarray) -> np.ndarray:
+        return await embed_crops(model_name, crops)
+
+    async def write(ids: List[str], embeddings: np.ndarray) -> int:
+        metadata = await asyncio.to_thread(source.fetch_metadata, ids)
+        # Crops of faces deleted from Milvus since they were stored are skipped
+        keep = [i for i, face_id in enumerate(ids) if face_id in metadata]
+        return await asyncio.to_thread(
+            target.upsert_face_embeddings,
+            [ids[i] for i in keep],
+            embeddings[keep].tolist(),
+            metadata,
+        )
+
+    def progress(read: int, written: int):
+        elapsed = time.time() - job["started_at"]
+        job.update(
+            crops_done=read,
+            written=written,
+            skipped=read - written,
+            crops_per_second=round(read / elapsed, 2) if elapsed else 0.0,
+        )
+
+    try:
+        await reembed_crops(get_crop_store(), embed, write, job["batch_size"], progress)
+        job["state"] = "completed"
+    except Exception as e:
+        job.update(state="failed", error=str(e))
+    finally:
+        job["finished_at"] = time.time()
+
+
+async def start_reembed_service(
+    collection_name: str,
+    model_name: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> Dict:
+    """Start re-embedding every stored crop into another collection"""
+    global _reembed_job
+    if not CROP_STORE_ENABLED:
+        raise HTTPException(status_code=400, detail="Crop store is disabled")
+    if _reembed_job["state"] == "running":
+        raise HTTPException(status_code=409, detail="A re-embed job is running")
+    source = get_face_milvus_client()
+    target = MilvusClient(
+        collection_name=collection_name,
+        uri=source.uri,
+        token=source.token,
+        storage_mode=source.storage_mode,
+        local_stores=False,
+        alias=False,
+    )
+    if target.collection_name in (source.collection_name, source.physical_name):
+        raise HTTPException(
+            status_code=400,
+            detail="Re-embed into a new collection, not the one being served",
+        )
+
+    store = get_crop_store()
+    _reembed_job = {
+        "state": "running",
+        "model_name": model_name or INSIGHTFACE_MODEL_NAME,
+        "collection_name": target.collection_name,
+        "batch_size": batch_size or REEMBED_BATCH_SIZE,
+        "crops_total": await asyncio.to_thread(store.count),
+        "crops_done": 0,
+        "written": 0,
+        "skipped": 0,
+        "crops_per_second": 0.0,
+        "started_at": time.time(),
+        "finished_at": None,
+        "error": None,
+    }
+    task = asyncio.create_task(
+        _run_reembed(_reembed_job, _reembed_job["model_name"], target)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return dict(_reembed_job)
+
+
+async def get_crop_stats_service() -> Dict:
+    """Crop store sizes plus the progress of the last re-embed job"""
+    stats = {
+        "enabled": CROP_STORE_ENABLED,
+        "backend": CROP_STORE_BACKEND,
+        "reembed": dict(_reembed_job),
+    }
+    if CROP_STORE_ENABLED:
+        stats["store"] = await asyncio.to_thread(get_crop_store().stats)
+    return stats
@@ -1,15 +1,125 @@
 from fastapi import HTTPException
-from typing import List, Dict, Optional
-from integrates.insightface import face_detection
+import asyncio
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from core.config import DETECTION_CACHE_ENABLED, DETECTION_DECODE_MAX_SIDE
+from integrates.opencv import ImageInput, decode_image_reduced, load_image
+from integrates.detection import detection_profile, rescale_faces
+from integrates.detection_pool import detect_in_pool, get_pool_engine_stats
+from integrates.detection_cache import DetectionCache, get_detection_cache
+from services.migration_service import reembed_in_progress, serving_model_name
 
+FACE_MODES = ("full", "detect", "embed")
 
-async def face_detection_service(local_path: str) -> List[Dict]:
-    """Basic face detection without Milvus integration"""
+
+async def get_cached_faces(
+    image: ImageInput, mode: str = "full"
+) -> Tuple[Optional[str], Optional[List[Dict]]]:
+    """Cache key and cached faces for encoded bytes, (None, None) otherwise"""
+    if not DETECTION_CACHE_ENABLED or not isinstance(image, (bytes, bytearray)):
+        return None, None
+    # Embed-mode results depend on the supplied faces, not only the image
+    if mode == "embed":
+        return None, None
+    # Cached faces carry no aligned crop, which re-embed dual-writes need
+    if reembed_in_progress():
+        return None, None
+    # Encoded bytes are content-addressed, re-runs skip inference
+    cache_key = await asyncio.to_thread(
+        DetectionCache.make_key,
+        image,
+        serving_model_name(),
+        {**detection_profile(), "mode": mode},
+    )
+    faces = await asyncio.to_thread(get_detection_cache().get, cache_key)
+    return cache_key, faces
+
+
+async def decode_image_service(image: ImageInput) -> Tuple[np.ndarray, float]:
+    """Decode off the event loop, oversized JPEGs at reduced scale"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return await asyncio.to_thread(
+            decode_image_reduced, image, DETECTION_DECODE_MAX_SIDE
+        )
+    return await asyncio.to_thread(load_image, image), 1.0
+
+
+def validate_supplied_faces(mode: str, faces: Optional[List[Dict]]):
+    """Embed mode needs 5-point keypoints per face, the other modes none"""
+    if mode not in FACE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
+    if mode != "embed":
+        if faces:
+            raise HTTPException(
+                status_code=400, detail="faces can only be supplied in embed mode"
+            )
+        return
+    if not faces:
+        raise HTTPException(status_code=400, detail="Embed mode requires faces")
+    for index, face in enumerate(faces):
+        kps = np.asarray(face.get("kps") or [], dtype=np.float32)
+        if kps.shape != (5, 2):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Face {index} needs kps as 5 [x, y] points",
+            )
+        bbox = face.get("bbox")
+        if bbox is not None and len(bbox) != 4:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Face {index} bbox must be [x1, y1, x2, y2]",
+            )
+
+
+async def detect_decoded_service(
+    img: np.ndarray,
+    cache_key: Optional[str] = None,
+    scale: float = 1.0,
+    mode: str = "full",
+    faces: Optional[List[Dict]] = None,
+) -> List[Dict]:
+    """Detect in the process pool, map boxes to original pixels, fill the cache"""
+    if faces is not None and scale != 1.0:
+        # Supplied faces are in original pixels, the decode may be reduced
+        faces = rescale_faces([dict(face) for face in faces], 1.0 / scale)
+    faces = rescale_faces(
+        await detect_in_pool(img, mode, faces, serving_model_name()), scale
+    )
+    if cache_key is not None:
+        # Aligned crops go to the crop store once, never into the cache
+        cached = [{k: v for k, v in face.items() if k != "crop"} for face in faces]
+        await asyncio.to_thread(get_detection_cache().put, cache_key, cached)
+    return faces
+
+
+async def face_detection_service(
+    image: ImageInput, mode: str = "full", faces: Optional[List[Dict]] = None
+) -> List[Dict]:
+    """
+    Basic face detection without Milvus integration. `mode` detect skips
+    recognition, embed skips detection and embeds the supplied `faces`.
+    """
+    validate_supplied_faces(mode, faces)
     try:
-        # Face detection using InsightFace
-        faces = face_detection(local_path)
-        if not faces:
+        cache_key, detected = await get_cached_faces(image, mode)
+        if detected is None:
+            img, scale = await decode_image_service(image)
+            detected = await detect_decoded_service(img, cache_key, scale, mode, faces)
+
+        if not detected:
             raise HTTPException(status_code=404, detail="No faces detected")
-        return faces
+        return detected
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Face detection failed: {str(e)}")
+
+
+async def get_engine_stats_service() -> Dict:
+    """Report batch-size/wait knobs and occupancy stats of the inference engine"""
+    return await get_pool_engine_stats()
+
+
+def get_cache_stats_service() -> Dict:
+    """Report hit/miss counters and tier sizes of the detection cache"""
+    return get_detection_cache().get_stats()
@@ -0,0 +1,393 @@
+"""
+Detection as a job: the /detect unit of work, run inline or from the queue.
+
+Detections of one image are single-flight. Concurrent calls in this process
+share one run, and a processing lease on the image document extends that to
+other workers: a caller that finds the lease held waits for the holder and
+returns what it stored. Faces get deterministic milvus ids and are upserted,
+so even a detection that does run twice never duplicates vectors.
+
+Queued requests are answered with 202 and a job id; a pool of workers drains
+the durable queue by priority and mirrors each job's progress into the image
+document's status (queued -> processing -> detected / failed), which is what
+clients poll. Reserved workers only take high-priority jobs, so a short
+request never waits behind a backlog of long ones.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from core.config import (
+    DETECTION_LEASE_POLL_SECONDS,
+    DETECTION_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RESERVED_WORKERS,
+    JOB_RETENTION_SECONDS,
+    JOB_WORKERS,
+)
+from enums.images_enum import ImageStatusEnum
+from integrates.job_queue import JobConflictError, get_job_queue
+from integrates.milvus import face_ids_for_image
+from integrates.supabase import download_file_bytes
+from services.crop_service import save_face_crops_service
+from services.face_service import face_detection_service, validate_supplied_faces
+from services.migration_service import (
+    dual_write_deletes_service,
+    dual_write_service,
+    dual_write_tags_service,
+)
+from services.milvus_service import MilvusService
+from services.mongo_service import (
+    acquire_detection_lease,
+    get_detection_state,
+    get_image_data,
+    release_detection_lease,
+    renew_detection_lease,
+    save_detection_results,
+    update_image_job,
+    update_image_status,
+)
+from services.suggestion_service import forget_redetected_faces_service
+
+# Idle workers look for jobs at least this often, enqueue wakes them sooner
+POLL_SECONDS = 1.0
+
+_workers: List[asyncio.Task] = []
+_job_available: Optional[asyncio.Condition] = None
+# Running detections by (image_id, mode, supplied faces)
+_in_flight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+# Lease owners are unique per detection, prefixed with where it runs
+_LEASE_OWNER_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _detect_image(
+    image_id: str, mode: str = "full", faces: Optional[List[Dict]] = None
+) -> Dict:
+    """Download, detect, store in Milvus and persist the faces of one image"""
+    start_time = time.time()
+    # Get image data from MongoDB
+    data = await get_image_data(id=image_id)
+    # Download the image file from Supabase
+    result = await download_file_bytes(file_key=data["file_key"])
+    if not result["success"]:
+        await update_image_status(id=image_id, status=ImageStatusEnum.FAILED)
+        raise HTTPException(status_code=404, detail=result["error"])
+    # Perform face detection
+    detected = await face_detection_service(
+        image=result["content"], mode=mode, faces=faces
+    )
+    if mode == "detect":
+        # Detection-only: nothing to store without embeddings
+        return {
+            "success": True,
+            "mode": mode,
+            "faces": detected,
+            "faces_count": len(detected),
+            "execution_time": round(time.time() - start_time, 4),
+        }
+    # Save all faces embedding data to Milvus in one insert
+    embedded_faces = [face for face in detected if face.get("embedding")]
+    milvus_ids = await MilvusService().save_face_embeddings(
+        embeddings=[face["embedding"] for face in embedded_faces],
+        playground_id=data.get("playground_id"),
+        image_id=image_id,
+        user_id=data.get("user_id"),
+        face_ids=face_ids_for_image(image_id, len(embedded_faces)),
+    )
+    for face, milvus_id in zip(embedded_faces, milvus_ids):
+        face["milvusId"] = milvus_id
+    await dual_write_service(
+        embedded_faces,
+        playground_id=data.get("playground_id"),
+        image_id=image_id,
+        user_id=data.get("user_id"),
+    )
+    await save_face_crops_service(detected)
+    execution_time = round(time.time() - start_time, 4)
+    # Save faces, status and execution_time to MongoDB in one write
+    saved = await save_detection_results(
+        id=image_id,
+        faces_data=[
+            {
+                "milvusId": face["milvusId"],
+                "bbox": face.get("bbox", []),
+                "personId": face.get("personId", "unknown"),
+            }
+            for face in embedded_faces
+        ],
+        status=ImageStatusEnum.DETECTED,
+        execution_time=execution_time,
+    )
+    # Tags carried over to re-detected faces (the upsert reset person_id),
+    # faces no longer detected leave both versions
+    await MilvusService().set_face_person_ids(saved["person_ids"])
+    await dual_write_tags_service(saved["person_ids"])
+    await MilvusService().delete_faces(saved["removed_ids"], data.get("playground_id"))
+    await dual_write_deletes_service(saved["removed_ids"])
+    await forget_redetected_faces_service(
+        data.get("playground_id"),
+        [face["milvusId"] for face in embedded_faces] + saved["removed_ids"],
+    )
+    # The faces as stored, with their carried tags: the same a caller that
+    # coalesced onto this detection reads back from the image
+    return {
+        "success": True,
+        "mode": mode,
+        "faces": saved["faces"],
+        "faces_count": len(saved["faces"]),
+        "execution_time": execution_time,
+    }
+
+
+async def _keep_lease(image_id: str, owner: str):
+    while True:
+        await asyncio.sleep(DETECTION_LEASE_SECONDS / 3)
+        try:
+            if not await renew_detection_lease(
+                image_id, owner, DETECTION_LEASE_SECONDS
+            ):
+                print(f"Detection lease of {image_id} was taken over")
+                return
+        except Exception as e:
+            print(f"Detection lease renew error: {e}")
+
+
+async def _wait_for_lease(image_id: str, lease: Dict) -> Optional[Dict]:
+    """Poll until the lease is released (the image's state) or expires (None)"""
+    while True:
+        await asyncio.sleep(DETECTION_LEASE_POLL_SECONDS)
+        state = await get_detection_state(image_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        current = state.get("processingLease")
+        if current is None or current.get("owner") != lease["owner"]:
+            return state
+        if current["expiresAt"] < datetime.utcnow():
+            return None
+
+
+async def _detect_leased(image_id: str, mode: str, faces: Optional[List[Dict]]) -> Dict:
+    if mode == "detect":
+        # Nothing is stored, there is no result another worker could share
+        return await _detect_image(image_id, mode, faces)
+    owner = f"{_LEASE_OWNER_PREFIX}:{uuid.uuid4().hex}"
+    while True:
+        acquired, lease = await acquire_detection_lease(
+            image_id, owner, mode, DETECTION_LEASE_SECONDS
+        )
+        if acquired:
+            break
+        state = await _wait_for_lease(image_id, lease)
+        if (
+            state is not None
+            and lease.get("mode") == mode
+            and state.get("status") == ImageStatusEnum.DETECTED
+        ):
+            # Another worker just detected this image, share its stored faces
+            stored = state.get("faces", [])
+            return {
+                "success": True,
+                "mode": mode,
+                "faces": stored,
+                "faces_count": len(stored),
+                "execution_time": state.get("executionTime"),
+                "coalesced": True,
+            }
+        # Expired, failed or another mode: take the lease and run it here
+
+    renew = asyncio.create_task(_keep_lease(image_id, owner))
+    try:
+        return await _detect_image(image_id, mode, faces)
+    finally:
+        renew.cancel()
+        try:
+            await release_detection_lease(image_id, owner)
+        except Exception as e:
+            print(f"Detection lease release error: {e}")
+
+
+def _forget(key: Tuple[str, str, str], task: asyncio.Task):
+    _in_flight.pop(key, None)
+    # Callers may all have gone, the outcome must still count as retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+async def detect_image_service(
+    image_id: str, mode: str = "full", faces: Optional[List[Dict]] = None
+) -> Dict:
+    """
+    Detect and store the faces of one image. A call for an image whose same
+    detection is already running awaits that run instead of starting one.
+    """
+    key = (image_id, mode, json.dumps(faces, sort_keys=True))
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_detect_leased(image_id, mode, faces))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _forget(key, done))
+        # A disconnecting first caller must not cancel the others' run
+        return await asyncio.shield(task)
+    return {**await asyncio.shield(task), "coalesced": True}
+
+
+def _condition() -> asyncio.Condition:
+    global _job_available
+    if _job_available is None:
+        _job_available = asyncio.Condition()
+    return _job_available
+
+
+async def enqueue_detection_service(
+    image_id: str,
+    mode: str = "full",
+    faces: Optional[List[Dict]] = None,
+    priority: str = "normal",
+) -> Dict:
+    """
+    Queue detection of an image; an image already queued keeps its job, 409
+    when that job detects with another mode or faces
+    """
+    validate_supplied_faces(mode, faces)
+    # Unknown or malformed ids fail now, not in a worker
+    await get_image_data(id=image_id)
+    try:
+        job = await asyncio.to_thread(
+            get_job_queue().enqueue, image_id, {"mode": mode, "faces": faces}, priority
+        )
+    except JobConflictError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{e}, with another mode or faces: wait for it to finish",
+        )
+    if job["state"] == "queued":
+        await update_image_job(image_id, job["id"], ImageStatusEnum.QUEUED)
+        async with _condition():
+            _condition().notify_all()
+    return job
+
+
+def _job_result(result: Dict) -> Dict:
+    # Embeddings are in Milvus, the job row only keeps what clients display
+    return {
+        **result,
+        "faces": [
+            {key: value for key, value in face.items() if key != "embedding"}
+            for face in result["faces"]
+        ],
+    }
+
+
+async def _run_job(job: Dict):
+    queue = get_job_queue()
+    image_id = job["image_id"]
+    try:
+        await update_image_job(image_id, job["id"], ImageStatusEnum.PROCESSING)
+        result = await detect_image_service(
+            image_id, job["payload"]["mode"], job["payload"]["faces"]
+        )
+        await asyncio.to_thread(queue.complete, job["id"], _job_result(result))
+    except Exception as e:
+        error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+        # Client errors (bad id, no faces) fail the same way every time
+        client_error = isinstance(e, HTTPException) and e.status_code < 500
+        retry = not client_error and job["attempts"] < JOB_MAX_ATTEMPTS
+        await asyncio.to_thread(queue.fail, job["id"], error, retry)
+        try:
+            await update_image_job(
+                image_id,
+                job["id"],
+                ImageStatusEnum.QUEUED if retry else ImageStatusEnum.FAILED,
+                error=error,
+            )
+        except HTTPException:
+            pass
+
+
+async def _work(min_priority: str):
+    queue = get_job_queue()
+    while True:
+        try:
+            job = await asyncio.to_thread(queue.claim, min_priority)
+        except Exception as e:
+            print(f"Job queue claim error: {e}")
+            job = None
+        if job is None:
+            async with _condition():
+                try:
+                    await asyncio.wait_for(_condition().wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            continue
+        try:
+            await _run_job(job)
+        except Exception as e:
+            # The job stays running and is requeued on the next start
+            print(f"Detection job {job['id']} error: {e}")
+
+
+def _reserved_workers() -> int:
+    # At least one worker must take normal and low priority jobs
+    return max(min(JOB_RESERVED_WORKERS, JOB_WORKERS - 1), 0)
+
+
+async def start_job_workers():
+    """Requeue jobs interrupted by the last shutdown and start the workers"""
+    queue = get_job_queue()
+    requeued, failed = await asyncio.to_thread(queue.requeue_running)
+    if requeued:
+        print(f"Requeued {requeued} interrupted detection jobs")
+    for job in failed:
+        print(f"Detection job {job['id']} failed after {job['attempts']} attempts")
+        try:
+            await update_image_job(
+                job["image_id"], job["id"], ImageStatusEnum.FAILED, error=job["error"]
+            )
+        except HTTPException:
+            pass
+    await asyncio.to_thread(queue.prune, time.time() - JOB_RETENTION_SECONDS)
+    reserved = _reserved_workers()
+    for index in range(JOB_WORKERS):
+        min_priority = "high" if index < reserved else "low"
+        _workers.append(asyncio.create_task(_work(min_priority)))
+
+
+async def stop_job_workers():
+    """Cancel the workers; their running jobs are requeued on next start"""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def get_job_service(job_id: str) -> Dict:
+    """A job with the status of its image document"""
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        image = await get_image_data(id=job["image_id"])
+        job["image_status"] = image.get("status")
+    except HTTPException:
+        # The image was deleted after its job ran
+        job["image_status"] = None
+    return job
+
+
+async def get_job_stats_service() -> Dict:
+    """Queue depth per state and priority, plus the worker layout"""
+    stats = await asyncio.to_thread(get_job_queue().stats)
+    stats["workers"] = {
+        "running": len(_workers),
+        "configured": JOB_WORKERS,
+        "high_priority_only": _reserved_workers(),
+    }
+    return stats
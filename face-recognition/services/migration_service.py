@@ -0,0 +1,438 @@
+"""
+Zero-downtime migration of the face collection to a new version.
+
+A migration creates <name>_vN next to the serving version and backfills it
+in throttled background batches: re-embedded from the aligned crop store
+when the recognition model changes, copied row by row when only the index
+changes. Until the switch, every newly stored face is also written to the
+new version (dual-write). Switching re-points the collection alias in one
+Milvus call, so reads move over atomically; the previous version is kept
+for rollback until it is dropped.
+"""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from core.config import (
+    CROP_STORE_ENABLED,
+    INSIGHTFACE_MODEL_NAME,
+    MIGRATION_BATCH_SIZE,
+    MIGRATION_MAX_ROWS_PER_SECOND,
+    MIGRATION_STATE_PATH,
+)
+from integrates.centroid_index import get_centroid_index
+from integrates.crop_store import get_crop_store
+from integrates.milvus import EMBEDDING_DIM, MilvusClient, get_face_milvus_client
+from services.crop_service import embed_crops, reembed_crops
+
+# States in which new faces are written to both versions
+DUAL_WRITE_STATES = ("backfilling", "ready")
+# Image ids of uncovered faces listed in the status, the counts are exact
+UNCOVERED_IMAGES_SHOWN = 100
+
+
+def _load_state() -> Dict[str, Any]:
+    path = Path(MIGRATION_STATE_PATH)
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"state": "idle"}
+
+
+_state: Dict[str, Any] = _load_state()
+_target: Optional[MilvusClient] = None
+_backfill_task: Optional[asyncio.Task] = None
+
+
+def _save_state():
+    path = Path(MIGRATION_STATE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".part")
+    partial.write_text(json.dumps(_state))
+    partial.replace(path)
+
+
+def serving_model_name() -> str:
+    """Recognition model the serving version's embeddings come from"""
+    return _state.get("serving_model") or INSIGHTFACE_MODEL_NAME
+
+
+def reembed_in_progress() -> bool:
+    """Dual-writes of this migration need every new face's aligned crop"""
+    return _state.get("state") in DUAL_WRITE_STATES and _state.get("reembed", False)
+
+
+def _target_client() -> MilvusClient:
+    global _target
+    if _target is None or _target.collection_name != _state["target"]:
+        source = get_face_milvus_client()
+        _target = MilvusClient(
+            collection_name=_state["target"],
+            index_type=_state.get("index_type"),
+            index_params=_state.get("index_params"),
+            search_params=_state.get("search_params"),
+            uri=source.uri,
+            token=source.token,
+            storage_mode=source.storage_mode,
+            local_stores=False,
+            alias=False,
+        )
+    return _target
+
+
+def _record_progress(rows: int, written: int):
+    elapsed = time.time() - _state["started_at"]
+    _state["rows_done"] += rows
+    _state["written"] += written
+    _state["rows_per_second"] = (
+        round(_state["rows_done"] / elapsed, 2) if elapsed else 0.0
+    )
+    remaining = max(_state["rows_total"] - _state["rows_done"], 0)
+    _state["eta_seconds"] = (
+        round(remaining / _state["rows_per_second"], 1)
+        if _state["rows_per_second"]
+        else None
+    )
+
+
+async def _throttle():
+    """Sleep until the average rate is back under the configured maximum"""
+    max_rate = _state.get("max_rows_per_second") or 0
+    if max_rate <= 0:
+        return
+    ahead = _state["rows_done"] / max_rate - (time.time() - _state["started_at"])
+    if ahead > 0:
+        await asyncio.sleep(ahead)
+
+
+async def _backfill_reembed(target: MilvusClient):
+    source = get_face_milvus_client()
+
+    async def embed(crops: np.ndarray) -> np.ndarray:
+        return await embed_crops(_state["model_name"], crops)
+
+    async def write(ids: List[str], embeddings: np.ndarray) -> int:
+        metadata = await asyncio.to_thread(source.fetch_metadata, ids)
+        # Crops of faces deleted from Milvus since they were stored are skipped
+        keep = [i for i, face_id in enumerate(ids) if face_id in metadata]
+        written = await asyncio.to_thread(
+            target.upsert_face_embeddings,
+            [ids[i] for i in keep],
+            embeddings[keep].tolist(),
+            metadata,
+        )
+        _record_progress(len(ids), written)
+        await asyncio.to_thread(_save_state)
+        await _throttle()
+        return written
+
+    await reembed_crops(get_crop_store(), embed, write, _state["batch_size"])
+
+
+async def _backfill_copy(target: MilvusClient):
+    source = get_face_milvus_client()
+    batches = source.iter_rows(_state["batch_size"])
+    try:
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            ids, embeddings, metadata = batch
+            written = await asyncio.to_thread(
+                target.upsert_face_embeddings, ids, embeddings, metadata
+            )
+            _record_progress(len(ids), written)
+            await asyncio.to_thread(_save_state)
+            await _throttle()
+    finally:
+        batches.close()
+
+
+async def _check_coverage(target: MilvusClient, redetect: bool = False) -> int:
+    """
+    Re-embedding only reaches faces with a stored crop: faces stored before
+    CROP_STORE_ENABLED or served from the detection cache are missing from
+    the new version until their images are detected again, which writes
+    their crops to both versions.
+    """
+    source = get_face_milvus_client()
+    missing = await asyncio.to_thread(
+        source.faces_missing_from, target, _state["batch_size"]
+    )
+    image_ids = sorted({image_id for image_id in missing.values() if image_id})
+    _state.update(
+        uncovered_faces=len(missing),
+        uncovered_images=len(image_ids),
+        uncovered_image_ids=image_ids[:UNCOVERED_IMAGES_SHOWN],
+    )
+    if redetect and image_ids:
+        # Imported here: the job service writes through this module
+        from services.job_service import enqueue_detection_service
+
+        queued = 0
+        for image_id in image_ids:
+            try:
+                await enqueue_detection_service(image_id, priority="low")
+                queued += 1
+            except Exception as e:
+                print(f"Re-detection of {image_id} not queued: {e}")
+        _state["redetections_queued"] = queued
+    await asyncio.to_thread(_save_state)
+    return len(missing)
+
+
+async def _run_backfill():
+    target = _target_client()
+    try:
+        # Creates the new version with its index on first use
+        await asyncio.to_thread(target._ensure_ready)
+        if _state["reembed"]:
+            await _backfill_reembed(target)
+        else:
+            await _backfill_copy(target)
+        await asyncio.to_thread(target.collection.flush)
+        uncovered = (
+            await _check_coverage(target, redetect=True) if _state["reembed"] else 0
+        )
+        _state.update(state="ready", backfilled_at=time.time())
+        await asyncio.to_thread(_save_state)
+        # Uncovered faces wait for their re-detection and a manual switch
+        if _state.get("auto_switch") and not uncovered:
+            await switch_migration_service()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        _state.update(state="failed", error=str(e) or type(e).__name__)
+        await asyncio.to_thread(_save_state)
+
+
+def _start_backfill():
+    global _backfill_task
+    _state.update(
+        state="backfilling",
+        rows_done=0,
+        written=0,
+        rows_per_second=0.0,
+        eta_seconds=None,
+        started_at=time.time(),
+        error=None,
+    )
+    _save_state()
+    _backfill_task = asyncio.create_task(_run_backfill())
+
+
+async def start_migration_service(
+    model_name: Optional[str] = None,
+    index_type: Optional[str] = None,
+    index_params: Optional[Dict[str, Any]] = None,
+    search_params: Optional[Dict[str, Any]] = None,
+    batch_size: Optional[int] = None,
+    max_rows_per_second: Optional[float] = None,
+    auto_switch: bool = False,
+) -> Dict:
+    """Create the next collection version and start backfilling it"""
+    if _state.get("state") in DUAL_WRITE_STATES:
+        raise HTTPException(
+            status_code=409, detail=f"Migration to {_state['target']} in progress"
+        )
+    model_name = model_name or serving_model_name()
+    reembed = model_name != serving_model_name()
+    if reembed and not CROP_STORE_ENABLED:
+        raise HTTPException(
+            status_code=400,
+            detail="Changing the recognition model re-embeds stored crops, "
+            "enable CROP_STORE_ENABLED first",
+        )
+    if not reembed and not (index_type or index_params or search_params):
+        raise HTTPException(
+            status_code=400, detail="Nothing to migrate: same model and index"
+        )
+
+    source = get_face_milvus_client()
+    # Versioning needs the alias, a pre-versioning collection becomes _v1
+    await asyncio.to_thread(source.adopt_legacy)
+    target = await asyncio.to_thread(source.next_version)
+    source_rows = await asyncio.to_thread(lambda: source.collection.num_entities)
+    rows_total = (
+        await asyncio.to_thread(get_crop_store().count) if reembed else source_rows
+    )
+
+    _state.clear()
+    _state.update(
+        source=source.physical_name,
+        target=target,
+        alias=source.collection_name,
+        source_model=serving_model_name(),
+        serving_model=serving_model_name(),
+        model_name=model_name,
+        reembed=reembed,
+        index_type=index_type or source.index_config["index_type"],
+        index_params=index_params,
+        search_params=search_params,
+        batch_size=batch_size or MIGRATION_BATCH_SIZE,
+        max_rows_per_second=(
+            MIGRATION_MAX_ROWS_PER_SECOND
+            if max_rows_per_second is None
+            else max_rows_per_second
+        ),
+        auto_switch=auto_switch,
+        rows_total=rows_total,
+        source_rows=source_rows,
+        # Faces without a crop can't be re-embedded, checked after the backfill
+        uncovered_faces=max(source_rows - rows_total, 0) if reembed else 0,
+        dual_writes=0,
+        dual_write_errors=0,
+        created_at=time.time(),
+    )
+    _start_backfill()
+    return get_migration_status_service()
+
+
+async def dual_write_service(
+    faces: List[Dict],
+    playground_id: Optional[str] = None,
+    image_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+):
+    """
+    Write newly stored faces to the version being backfilled too. A failure
+    is counted, not raised: the serving version already has the faces.
+    """
+    if _state.get("state") not in DUAL_WRITE_STATES:
+        return
+    faces = [face for face in faces if face.get("milvusId")]
+    if _state["reembed"]:
+        faces = [face for face in faces if face.get("crop") is not None]
+    if not faces:
+        return
+    ids = [face["milvusId"] for face in faces]
+    metadata = {
+        face["milvusId"]: {
+            "playground_id": playground_id or "",
+            "image_id": image_id or "",
+            "user_id": user_id or "",
+            "person_id": face.get("personId") or "unknown",
+        }
+        for face in faces
+    }
+    try:
+        if _state["reembed"]:
+            embeddings = (
+                await embed_crops(
+                    _state["model_name"], np.stack([face["crop"] for face in faces])
+                )
+            ).tolist()
+        else:
+            embeddings = [face["embedding"] for face in faces]
+        await asyncio.to_thread(
+            _target_client().upsert_face_embeddings, ids, embeddings, metadata
+        )
+        _state["dual_writes"] += len(ids)
+    except Exception as e:
+        print(f"Dual-write to {_state['target']} error: {e}")
+        _state["dual_write_errors"] += len(ids)
+
+
+async def dual_write_tags_service(person_ids: Dict[str, Optional[str]]):
+    """Mirror face tags into the version being backfilled, like dual-writes"""
+    if _state.get("state") not in DUAL_WRITE_STATES or not person_ids:
+        return
+    try:
+        await asyncio.to_thread(
+            _target_client().update_metadata,
+            {
+                face_id: {"person_id": person_id or "unknown"}
+                for face_id, person_id in person_ids.items()
+            },
+        )
+    except Exception as e:
+        print(f"Tag dual-write to {_state['target']} error: {e}")
+        _state["dual_write_errors"] += len(person_ids)
+
+
+async def dual_write_deletes_service(face_ids: List[str]):
+    """Delete faces from the version being backfilled too, like dual-writes"""
+    if _state.get("state") not in DUAL_WRITE_STATES or not face_ids:
+        return
+    try:
+        await asyncio.to_thread(_target_client().delete_faces, face_ids)
+    except Exception as e:
+        print(f"Delete dual-write to {_state['target']} error: {e}")
+        _state["dual_write_errors"] += len(face_ids)
+
+
+async def switch_migration_service(force: bool = False) -> Dict:
+    """
+    Point the alias at the backfilled version, reads move over atomically.
+    A re-embedded version missing faces of the serving one is only switched
+    to with force, which drops those faces from search.
+    """
+    if _state.get("state") != "ready":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Migration is {_state.get('state')}, not ready to switch",
+        )
+    target = _target_client()
+    source = get_face_milvus_client()
+    await asyncio.to_thread(target.collection.flush)
+    if _state["reembed"]:
+        uncovered = await _check_coverage(target)
+        if uncovered and not force:
+            raise HTTPException(
+                status_code=409,
+                detail=f"{uncovered} faces of {_state['uncovered_images']} images "
+                f"have no crop and are missing from {_state['target']}: wait for "
+                "their re-detection or switch with force to drop them",
+            )
+    await asyncio.to_thread(
+        source.switch_version, _state["target"], target.index_config
+    )
+    if _state["reembed"]:
+        # Person centroids were averaged from the previous model's embeddings
+        get_centroid_index(EMBEDDING_DIM).invalidate()
+    _state.update(
+        state="switched", serving_model=_state["model_name"], switched_at=time.time()
+    )
+    await asyncio.to_thread(_save_state)
+    return get_migration_status_service()
+
+
+async def abort_migration_service() -> Dict:
+    """Stop a migration before the switch and drop the unfinished version"""
+    global _backfill_task
+    if _state.get("state") not in (*DUAL_WRITE_STATES, "failed"):
+        raise HTTPException(status_code=409, detail="No migration to abort")
+    if _backfill_task is not None and not _backfill_task.done():
+        _backfill_task.cancel()
+        await asyncio.gather(_backfill_task, return_exceptions=True)
+    _backfill_task = None
+    _state["state"] = "aborted"
+    await asyncio.to_thread(_save_state)
+    try:
+        await asyncio.to_thread(get_face_milvus_client().drop_version, _state["target"])
+    except Exception as e:
+        _state["error"] = f"Drop {_state['target']} failed: {e}"
+        await asyncio.to_thread(_save_state)
+    return get_migration_status_service()
+
+
+async def resume_migration():
+    """Restart an interrupted backfill; upserts make repeating batches harmless"""
+    if _state.get("state") == "backfilling" and _backfill_task is None:
+        _start_backfill()
+
+
+def get_migration_status_service() -> Dict:
+    """Versions, progress, throughput and dual-write counters of the migration"""
+    status = dict(_state)
+    status["serving_model"] = serving_model_name()
+    if status.get("rows_total"):
+        status["progress"] = round(
+            min(status.get("rows_done", 0) / status["rows_total"], 1.0), 4
+        )
+    return status
@@ -3,20 +3,156 @@ Service layer for face tagging using Milvus vector database
 Simple face similarity search for name suggestion
 """
 
+import asyncio
 from typing import List, Dict, Optional
-from integrates.milvus import (
-    get_face_milvus_client,
-    save_face_to_milvus,
-)
+from fastapi import HTTPException
+from integrates.milvus import get_face_milvus_client
+from integrates.milvus_async import get_async_milvus_client
+from services.mongo_service import get_playground_milvus_ids
 
 
 class MilvusService:
     def __init__(self):
         self.milvus_client = get_face_milvus_client()
+        self.async_client = get_async_milvus_client()
 
-    def save_face_embedding(
+    async def save_face_embedding(
         self,
         embedding: List[float],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
     ) -> str:
         """Save a single face embedding to Milvus and return milvus_id"""
-        return save_face_to_milvus(embedding)
+        milvus_ids = await self.save_face_embeddings(
+            [embedding], playground_id, image_id=image_id, user_id=user_id
+        )
+        return milvus_ids[0]
+
+    async def save_face_embeddings(
+        self,
+        embeddings: List[List[float]],
+        playground_id: Optional[str] = None,
+        image_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        face_ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        Save all face embeddings of an image in one write and return
+        milvus_ids; given face_ids are upserted instead of inserted
+        """
+        return await self.async_client.save_face_embeddings(
+            embeddings,
+            playground_id,
+            image_id=image_id,
+            user_id=user_id,
+            face_ids=face_ids,
+        )
+
+    async def search_similar_faces(
+        self,
+        embedding: List[float],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[Dict]:
+        """Similar faces from the local playground index, or Milvus on a miss"""
+        return await self.async_client.search_similar_faces(
+            embedding, limit, playground_id, filter
+        )
+
+    async def search_similar_faces_batch(
+        self,
+        embeddings: List[List[float]],
+        limit: int = 5,
+        playground_id: Optional[str] = None,
+        filter: Optional[str] = None,
+    ) -> List[List[Dict]]:
+        """Similar faces for every face of an image in a single search call"""
+        return await self.async_client.search_similar_faces_batch(
+            embeddings, limit, playground_id, filter
+        )
+
+    async def warm_playground_cache(self, playground_id: str) -> Dict:
+        """Load every embedding of a playground into the local vector cache"""
+        vector_cache = self.milvus_client.vector_cache
+        if vector_cache is None:
+            raise HTTPException(status_code=400, detail="Vector cache is disabled")
+
+        await self.async_client.ensure_ready()
+        # Inserts from here on are replayed into the snapshot read below
+        started_at = vector_cache.begin_warm(playground_id)
+        try:
+            if self.milvus_client.has_metadata:
+                # Read the playground's partition directly
+                embeddings = await asyncio.to_thread(
+                    self.milvus_client.fetch_playground_embeddings, playground_id
+                )
+                milvus_ids = list(embeddings)
+            else:
+                milvus_ids = await get_playground_milvus_ids(playground_id)
+                embeddings = await asyncio.to_thread(
+                    self.milvus_client.fetch_embeddings, milvus_ids
+                )
+        except Exception:
+            vector_cache.end_warm(playground_id, started_at)
+            raise
+        face_ids = [face_id for face_id in milvus_ids if face_id in embeddings]
+        # Also trains the IVF lists of a large playground, in this thread
+        cached = await asyncio.to_thread(
+            vector_cache.load,
+            playground_id,
+            face_ids,
+            [embeddings[face_id] for face_id in face_ids],
+            started_at,
+        )
+        return {
+            "playground_id": playground_id,
+            "faces": len(face_ids),
+            "missing": len(milvus_ids) - len(face_ids),
+            "cached": cached,
+        }
+
+    def get_vector_cache_stats(self) -> Dict:
+        """Hit/miss counters and per-playground index sizes"""
+        vector_cache = self.milvus_client.vector_cache
+        if vector_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **vector_cache.get_stats()}
+
+    def get_readiness(self) -> Dict:
+        """
+        Readiness of the Milvus layer. Only reports: the one-time load is
+        started (and retried) by start_milvus, never by the probe.
+        """
+        return self.async_client.status()
+
+    async def fetch_embeddings(self, face_ids: List[str]) -> Dict[str, List[float]]:
+        """Stored embeddings by milvus id"""
+        await self.async_client.ensure_ready()
+        return await asyncio.to_thread(self.milvus_client.fetch_embeddings, face_ids)
+
+    async def set_face_person_ids(self, person_ids: Dict[str, Optional[str]]) -> int:
+        """Mirror face tags into the person_id field, None/"" untags"""
+        await self.async_client.ensure_ready()
+        return await asyncio.to_thread(
+            self.milvus_client.update_metadata,
+            {
+                face_id: {"person_id": person_id or "unknown"}
+                for face_id, person_id in person_ids.items()
+            },
+        )
+
+    async def delete_faces(
+        self, face_ids: List[str], playground_id: Optional[str] = None
+    ) -> int:
+        """Delete faces no longer detected in their image"""
+        await self.async_client.ensure_ready()
+        return await asyncio.to_thread(
+            self.milvus_client.delete_faces, face_ids, playground_id
+        )
+
+    async def supports_filters(self) -> bool:
+        """False for legacy collections created without metadata fields"""
+        await self.async_client.ensure_ready()
+        return self.milvus_client.has_metadata
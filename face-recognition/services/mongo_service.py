@@ -1,22 +1,30 @@
-from integrates.mongo import get_client
+from integrates.mongo import get_async_client
 from bson import ObjectId
 from fastapi import HTTPException
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
+from typing import Dict, List, Optional, Tuple
+from core.config import PERSON_NAME_CACHE_TTL_SECONDS, REDETECT_MATCH_MIN_IOU
+from enums.images_enum import ImageStatusEnum
 
 COLLECTION_NAME = "images"
+PERSONS_COLLECTION_NAME = "persons"
+
+# person id -> (name, cached_at), names rarely change between requests
+_person_name_cache: Dict[str, tuple] = {}
 
 
 async def get_image_data(id: str):
     try:
         # Get MongoDB client
-        client = get_client()
+        client = get_async_client()
 
         # Validate ObjectId format
         if not ObjectId.is_valid(id):
             raise HTTPException(status_code=400, detail="Invalid image ID format")
 
         # Query image from images collection
-        image_doc = client.find_one(COLLECTION_NAME, {"_id": ObjectId(id)})
+        image_doc = await client.find_one(COLLECTION_NAME, {"_id": ObjectId(id)})
         print(f"Retrieved image document: {image_doc}")
 
         if not image_doc:
@@ -32,6 +40,8 @@ async def get_image_data(id: str):
             "user_id": image_doc.get("userId"),
             "playground_id": image_doc.get("playgroundId"),
             "faces": image_doc.get("faces", []),
+            "status": image_doc.get("status"),
+            "job_id": image_doc.get("jobId"),
             "created_at": image_doc.get("createdAt"),
             "updated_at": image_doc.get("updatedAt"),
         }
@@ -43,36 +53,37 @@ async def get_image_data(id: str):
 
 
 async def update_image_faces(id: str, milvus_id: str, face_data: dict):
+    """
+    Set fields of one face in place, atomically: a re-detection replacing
+    the faces meanwhile is never overwritten with the previous array.
+    """
     try:
         # Get MongoDB client
-        client = get_client()
+        client = get_async_client()
 
         # Validate ObjectId format
         if not ObjectId.is_valid(id):
             raise HTTPException(status_code=400, detail="Invalid image ID format")
 
-        # Get existing document first
-        existing_doc = client.find_one(COLLECTION_NAME, {"_id": ObjectId(id)})
-        if not existing_doc:
-            raise HTTPException(status_code=404, detail="Image not found")
-
-        # Get existing faces or empty list
-        existing_faces = existing_doc.get("faces", [])
-
-        # Update specific face by milvusId
-        updated_faces = update_face_by_milvus_id(existing_faces, milvus_id, face_data)
-
-        # Update faces data
-        result = client.update_one(
+        # Update the face with this milvusId, returns the image's face ids
+        image_doc = await client.find_one_and_update(
             COLLECTION_NAME,
-            {"_id": ObjectId(id)},
-            {"$set": {"faces": updated_faces, "updatedAt": datetime.utcnow()}},
+            {"_id": ObjectId(id), "faces.milvusId": milvus_id},
+            {
+                "$set": {
+                    **{f"faces.$.{key}": value for key, value in face_data.items()},
+                    "updatedAt": datetime.utcnow(),
+                }
+            },
+            projection={"faces.milvusId": 1},
         )
+        if image_doc is None:
+            raise HTTPException(status_code=404, detail="Face not found in image")
 
         return {
             "success": True,
-            "modified_count": result.modified_count,
-            "faces_count": len(updated_faces),
+            "modified_count": 1,
+            "faces_count": len(image_doc.get("faces", [])),
             "updated_milvus_id": milvus_id,
         }
 
@@ -85,7 +96,7 @@ async def update_image_faces(id: str, milvus_id: str, face_data: dict):
 async def update_image_status(id: str, status: str, execution_time: float = None):
     try:
         # Get MongoDB client
-        client = get_client()
+        client = get_async_client()
 
         # Validate ObjectId format
         if not ObjectId.is_valid(id):
@@ -97,7 +108,7 @@ async def update_image_status(id: str, status: str, execution_time: float = None
             update_data["executionTime"] = execution_time
 
         # Update image status
-        result = client.update_one(
+        result = await client.update_one(
             COLLECTION_NAME,
             {"_id": ObjectId(id)},
             {"$set": update_data},
@@ -116,6 +127,370 @@ async def update_image_status(id: str, status: str, execution_time: float = None
         raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
 
 
+async def update_image_job(id: str, job_id: str, status: str, error: str = None):
+    """Status of a queued detection job on its image, which clients poll"""
+    try:
+        client = get_async_client()
+
+        if not ObjectId.is_valid(id):
+            raise HTTPException(status_code=400, detail="Invalid image ID format")
+
+        update_data = {
+            "status": status,
+            "jobId": job_id,
+            "updatedAt": datetime.utcnow(),
+        }
+        if error is not None:
+            update_data["error"] = error
+        result = await client.update_one(
+            COLLECTION_NAME,
+            {"_id": ObjectId(id)},
+            {"$set": update_data},
+        )
+
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        return {"success": True, "modified_count": result.modified_count}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+
+
+async def acquire_detection_lease(
+    id: str, owner: str, mode: str, ttl_seconds: float
+) -> Tuple[bool, Optional[Dict]]:
+    """
+    Take the image's processing lease unless another owner holds an
+    unexpired one. Returns (acquired, the lease now on the image).
+    """
+    try:
+        client = get_async_client()
+
+        if not ObjectId.is_valid(id):
+            raise HTTPException(status_code=400, detail="Invalid image ID format")
+
+        now = datetime.utcnow()
+        lease = {
+            "owner": owner,
+            "mode": mode,
+            "expiresAt": now + timedelta(seconds=ttl_seconds),
+        }
+        image_doc = await client.find_one_and_update(
+            COLLECTION_NAME,
+            {
+                "_id": ObjectId(id),
+                "$or": [
+                    {"processingLease": None},
+                    {"processingLease.expiresAt": {"$lt": now}},
+                    {"processingLease.owner": owner},
+                ],
+            },
+            {
+                "$set": {
+                    "processingLease": lease,
+                    "status": ImageStatusEnum.PROCESSING,
+                    "updatedAt": now,
+                }
+            },
+            projection={"processingLease": 1},
+        )
+        if image_doc is not None:
+            return True, lease
+
+        image_doc = await client.find_one(
+            COLLECTION_NAME, {"_id": ObjectId(id)}, {"processingLease": 1}
+        )
+        if not image_doc:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return False, image_doc.get("processingLease")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+
+
+async def renew_detection_lease(id: str, owner: str, ttl_seconds: float) -> bool:
+    """Push the lease's expiry back, False when it was lost to another owner"""
+    client = get_async_client()
+    result = await client.update_one(
+        COLLECTION_NAME,
+        {"_id": ObjectId(id), "processingLease.owner": owner},
+        {
+            "$set": {
+                "processingLease.expiresAt": datetime.utcnow()
+                + timedelta(seconds=ttl_seconds)
+            }
+        },
+    )
+    return result.matched_count > 0
+
+
+async def release_detection_lease(id: str, owner: str):
+    """Drop the lease if this owner still holds it"""
+    client = get_async_client()
+    await client.update_one(
+        COLLECTION_NAME,
+        {"_id": ObjectId(id), "processingLease.owner": owner},
+        {"$unset": {"processingLease": ""}},
+    )
+
+
+async def get_detection_state(id: str) -> Optional[Dict]:
+    """Status, lease and stored faces of an image, for callers waiting on a lease"""
+    try:
+        client = get_async_client()
+        return await client.find_one(
+            COLLECTION_NAME,
+            {"_id": ObjectId(id)},
+            {"status": 1, "processingLease": 1, "faces": 1, "executionTime": 1},
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+def _bbox_iou(a: list, b: list) -> float:
+    if len(a or []) != 4 or len(b or []) != 4:
+        return 0.0
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    inter = max(width, 0) * max(height, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def carry_face_tags(
+    previous: List[dict], faces: List[dict], min_iou: float = REDETECT_MATCH_MIN_IOU
+) -> List[dict]:
+    """
+    Re-detected faces with the tags of the previous faces they overlap most,
+    one previous face per new face. Faces without a bbox on either side keep
+    the tag stored under their own milvusId.
+    """
+    faces = [dict(face) for face in faces]
+    tagged = [face for face in previous if _is_tagged(face)]
+    pairs = sorted(
+        (
+            (_bbox_iou(old.get("bbox"), face.get("bbox")), i, j)
+            for i, old in enumerate(tagged)
+            for j, face in enumerate(faces)
+        ),
+        reverse=True,
+    )
+    used, matched = set(), set()
+    for iou, i, j in pairs:
+        if iou < min_iou:
+            break
+        if i not in used and j not in matched:
+            used.add(i)
+            matched.add(j)
+            faces[j]["personId"] = tagged[i]["personId"]
+    by_milvus_id = {
+        old.get("milvusId"): (i, old) for i, old in enumerate(tagged) if i not in used
+    }
+    for j, face in enumerate(faces):
+        i, old = by_milvus_id.get(face["milvusId"], (None, None))
+        if j in matched or old is None:
+            continue
+        if len(face.get("bbox") or []) != 4 or len(old.get("bbox") or []) != 4:
+            faces[j]["personId"] = old["personId"]
+    return faces
+
+
+async def save_detection_results(
+    id: str, faces_data: list, status: str, execution_time: float = None
+):
+    """
+    Persist all detected faces plus status/executionTime in one write when
+    the image has no faces yet. Otherwise the faces replace the previous
+    ones, carrying their tags over by bbox overlap, in a write that only
+    applies if the faces didn't change since they were read (a tag written
+    meanwhile is carried over too). The result holds the faces as written;
+    person_ids and removed_ids let the caller bring Milvus in line.
+    """
+    try:
+        # Get MongoDB client
+        client = get_async_client()
+
+        # Validate ObjectId format
+        if not ObjectId.is_valid(id):
+            raise HTTPException(status_code=400, detail="Invalid image ID format")
+
+        object_id = ObjectId(id)
+
+        def update(faces: list) -> dict:
+            update_data = {
+                "faces": faces,
+                "status": status,
+                "updatedAt": datetime.utcnow(),
+            }
+            if execution_time is not None:
+                update_data["executionTime"] = execution_time
+            return {"$set": update_data}
+
+        # First detection: a single round-trip for faces, status and
+        # executionTime, nothing to carry over
+        previous, faces = None, faces_data
+        result = await client.update_one(
+            COLLECTION_NAME,
+            {"_id": object_id, "faces": {"$in": [None, []]}},
+            update(faces),
+        )
+        if not result.matched_count:
+            for _ in range(3):
+                image_doc = await client.find_one(
+                    COLLECTION_NAME, {"_id": object_id}, projection={"faces": 1}
+                )
+                if image_doc is None:
+                    raise HTTPException(status_code=404, detail="Image not found")
+                previous = image_doc.get("faces")
+                faces = carry_face_tags(previous or [], faces_data)
+                result = await client.update_one(
+                    COLLECTION_NAME,
+                    {"_id": object_id, "faces": previous},
+                    update(faces),
+                )
+                if result.matched_count:
+                    break
+            else:
+                raise HTTPException(
+                    status_code=409, detail="Faces of the image kept changing, retry"
+                )
+
+        milvus_ids = {face["milvusId"] for face in faces}
+        return {
+            "success": True,
+            "modified_count": result.modified_count,
+            "faces_count": len(faces),
+            "faces": faces,
+            "person_ids": {
+                face["milvusId"]: face["personId"] for face in faces if _is_tagged(face)
+            },
+            "removed_ids": [
+                face["milvusId"]
+                for face in previous or []
+                if face.get("milvusId") and face["milvusId"] not in milvus_ids
+            ],
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database update error: {str(e)}")
+
+
+async def get_playground_milvus_ids(playground_id: str) -> list:
+    """Every face milvusId stored for the images of a playground"""
+    try:
+        client = get_async_client()
+        cursor = client.find(
+            COLLECTION_NAME,
+            {"playgroundId": playground_id},
+            projection={"faces.milvusId": 1},
+        )
+        milvus_ids = []
+        async for image_doc in cursor:
+            for face in image_doc.get("faces", []):
+                if face.get("milvusId"):
+                    milvus_ids.append(face["milvusId"])
+        return milvus_ids
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+def _is_tagged(face: dict) -> bool:
+    return face.get("personId") not in (None, "", "unknown")
+
+
+async def get_playground_tagged_faces(playground_id: str) -> Dict[str, str]:
+    """milvusId -> personId of every tagged face in a playground"""
+    try:
+        client = get_async_client()
+        cursor = client.find(
+            COLLECTION_NAME,
+            {"playgroundId": playground_id},
+            projection={"faces.milvusId": 1, "faces.personId": 1},
+        )
+        person_ids = {}
+        async for image_doc in cursor:
+            for face in image_doc.get("faces", []):
+                if face.get("milvusId") and _is_tagged(face):
+                    person_ids[face["milvusId"]] = face["personId"]
+        return person_ids
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def get_face_person_ids(milvus_ids: List[str]) -> Dict[str, str]:
+    """personId of every tagged face among the given milvusIds, in one query"""
+    if not milvus_ids:
+        return {}
+    try:
+        client = get_async_client()
+        wanted = set(milvus_ids)
+        cursor = client.find(
+            COLLECTION_NAME,
+            {"faces.milvusId": {"$in": list(wanted)}},
+            projection={"faces.milvusId": 1, "faces.personId": 1},
+        )
+        person_ids = {}
+        async for image_doc in cursor:
+            for face in image_doc.get("faces", []):
+                if face.get("milvusId") in wanted and _is_tagged(face):
+                    person_ids[face["milvusId"]] = face["personId"]
+        return person_ids
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+async def get_person_names(person_ids: List[str]) -> Dict[str, str]:
+    """
+    Names of the given persons, served from a TTL cache where possible. Tags
+    written by the client hold the name itself in personId, so an id that is
+    not a persons ObjectId (or has no persons document) is its own name.
+    """
+    now = time.time()
+    names = {}
+    missing = []
+    for person_id in set(person_ids):
+        cached = _person_name_cache.get(person_id)
+        if cached and now - cached[1] < PERSON_NAME_CACHE_TTL_SECONDS:
+            names[person_id] = cached[0]
+        elif ObjectId.is_valid(person_id):
+            missing.append(person_id)
+        else:
+            names[person_id] = person_id
+
+    if not missing:
+        return names
+    try:
+        client = get_async_client()
+        cursor = client.find(
+            PERSONS_COLLECTION_NAME,
+            {"_id": {"$in": [ObjectId(person_id) for person_id in missing]}},
+            projection={"name": 1},
+        )
+        async for person_doc in cursor:
+            person_id = str(person_doc["_id"])
+            names[person_id] = person_doc.get("name", "")
+            if len(_person_name_cache) >= 10000:
+                _person_name_cache.clear()
+            _person_name_cache[person_id] = (names[person_id], now)
+        for person_id in missing:
+            names.setdefault(person_id, person_id)
+        return names
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 def update_face_by_milvus_id(
     existing_faces: list, milvus_id: str, face_data: dict
 ) -> list:
@@ -150,7 +525,7 @@ def update_face_by_milvus_id(
 async def create_image_record(user_id: str, file_key: str, playground_id: str):
     try:
         # Get MongoDB client
-        client = get_client()
+        client = get_async_client()
 
         # Create image document
         image_doc = {
@@ -163,7 +538,7 @@ async def create_image_record(user_id: str, file_key: str, playground_id: str):
         }
 
         # Insert into database
-        result = client.insert_one(COLLECTION_NAME, image_doc)
+        result = await client.insert_one(COLLECTION_NAME, image_doc)
 
         # Return created document with ID
         return {
@@ -0,0 +1,318 @@
+"""
+Staged, bounded-queue pipeline for batch face detection.
+
+Mongo fetch -> Supabase download -> decode -> inference -> Milvus insert ->
+Mongo write. Every stage has its own worker count, so network I/O for some
+images overlaps CPU inference for others, and the queues between stages are
+bounded so memory stays flat however many image ids are submitted. Download
+workers fetch the images waiting for them in one batch.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from core.config import (
+    PIPELINE_DECODE_CONCURRENCY,
+    PIPELINE_DOWNLOAD_BATCH_SIZE,
+    PIPELINE_DOWNLOAD_CONCURRENCY,
+    PIPELINE_FETCH_CONCURRENCY,
+    PIPELINE_INFERENCE_CONCURRENCY,
+    PIPELINE_MILVUS_CONCURRENCY,
+    PIPELINE_PERSIST_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE,
+)
+from enums.images_enum import ImageStatusEnum
+from integrates.milvus import face_ids_for_image
+from integrates.supabase import download_files_bytes
+from services.face_service import (
+    decode_image_service,
+    detect_decoded_service,
+    get_cached_faces,
+)
+from services.crop_service import save_face_crops_service
+from services.migration_service import (
+    dual_write_deletes_service,
+    dual_write_service,
+    dual_write_tags_service,
+)
+from services.milvus_service import MilvusService
+from services.mongo_service import (
+    get_image_data,
+    save_detection_results,
+    update_image_status,
+)
+from services.suggestion_service import forget_redetected_faces_service
+
+
+async def fetch_stage(item: Dict):
+    item["data"] = await get_image_data(id=item["image_id"])
+
+
+async def download_stage(items: List[Dict]) -> List[Optional[Exception]]:
+    """Download a batch of images at once, one error (or None) per image"""
+    results = await download_files_bytes([item["data"]["file_key"] for item in items])
+    errors = []
+    for item, result in zip(items, results):
+        if result["success"]:
+            item["content"] = result["content"]
+            errors.append(None)
+        else:
+            errors.append(HTTPException(status_code=404, detail=result["error"]))
+    return errors
+
+
+async def decode_stage(item: Dict):
+    content = item.pop("content")
+    item["cache_key"], faces = await get_cached_faces(content)
+    if faces is not None:
+        item["faces"] = faces
+    else:
+        item["img"], item["scale"] = await decode_image_service(content)
+
+
+async def inference_stage(item: Dict):
+    if "faces" not in item:
+        item["faces"] = await detect_decoded_service(
+            item.pop("img"), item["cache_key"], item.pop("scale")
+        )
+    if not item["faces"]:
+        raise HTTPException(status_code=404, detail="No faces detected")
+
+
+async def milvus_stage(item: Dict):
+    embedded_faces = [face for face in item["faces"] if face.get("embedding")]
+    milvus_ids = await MilvusService().save_face_embeddings(
+        [face["embedding"] for face in embedded_faces],
+        playground_id=item["data"].get("playground_id"),
+        image_id=item["image_id"],
+        user_id=item["data"].get("user_id"),
+        face_ids=face_ids_for_image(item["image_id"], len(embedded_faces)),
+    )
+    for face, milvus_id in zip(embedded_faces, milvus_ids):
+        face["milvusId"] = milvus_id
+    await dual_write_service(
+        embedded_faces,
+        playground_id=item["data"].get("playground_id"),
+        image_id=item["image_id"],
+        user_id=item["data"].get("user_id"),
+    )
+    await save_face_crops_service(item["faces"])
+    item["faces"] = embedded_faces
+
+
+async def persist_stage(item: Dict):
+    item["execution_time"] = round(time.perf_counter() - item["started_at"], 4)
+    saved = await save_detection_results(
+        id=item["image_id"],
+        faces_data=[
+            {
+                "milvusId": face["milvusId"],
+                "bbox": face.get("bbox", []),
+                "personId": face.get("personId", "unknown"),
+            }
+            for face in item["faces"]
+        ],
+        status=ImageStatusEnum.DETECTED,
+        execution_time=item["execution_time"],
+    )
+    # Tags carried over to re-detected faces (the upsert reset person_id),
+    # faces no longer detected leave both versions
+    await MilvusService().set_face_person_ids(saved["person_ids"])
+    await dual_write_tags_service(saved["person_ids"])
+    await MilvusService().delete_faces(
+        saved["removed_ids"], item["data"].get("playground_id")
+    )
+    await dual_write_deletes_service(saved["removed_ids"])
+    await forget_redetected_faces_service(
+        item["data"].get("playground_id"),
+        [face["milvusId"] for face in item["faces"]] + saved["removed_ids"],
+    )
+
+
+# Stages that take a list of waiting items, up to this many at a time
+BATCH_STAGES = {"download": PIPELINE_DOWNLOAD_BATCH_SIZE}
+
+STAGES = [
+    ("fetch", fetch_stage, PIPELINE_FETCH_CONCURRENCY),
+    ("download", download_stage, PIPELINE_DOWNLOAD_CONCURRENCY),
+    ("decode", decode_stage, PIPELINE_DECODE_CONCURRENCY),
+    ("inference", inference_stage, PIPELINE_INFERENCE_CONCURRENCY),
+    ("milvus", milvus_stage, PIPELINE_MILVUS_CONCURRENCY),
+    ("persist", persist_stage, PIPELINE_PERSIST_CONCURRENCY),
+]
+
+
+class PipelineSummary:
+    """Running aggregate, so no per-image results need to be kept"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.faces = 0
+        self.stage_seconds = {name: 0.0 for name, _, _ in STAGES}
+        self.stage_counts = {name: 0 for name, _, _ in STAGES}
+
+    def add(self, result: Dict):
+        self.total += 1
+        if result["success"]:
+            self.succeeded += 1
+            self.faces += result["faces_count"]
+        else:
+            self.failed += 1
+        for stage, seconds in result["timings"].items():
+            self.stage_seconds[stage] += seconds
+            self.stage_counts[stage] += 1
+
+    def to_dict(self) -> Dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "faces": self.faces,
+            "elapsed": round(elapsed, 4),
+            "images_per_second": round(self.total / elapsed, 4) if elapsed else 0.0,
+            "faces_per_second": round(self.faces / elapsed, 4) if elapsed else 0.0,
+            "stage_avg_seconds": {
+                stage: (
+                    round(self.stage_seconds[stage] / self.stage_counts[stage], 4)
+                    if self.stage_counts[stage]
+                    else 0.0
+                )
+                for stage in self.stage_seconds
+            },
+        }
+
+
+def _to_result(item: Dict) -> Dict:
+    timings = {stage: round(seconds, 4) for stage, seconds in item["timings"].items()}
+    if "error" in item:
+        return {
+            "image_id": item["image_id"],
+            "success": False,
+            "status": ImageStatusEnum.FAILED.value,
+            "error": item["error"],
+            "timings": timings,
+        }
+    return {
+        "image_id": item["image_id"],
+        "success": True,
+        "status": ImageStatusEnum.DETECTED.value,
+        "faces_count": len(item["faces"]),
+        "faces": [
+            {key: value for key, value in face.items() if key != "embedding"}
+            for face in item["faces"]
+        ],
+        "execution_time": item["execution_time"],
+        "timings": timings,
+    }
+
+
+class DetectionPipeline:
+    def __init__(self, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+
+    async def _mark_failed(self, item: Dict):
+        try:
+            await update_image_status(
+                id=item["image_id"], status=ImageStatusEnum.FAILED
+            )
+        except HTTPException:
+            pass
+
+    async def iter_results(self, image_ids: List[str]) -> AsyncIterator[Dict]:
+        """Yield one result per image as soon as it is persisted (or fails)"""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in STAGES]
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def produce():
+            for image_id in image_ids:
+                await queues[0].put(
+                    {
+                        "image_id": image_id,
+                        "started_at": time.perf_counter(),
+                        "timings": {},
+                    }
+                )
+
+        async def run_stage(
+            name: str, stage, items: List[Dict]
+        ) -> List[Optional[Exception]]:
+            try:
+                if name in BATCH_STAGES:
+                    return await stage(items)
+                await stage(items[0])
+                return [None]
+            except Exception as e:
+                return [e] * len(items)
+
+        async def work(index: int):
+            name, stage, _ = STAGES[index]
+            is_last = index + 1 == len(STAGES)
+            batch_size = BATCH_STAGES.get(name, 1)
+            while True:
+                items = [await queues[index].get()]
+                # Never waits for a batch to fill, only takes what is queued
+                while len(items) < batch_size and not queues[index].empty():
+                    items.append(queues[index].get_nowait())
+                started_at = time.perf_counter()
+                errors = await run_stage(name, stage, items)
+                elapsed = time.perf_counter() - started_at
+                for item, error in zip(items, errors):
+                    if error is not None:
+                        item["error"] = (
+                            str(error.detail)
+                            if isinstance(error, HTTPException)
+                            else str(error)
+                        )
+                        item.pop("img", None)
+                        item.pop("content", None)
+                        await self._mark_failed(item)
+                    item["timings"][name] = elapsed
+
+                    # Failed images skip the remaining stages
+                    if error is not None or is_last:
+                        await results.put(_to_result(item))
+                    else:
+                        await queues[index + 1].put(item)
+
+        tasks = [asyncio.create_task(produce())]
+        for index, (_, _, concurrency) in enumerate(STAGES):
+            tasks += [
+                asyncio.create_task(work(index)) for _ in range(max(concurrency, 1))
+            ]
+        try:
+            for _ in range(len(image_ids)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self, image_ids: List[str]) -> Dict:
+        """Run the whole batch and return per-image results plus throughput"""
+        summary = PipelineSummary()
+        per_image = []
+        async for result in self.iter_results(image_ids):
+            summary.add(result)
+            per_image.append(result)
+        return {"results": per_image, "summary": summary.to_dict()}
+
+
+async def stream_detection_events(image_ids: List[str]) -> AsyncIterator[Dict]:
+    """
+    Yield a "face" event per persisted face, an "image" event per finished
+    image and a final "summary" event; only the running summary is kept.
+    """
+    summary = PipelineSummary()
+    async for result in DetectionPipeline().iter_results(image_ids):
+        summary.add(result)
+        for face in result.pop("faces", []):
+            yield {"type": "face", "image_id": result["image_id"], **face}
+        yield {"type": "image", **result}
+    yield {"type": "summary", **summary.to_dict()}
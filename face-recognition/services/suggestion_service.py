@@ -0,0 +1,249 @@
+import json
+import asyncio
+import numpy as np
+from fastapi import HTTPException
+from typing import Dict, Iterable, List, Optional, Tuple
+from core.config import (
+    CENTROID_CANDIDATES,
+    CENTROID_INDEX_ENABLED,
+    CENTROID_MAX_REFINE_FACES,
+    SUGGEST_MAX_NAMES,
+    SUGGEST_MIN_SIMILARITY,
+    SUGGEST_NEIGHBORS,
+)
+from integrates.centroid_index import get_centroid_index
+from integrates.milvus import EMBEDDING_DIM
+from services.milvus_service import MilvusService
+from services.mongo_service import (
+    get_face_person_ids,
+    get_image_data,
+    get_person_names,
+    get_playground_tagged_faces,
+    update_image_faces,
+)
+
+# Background centroid rebuilds by playground
+_rebuilding: Dict[str, asyncio.Task] = {}
+
+
+def vote_person_suggestions(
+    hits: List[List[Dict]],
+    person_ids: Dict[str, str],
+    min_similarity: float = SUGGEST_MIN_SIMILARITY,
+    max_names: int = SUGGEST_MAX_NAMES,
+    exclude_ids: Iterable[str] = (),
+) -> List[List[Dict]]:
+    """
+    Aggregate the neighbours of every query face into per-person votes.
+
+    Each tagged hit at or above min_similarity votes for its person with its
+    similarity as weight. Per face, persons are ranked by summed weight and
+    reported with their best similarity, the number of matching faces and
+    their share of the face's votes.
+    """
+    excluded = set(exclude_ids)
+    rows = [
+        (face_index, person_ids[hit["id"]], hit["distance"])
+        for face_index, face_hits in enumerate(hits)
+        for hit in face_hits
+        if hit["id"] in person_ids
+        and hit["id"] not in excluded
+        and hit["distance"] >= min_similarity
+    ]
+    if not rows:
+        return [[] for _ in hits]
+
+    face_index, persons, similarity = zip(*rows)
+    face_index = np.asarray(face_index, dtype=np.int64)
+    similarity = np.asarray(similarity, dtype=np.float64)
+    unique_persons, person_index = np.unique(persons, return_inverse=True)
+
+    # One (face, person) cell per vote, reduced without per-hit Python work
+    shape = (len(hits), len(unique_persons))
+    cell = face_index * shape[1] + person_index
+    votes = np.bincount(cell, weights=similarity, minlength=shape[0] * shape[1])
+    counts = np.bincount(cell, minlength=shape[0] * shape[1])
+    best = np.zeros(shape[0] * shape[1])
+    np.maximum.at(best, cell, similarity)
+    votes, counts, best = (a.reshape(shape) for a in (votes, counts, best))
+    shares = votes / np.maximum(votes.sum(axis=1, keepdims=True), 1e-12)
+    ranking = np.argsort(-votes, axis=1, kind="stable")[:, :max_names]
+
+    return [
+        [
+            {
+                "person_id": str(unique_persons[p]),
+                "similarity_score": round(float(best[f, p]), 4),
+                "face_count": int(counts[f, p]),
+                "vote_share": round(float(shares[f, p]), 4),
+            }
+            for p in ranking[f]
+            if counts[f, p] > 0
+        ]
+        for f in range(shape[0])
+    ]
+
+
+async def _centroid_hits(
+    embeddings: List[List[float]], playground_id: Optional[str], neighbors: int
+) -> Optional[Tuple[List[List[Dict]], Dict[str, str]]]:
+    """
+    Neighbours among the faces of each query's closest person centroids only,
+    with the index's own face -> person map (possibly stale); None when the
+    centroid index can't answer for this playground.
+    """
+    if not CENTROID_INDEX_ENABLED or not playground_id:
+        return None
+    candidates = await asyncio.to_thread(
+        get_centroid_index(EMBEDDING_DIM).candidates,
+        playground_id,
+        embeddings,
+        CENTROID_CANDIDATES,
+    )
+    if candidates is None:
+        return None
+    _, person_ids = candidates
+    if not person_ids:
+        return [[] for _ in embeddings], {}
+    milvus_service = MilvusService()
+    if len(person_ids) > CENTROID_MAX_REFINE_FACES or not (
+        await milvus_service.supports_filters()
+    ):
+        return None
+    hits = await milvus_service.search_similar_faces_batch(
+        embeddings,
+        limit=neighbors,
+        playground_id=playground_id,
+        filter=f"id in {json.dumps(list(person_ids))}",
+    )
+    return hits, person_ids
+
+
+def _rebuild_in_background(playground_id: str):
+    """Rebuild a stale centroid index once, without holding up the request"""
+    if playground_id in _rebuilding:
+        return
+    task = asyncio.create_task(build_centroid_index_service(playground_id))
+    _rebuilding[playground_id] = task
+
+    def done(task: asyncio.Task):
+        _rebuilding.pop(playground_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Centroid rebuild of {playground_id} error: {task.exception()}")
+
+    task.add_done_callback(done)
+
+
+async def suggest_names_service(
+    embeddings: List[List[float]],
+    playground_id: Optional[str] = None,
+    exclude_ids: Iterable[str] = (),
+    neighbors: int = SUGGEST_NEIGHBORS,
+) -> List[List[Dict]]:
+    """
+    Name suggestions for every face of an image: one batched similarity
+    search, restricted to the closest persons' faces when the playground has
+    a centroid index, then per-person voting on the current tags and cached
+    names.
+    """
+    if not embeddings:
+        return []
+    refined = await _centroid_hits(embeddings, playground_id, neighbors)
+    if refined is not None:
+        hits, index_person_ids = refined
+    else:
+        hits = await MilvusService().search_similar_faces_batch(
+            embeddings, limit=neighbors, playground_id=playground_id
+        )
+    # Votes use the tags in MongoDB, the centroids only pick the candidates:
+    # the Node server tags faces by writing personId directly
+    person_ids = await get_face_person_ids(
+        list({hit["id"] for face_hits in hits for hit in face_hits})
+    )
+    if refined is not None and any(
+        person_ids.get(hit["id"]) != index_person_ids.get(hit["id"])
+        for face_hits in hits
+        for hit in face_hits
+    ):
+        # Tags changed outside /tag-face, newly tagged persons are missing too
+        _rebuild_in_background(playground_id)
+    suggestions = vote_person_suggestions(hits, person_ids, exclude_ids=exclude_ids)
+    names = await get_person_names(
+        [item["person_id"] for items in suggestions for item in items]
+    )
+    return [
+        [
+            {"name": names.get(item["person_id"], item["person_id"]), **item}
+            for item in items
+        ]
+        for items in suggestions
+    ]
+
+
+async def build_centroid_index_service(playground_id: str) -> Dict:
+    """Rebuild a playground's person centroids from the tags in MongoDB"""
+    if not CENTROID_INDEX_ENABLED:
+        raise HTTPException(status_code=400, detail="Centroid index is disabled")
+    faces = await get_playground_tagged_faces(playground_id)
+    embeddings = await MilvusService().fetch_embeddings(list(faces))
+    stats = await asyncio.to_thread(
+        get_centroid_index(EMBEDDING_DIM).build, playground_id, faces, embeddings
+    )
+    return {
+        "playground_id": playground_id,
+        "missing": len(faces) - stats["faces"],
+        **stats,
+    }
+
+
+async def tag_face_service(
+    image_id: str, milvus_id: str, person_id: Optional[str]
+) -> Dict:
+    """Tag (or untag, person_id None) one face and move it between centroids"""
+    data = await get_image_data(id=image_id)
+    # Untagged faces hold "unknown" everywhere: Mongo, Milvus, dual-writes
+    result = await update_image_faces(
+        id=image_id,
+        milvus_id=milvus_id,
+        face_data={"personId": person_id or "unknown"},
+    )
+    # Imported here: migration pulls in the storage and crop layers
+    from services.migration_service import dual_write_tags_service
+
+    # person_id filters in Milvus see the tag too, in both versions mid-migration
+    await MilvusService().set_face_person_ids({milvus_id: person_id})
+    await dual_write_tags_service({milvus_id: person_id})
+    if CENTROID_INDEX_ENABLED and data.get("playground_id"):
+        embeddings = await MilvusService().fetch_embeddings([milvus_id])
+        if milvus_id in embeddings:
+            await asyncio.to_thread(
+                get_centroid_index(EMBEDDING_DIM).assign,
+                data["playground_id"],
+                milvus_id,
+                person_id,
+                embeddings[milvus_id],
+            )
+    return result
+
+
+async def forget_redetected_faces_service(
+    playground_id: Optional[str], face_ids: List[str]
+):
+    """
+    Re-detection deletes faces and reuses ids for other faces, whose old
+    embeddings the centroids can't subtract: rebuild when any was counted.
+    """
+    if not CENTROID_INDEX_ENABLED or not playground_id or not face_ids:
+        return
+    forgot = await asyncio.to_thread(
+        get_centroid_index(EMBEDDING_DIM).forget, playground_id, face_ids
+    )
+    if forgot:
+        _rebuild_in_background(playground_id)
+
+
+def get_centroid_stats_service() -> Dict:
+    """Hit/miss counters and per-playground person/face counts"""
+    if not CENTROID_INDEX_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_centroid_index(EMBEDDING_DIM).get_stats()}
@@ -0,0 +1,224 @@
+"""
+Latency/recall benchmark for detection resolution, reduced decode and tiling.
+
+Decodes every image once per --decode-max-sides value (0 = full resolution)
+and reports decode time. Unless --decode-only is given, each image is then run
+through the detector for every det mode / fixed det size / tiling combination.
+The report covers detection time, faces found and recall against the most
+thorough configuration: full-resolution decode, tiling on, largest det size.
+Boxes are matched at IoU >= 0.5 in original pixels. The last line recommends
+the fastest configuration whose recall stays above --min-recall; use it to set
+INSIGHTFACE_DET_MODE, INSIGHTFACE_DET_SIZE, DETECTION_DECODE_MAX_SIDE and
+DETECTION_TILING for your own photos and hardware.
+
+Usage (from face-recognition root directory):
+    python test/benchmark_detection.py --images path/to/photos
+    python test/benchmark_detection.py --images path/to/photos --det-sizes 640 960 1280
+    python test/benchmark_detection.py --synthetic 5 --decode-only
+"""
+
+import sys
+import os
+import argparse
+import glob
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from core.config import INSIGHTFACE_CTX_ID, INSIGHTFACE_MODEL_NAME
+from integrates.detection import DET_MODES, detect_faces
+from integrates.opencv import decode_image_reduced
+
+
+def synthetic_photos(count: int, width: int = 6000, height: int = 4000):
+    """24 MP JPEGs with photo-like noise, for decode timing only"""
+    rng = np.random.default_rng(0)
+    base = cv2.resize(
+        rng.integers(0, 255, size=(height // 16, width // 16, 3), dtype=np.uint8),
+        (width, height),
+        interpolation=cv2.INTER_CUBIC,
+    )
+    photos = []
+    for i in range(count):
+        noise = rng.integers(0, 24, size=base.shape, dtype=np.uint8)
+        ok, encoded = cv2.imencode(
+            ".jpg", cv2.add(base, noise), [cv2.IMWRITE_JPEG_QUALITY, 92]
+        )
+        photos.append((f"synthetic-{i}.jpg", encoded.tobytes()))
+    return photos
+
+
+def load_photos(directory: str):
+    paths = sorted(
+        path
+        for pattern in ("*.jpg", "*.jpeg", "*.JPG", "*.JPEG", "*.png")
+        for path in glob.glob(os.path.join(directory, pattern))
+    )
+    photos = []
+    for path in paths:
+        with open(path, "rb") as f:
+            photos.append((os.path.basename(path), f.read()))
+    return photos
+
+
+def iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.maximum(0, xx2 - xx1) * np.maximum(0, yy2 - yy1)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def matched(reference: np.ndarray, boxes: np.ndarray) -> int:
+    """Reference faces that have a box at IoU >= 0.5"""
+    if len(reference) == 0 or len(boxes) == 0:
+        return 0
+    return sum(bool((iou(box, boxes) >= 0.5).any()) for box in reference)
+
+
+def decode_all(photos, max_side: int):
+    decoded, seconds = [], []
+    for _, content in photos:
+        started_at = time.perf_counter()
+        decoded.append(decode_image_reduced(content, max_side))
+        seconds.append(time.perf_counter() - started_at)
+    return decoded, seconds
+
+
+def load_detector():
+    from integrates.insightface import PROVIDERS
+    from integrates.model_pool import create_model_pool
+
+    slot = create_model_pool(
+        name=INSIGHTFACE_MODEL_NAME,
+        root=".",
+        allowed_modules=["detection"],
+        providers=PROVIDERS,
+    )[0]
+    slot.prepare(ctx_id=INSIGHTFACE_CTX_ID)
+    slot.warm_up()
+    return slot.det_model
+
+
+def detect_all(det_model, decoded, det_mode, fixed_size, tiling):
+    boxes, seconds = [], []
+    for img, scale in decoded:
+        started_at = time.perf_counter()
+        bboxes, _ = detect_faces(det_model, img, det_mode, tiling, fixed_size)
+        seconds.append(time.perf_counter() - started_at)
+        boxes.append(bboxes[:, :4] * scale)
+    return boxes, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", help="directory of .jpg/.png photos")
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="generate N 24 MP JPEGs"
+    )
+    parser.add_argument(
+        "--decode-max-sides", type=int, nargs="+", default=[0, 3000, 1500]
+    )
+    parser.add_argument(
+        "--det-modes", nargs="+", choices=DET_MODES, default=list(DET_MODES)
+    )
+    parser.add_argument("--det-sizes", type=int, nargs="+", default=[640, 960, 1280])
+    parser.add_argument(
+        "--tiling", nargs="+", choices=["off", "on"], default=["off", "on"]
+    )
+    parser.add_argument("--min-recall", type=float, default=0.98)
+    parser.add_argument("--decode-only", action="store_true")
+    args = parser.parse_args()
+
+    photos = load_photos(args.images) if args.images else []
+    photos += synthetic_photos(args.synthetic) if args.synthetic else []
+    if not photos:
+        parser.error("pass --images or --synthetic")
+    print(f"📊 {len(photos)} photos")
+
+    decodes = {}
+    print(
+        f"{'decode_max_side':>16} | {'decoded_px':>12} | {'ms_p50':>8} | {'ms_mean':>8}"
+    )
+    for max_side in args.decode_max_sides:
+        decoded, seconds = decode_all(photos, max_side)
+        decodes[max_side] = decoded
+        shape = decoded[0][0].shape
+        print(
+            f"{max_side:>16} | {f'{shape[1]}x{shape[0]}':>12} | "
+            f"{np.median(seconds) * 1000:>8.1f} | {np.mean(seconds) * 1000:>8.1f}"
+        )
+    if args.decode_only:
+        return
+
+    det_model = load_detector()
+    configs = [
+        (max_side, det_mode, size, tiling)
+        for max_side in args.decode_max_sides
+        for det_mode in args.det_modes
+        for size in (args.det_sizes if det_mode == "fixed" else [0])
+        for tiling in args.tiling
+    ]
+    reference, _ = detect_all(
+        det_model,
+        # Full resolution (0) when benchmarked, else the largest decode
+        decodes[max(args.decode_max_sides, key=lambda s: s or 10**9)],
+        "fixed",
+        max(args.det_sizes),
+        "on",
+    )
+    total = sum(len(boxes) for boxes in reference)
+
+    rows = []
+    for max_side, det_mode, size, tiling in configs:
+        boxes, seconds = detect_all(
+            det_model, decodes[max_side], det_mode, size, tiling
+        )
+        found = sum(matched(ref, got) for ref, got in zip(reference, boxes))
+        rows.append(
+            {
+                "decode_max_side": max_side,
+                "det": f"fixed {size}" if det_mode == "fixed" else "adaptive",
+                "tiling": tiling,
+                "faces": sum(len(b) for b in boxes),
+                "recall": round(found / max(total, 1), 4),
+                "ms_p50": round(float(np.median(seconds)) * 1000, 1),
+                "ms_p99": round(float(np.percentile(seconds, 99)) * 1000, 1),
+            }
+        )
+
+    columns = [
+        "decode_max_side",
+        "det",
+        "tiling",
+        "faces",
+        "recall",
+        "ms_p50",
+        "ms_p99",
+    ]
+    print(f"🎯 reference: {total} faces")
+    print(" | ".join(f"{column:>15}" for column in columns))
+    for row in rows:
+        print(" | ".join(f"{str(row[column]):>15}" for column in columns))
+
+    eligible = [row for row in rows if row["recall"] >= args.min_recall]
+    if eligible:
+        best = min(eligible, key=lambda row: row["ms_p50"])
+        print(f"✅ fastest with recall >= {args.min_recall}: {best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Recall/latency benchmark for the Milvus vector index types.
+
+Builds every requested index type on the same embedding set, then reports
+recall@k against NumPy brute-force ground truth, build time, p50/p99 search
+latency and memory. Runs against Milvus Lite by default (a local .db file);
+pass --uri to benchmark a real Milvus deployment.
+
+Milvus Lite only implements a subset of index types (FLAT, IVF_FLAT, IVF_SQ8,
+HNSW); the others are reported as skipped there.
+
+Usage (from face-recognition root directory):
+    python test/benchmark_milvus_index.py
+    python test/benchmark_milvus_index.py --num 100000 --index-types HNSW IVF_SQ8
+    python test/benchmark_milvus_index.py --embeddings exported.npy --uri https://...
+"""
+
+import sys
+import os
+import argparse
+import json
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+os.environ.setdefault("VECTOR_CACHE_ENABLED", "false")
+
+from integrates.milvus import EMBEDDING_DIM, INDEX_PRESETS, MilvusClient
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_embeddings(num: int, queries: int, identities: int, dim: int, seed: int):
+    """Clustered unit vectors, several faces per identity like real photo sets"""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((identities, dim)).astype(np.float32))
+
+    def sample(count):
+        owners = rng.integers(0, identities, size=count)
+        noise = rng.standard_normal((count, dim)).astype(np.float32) * 0.04
+        return normalize(centers[owners] + noise)
+
+    return sample(num), sample(queries)
+
+
+def load_embeddings(path: str, queries: int, seed: int):
+    """Hold out random rows of an exported (N, dim) .npy set as queries"""
+    data = normalize(np.load(path).astype(np.float32))
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(data), size=queries, replace=False)
+    mask = np.ones(len(data), dtype=bool)
+    mask[held_out] = False
+    return data[mask], data[held_out]
+
+
+def brute_force_top_k(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    top = []
+    for start in range(0, len(queries), 256):
+        scores = queries[start : start + 256] @ base.T
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+        top.append(np.take_along_axis(part, order, axis=1))
+    return np.vstack(top)
+
+
+def estimate_index_bytes(index_type: str, params: dict, num: int, dim: int) -> int:
+    """Rough in-memory size of the vector index, for comparing index types"""
+    raw = num * dim * 4
+    nlist = params.get("nlist", 0)
+    if index_type in ("FLAT", "IVF_FLAT"):
+        return raw + nlist * dim * 4
+    if index_type == "IVF_SQ8":
+        return num * dim + nlist * dim * 4
+    if index_type == "IVF_PQ":
+        m, nbits = params.get("m", 64), params.get("nbits", 8)
+        return num * m * nbits // 8 + nlist * dim * 4 + m * (2**nbits) * (dim // m) * 4
+    if index_type == "HNSW":
+        return raw + num * params.get("M", 16) * 2 * 4
+    if index_type == "DISKANN":
+        # Graph and full vectors live on disk, PQ codes stay in memory
+        return num * dim // 8
+    return raw
+
+
+def server_memory_bytes(collection_name: str):
+    """Loaded segment memory as reported by Milvus, None where unsupported"""
+    from pymilvus import utility
+
+    try:
+        return sum(
+            segment.mem_size
+            for segment in utility.get_query_segment_info(collection_name)
+        )
+    except Exception:
+        return None
+
+
+def benchmark_index(args, index_type, base, queries, truth):
+    client = MilvusClient(
+        collection_name=f"benchmark_{index_type.lower()}",
+        index_type=index_type,
+        index_params=json.loads(args.index_params) if args.index_params else None,
+        search_params=json.loads(args.search_params) if args.search_params else None,
+        uri=args.uri,
+        token=args.token,
+        # Plain collection, dropped and recreated on every run
+        alias=False,
+    )
+    client._connect()
+    client.force_create_collection()
+
+    row_ids = []
+    for start in range(0, len(base), args.insert_batch):
+        row_ids += client.save_face_embeddings(
+            base[start : start + args.insert_batch].tolist()
+        )
+    client.collection.flush()
+
+    # Rebuild the vector index over the sealed data so build time covers the
+    # whole set (and Milvus Lite rejects index types it can't build up front
+    # instead of silently searching brute force)
+    client.collection.release()
+    client.collection.drop_index(index_name="embedding")
+    started_at = time.perf_counter()
+    client.collection.create_index(
+        field_name="embedding",
+        index_params={
+            "metric_type": "COSINE",
+            "index_type": index_type,
+            "params": client.index_config["build"],
+        },
+        index_name="embedding",
+    )
+    client.collection.load()
+    build_seconds = time.perf_counter() - started_at
+    position = {row_id: i for i, row_id in enumerate(row_ids)}
+
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        started_at = time.perf_counter()
+        hits = client.search_similar_faces(query.tolist(), limit=args.k)
+        latencies.append(time.perf_counter() - started_at)
+        found = {position[hit["id"]] for hit in hits}
+        recalls.append(len(found & set(expected.tolist())) / args.k)
+
+    started_at = time.perf_counter()
+    client.search_similar_faces_batch(queries.tolist(), limit=args.k)
+    batch_seconds = time.perf_counter() - started_at
+
+    result = {
+        "index_type": index_type,
+        "build_params": client.index_config["build"],
+        "search_params": client.index_config["search"],
+        f"recall@{args.k}": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "batch_qps": round(len(queries) / batch_seconds, 1),
+        "build_seconds": round(build_seconds, 2),
+        "estimated_index_mb": round(
+            estimate_index_bytes(
+                index_type, client.index_config["build"], len(base), base.shape[1]
+            )
+            / 1024**2,
+            1,
+        ),
+        "server_memory_mb": None,
+    }
+    memory = server_memory_bytes(client.collection_name)
+    if memory is not None:
+        result["server_memory_mb"] = round(memory / 1024**2, 1)
+
+    if not args.keep:
+        from pymilvus import utility
+
+        utility.drop_collection(client.collection_name)
+    return result
+
+
+def print_table(results, k):
+    columns = [
+        "index_type",
+        f"recall@{k}",
+        "p50_ms",
+        "p99_ms",
+        "batch_qps",
+        "build_seconds",
+        "estimated_index_mb",
+        "server_memory_mb",
+    ]
+    print(" | ".join(f"{column:>18}" for column in columns))
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['index_type']:>18} | skipped: {result['skipped']}")
+            continue
+        print(" | ".join(f"{str(result[column]):>18}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--uri",
+        default=os.path.join("temp", "benchmark_milvus.db"),
+        help="Milvus URI, a local .db path runs Milvus Lite",
+    )
+    parser.add_argument("--token", default="")
+    parser.add_argument("--embeddings", help="exported (N, dim) .npy embedding set")
+    parser.add_argument("--num", type=int, default=20000)
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--insert-batch", type=int, default=1000)
+    parser.add_argument(
+        "--index-types", nargs="+", default=list(INDEX_PRESETS), metavar="TYPE"
+    )
+    parser.add_argument("--index-params", help="JSON build params for every type")
+    parser.add_argument("--search-params", help="JSON search params for every type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the collections")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    if args.uri.endswith(".db"):
+        os.makedirs(os.path.dirname(os.path.abspath(args.uri)), exist_ok=True)
+
+    if args.embeddings:
+        base, queries = load_embeddings(args.embeddings, args.queries, args.seed)
+    else:
+        base, queries = synthetic_embeddings(
+            args.num, args.queries, args.identities, EMBEDDING_DIM, args.seed
+        )
+    print(f"📊 {len(base)} embeddings, {len(queries)} queries, k={args.k}")
+    truth = brute_force_top_k(base, queries, args.k)
+
+    results = []
+    for index_type in args.index_types:
+        index_type = index_type.upper()
+        print(f"🔧 Building {index_type}...")
+        try:
+            results.append(benchmark_index(args, index_type, base, queries, truth))
+        except Exception as e:
+            results.append({"index_type": index_type, "skipped": str(e)[:120]})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, args.k)
+
+
+if __name__ == "__main__":
+    main()
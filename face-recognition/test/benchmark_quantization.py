@@ -0,0 +1,131 @@
+"""
+Memory saved versus recall lost for the compact embedding storage modes.
+
+Loads the same embedding set into the in-process vector cache once per
+storage mode (float16, int8, binary) and reports bytes per face, memory saved
+against float32, first-pass recall@k and recall@k after re-ranking the top
+k * factor candidates with full-precision vectors. Needs no external services.
+
+Usage (from face-recognition root directory):
+    python test/benchmark_quantization.py
+    python test/benchmark_quantization.py --num 100000 --rerank-factors 2 4 8
+    python test/benchmark_quantization.py --embeddings exported.npy
+"""
+
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_milvus_index import (
+    brute_force_top_k,
+    load_embeddings,
+    synthetic_embeddings,
+)
+from integrates.embedding_store import EmbeddingStore
+from integrates.milvus import EMBEDDING_DIM
+from integrates.quantization import STORAGE_MODES, code_bytes
+from integrates.vector_cache import VectorCache
+
+
+def recall(results, truth, ids, k) -> float:
+    position = {face_id: i for i, face_id in enumerate(ids)}
+    return float(
+        np.mean(
+            [
+                len({position[hit["id"]] for hit in hits} & set(expected.tolist())) / k
+                for hits, expected in zip(results, truth)
+            ]
+        )
+    )
+
+
+def benchmark_mode(mode, base, queries, truth, ids, store, args, workdir):
+    results = []
+    for factor in [1] + args.rerank_factors:
+        if mode == "float" and factor > 1:
+            break
+        cache = VectorCache(
+            os.path.join(workdir, f"{mode}-{factor}"),
+            base.shape[1],
+            storage_mode=mode,
+            # factor 1 is the first pass alone, without re-ranking
+            embedding_store=store if factor > 1 else None,
+            rerank_factor=factor,
+        )
+        cache.load("benchmark", ids, base)
+        started_at = time.perf_counter()
+        hits = cache.search("benchmark", queries, args.k)
+        elapsed = time.perf_counter() - started_at
+        results.append(
+            {
+                "mode": mode,
+                "rerank": f"x{factor}" if factor > 1 else "-",
+                "bytes_per_face": code_bytes(mode, base.shape[1]),
+                f"recall@{args.k}": round(recall(hits, truth, ids, args.k), 4),
+                "ms_per_query": round(elapsed / len(queries) * 1000, 3),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--embeddings", help="exported (N, dim) .npy embedding set")
+    parser.add_argument("--num", type=int, default=20000)
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        base, queries = load_embeddings(args.embeddings, args.queries, args.seed)
+    else:
+        base, queries = synthetic_embeddings(
+            args.num, args.queries, args.identities, EMBEDDING_DIM, args.seed
+        )
+    print(f"📊 {len(base)} embeddings, {len(queries)} queries, k={args.k}")
+    truth = brute_force_top_k(base, queries, args.k)
+    ids = [f"face-{i}" for i in range(len(base))]
+    float32_bytes = base.shape[1] * 4
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = EmbeddingStore(os.path.join(workdir, "embeddings.sqlite3"))
+        store.put_many(ids, base)
+        rows = []
+        for mode in STORAGE_MODES:
+            rows += benchmark_mode(
+                mode, base, queries, truth, ids, store, args, workdir
+            )
+
+    columns = [
+        "mode",
+        "rerank",
+        "bytes_per_face",
+        "saved_vs_float32",
+        f"recall@{args.k}",
+        "ms_per_query",
+    ]
+    print(" | ".join(f"{column:>16}" for column in columns))
+    for row in rows:
+        row["saved_vs_float32"] = f"{1 - row['bytes_per_face'] / float32_bytes:.1%}"
+        print(" | ".join(f"{str(row[column]):>16}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+
+# Service modules create the MongoDB client at import time, which needs a
+# database name; no connection is made until a query runs.
+os.environ.setdefault("MONGODB_DB_NAME", "test")
@@ -0,0 +1,116 @@
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+import integrates.centroid_index as centroid_index
+from integrates.centroid_index import CentroidIndex
+
+
+def create_person_faces(persons: int = 5, faces_per_person: int = 8, dim: int = 512):
+    """face id -> person id and face id -> embedding around one direction per person"""
+    rng = np.random.default_rng(0)
+    identities = rng.standard_normal((persons, dim))
+    faces, embeddings = {}, {}
+    for p in range(persons):
+        for f in range(faces_per_person):
+            face_id = f"face-{p}-{f}"
+            faces[face_id] = f"person-{p}"
+            embeddings[face_id] = identities[p] + 0.5 * rng.standard_normal(dim)
+    return identities, faces, embeddings
+
+
+def test_centroids_find_the_right_person():
+    identities, faces, embeddings = create_person_faces()
+    with tempfile.TemporaryDirectory() as directory:
+        index = CentroidIndex(directory, 512)
+        stats = index.build("playground", faces, embeddings)
+        assert stats["persons"] == 5 and stats["faces"] == 40
+
+        persons, members = index.candidates("playground", identities[[3, 1]], 2)
+        assert persons[0][0][0] == "person-3"
+        assert persons[1][0][0] == "person-1"
+        # Only the faces of the candidate persons are refined against
+        assert set(members.values()) == {
+            person_id for query in persons for person_id, _ in query
+        }
+        assert len(members) == 8 * len(set(members.values()))
+
+        assert index.candidates("unknown-playground", identities[:1], 2) is None
+
+
+def test_incremental_retag_matches_rebuild():
+    identities, faces, embeddings = create_person_faces()
+    with tempfile.TemporaryDirectory() as directory:
+        index = CentroidIndex(directory, 512)
+        index.build("playground", faces, embeddings)
+        # Re-tag one face, untag another and tag a new person
+        index.assign("playground", "face-0-0", "person-1", embeddings["face-0-0"])
+        index.assign("playground", "face-2-0", None, embeddings["face-2-0"])
+        index.assign("playground", "face-4-1", "person-new", embeddings["face-4-1"])
+
+        faces["face-0-0"] = "person-1"
+        faces["face-4-1"] = "person-new"
+        del faces["face-2-0"]
+        rebuilt = CentroidIndex(os.path.join(directory, "rebuilt"), 512)
+        rebuilt.build("playground", faces, embeddings)
+
+        incremental = index._index("playground")
+        expected = rebuilt._index("playground")
+        for person_id, row in expected.position.items():
+            other = incremental.position[person_id]
+            assert incremental.counts[other] == expected.counts[row]
+            assert np.allclose(incremental.sums[other], expected.sums[row])
+
+        # State survives a restart
+        reloaded = CentroidIndex(directory, 512)._index("playground")
+        assert reloaded.faces == incremental.faces
+        assert np.allclose(reloaded.sums, incremental.sums)
+
+
+def test_tags_are_journaled_and_redetection_forgets(monkeypatch):
+    monkeypatch.setattr(centroid_index, "JOURNAL_MAX_ENTRIES", 2)
+    _, faces, embeddings = create_person_faces()
+    with tempfile.TemporaryDirectory() as directory:
+        index = CentroidIndex(directory, 512)
+        index.build("playground", faces, embeddings)
+        centroids = index._index("playground")
+        saved_at = centroids.matrix_path.stat().st_mtime_ns
+
+        # A tag appends to the journal instead of rewriting the matrix
+        index.assign("playground", "face-0-0", "person-1", embeddings["face-0-0"])
+        index.assign("playground", "face-0-1", None, embeddings["face-0-1"])
+        assert centroids.journal_entries == 2
+        assert centroids.matrix_path.stat().st_mtime_ns == saved_at
+        reloaded = CentroidIndex(directory, 512)._index("playground")
+        assert reloaded.faces == centroids.faces
+        assert np.allclose(reloaded.sums, centroids.sums)
+
+        # ...and is folded into it once the journal is full
+        index.assign("playground", "face-0-2", "person-2", embeddings["face-0-2"])
+        assert centroids.journal_entries == 0
+        assert not centroids.journal_path.exists()
+        reloaded = CentroidIndex(directory, 512)._index("playground")
+        assert reloaded.faces == centroids.faces
+        assert np.allclose(reloaded.sums, centroids.sums)
+
+        # Re-detected ids that were never tagged leave the index alone
+        assert not index.forget("playground", ["face-new"])
+        assert index.forget("playground", ["face-new", "face-3-0"])
+        assert index.candidates("playground", [embeddings["face-3-0"]], 2) is None
+
+
+if __name__ == "__main__":
+    test_centroids_find_the_right_person()
+    test_incremental_retag_matches_rebuild()
+    print("✅ Centroid index tests passed")
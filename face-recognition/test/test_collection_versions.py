@@ -0,0 +1,248 @@
+import sys
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi import HTTPException
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.embedding_store import embedding_store_path
+from integrates.milvus import MilvusClient, face_ids_for_image
+import services.mongo_service as mongo_service
+from services.mongo_service import carry_face_tags
+
+# pymilvus keeps one "default" connection per process, so every test uses
+# the same Milvus Lite database with its own collection names
+LITE_URI = os.path.join(tempfile.mkdtemp(), "milvus.db")
+
+
+def create_client(uri: str, collection_name: str = "faces", **kwargs) -> MilvusClient:
+    return MilvusClient(
+        collection_name=collection_name,
+        index_type="FLAT",
+        uri=uri,
+        storage_mode="float",
+        local_stores=False,
+        **kwargs,
+    )
+
+
+def test_store_path_per_version():
+    assert embedding_store_path("faces") == embedding_store_path("faces_v1")
+    assert embedding_store_path("faces_v2") != embedding_store_path("faces_v1")
+    assert embedding_store_path("faces_v2").endswith(".v2.sqlite3")
+    assert MilvusClient.version_of("faces_v12") == 12
+    assert MilvusClient.version_of("faces") == 0
+
+
+def test_legacy_collection_moves_behind_alias():
+    """Milvus Lite: adopt a pre-versioning collection, fill _v2 and switch to it"""
+    legacy = create_client(LITE_URI, alias=False)
+    legacy._ensure_ready()
+    ids = legacy.save_face_embeddings(
+        np.random.default_rng(0).random((5, 512)).tolist(), playground_id="p"
+    )
+    legacy.collection.flush()
+
+    client = create_client(LITE_URI)
+    client._ensure_ready()
+    assert client.physical_name == "faces"
+    client.adopt_legacy()
+    assert client.physical_name == "faces_v1"
+    assert client.collection.num_entities == 5
+
+    target_name = client.next_version()
+    assert target_name == "faces_v2"
+    target = create_client(LITE_URI, target_name, alias=False)
+    rows = [batch for batch in client.iter_rows(batch_size=2)]
+    for batch_ids, embeddings, metadata in rows:
+        target.upsert_face_embeddings(batch_ids, embeddings, metadata)
+    target.collection.flush()
+
+    client.switch_version(target_name)
+    assert client.physical_name == "faces_v2"
+    result = client.collection.query(
+        expr=f'id == "{ids[0]}"', output_fields=["id", "playground_id"]
+    )
+    assert result[0]["playground_id"] == "p"
+
+    try:
+        client.drop_version("faces_v2")
+        assert False, "dropped the serving version"
+    except ValueError:
+        pass
+    client.drop_version("faces_v1")
+
+
+def test_image_face_ids_upsert_instead_of_duplicating():
+    """Milvus Lite: detecting the same image twice keeps one row per face"""
+    assert face_ids_for_image("image", 2) == face_ids_for_image("image", 3)[:2]
+    assert face_ids_for_image("image", 1) != face_ids_for_image("other", 1)
+    client = create_client(LITE_URI, "image_faces")
+    embeddings = np.random.default_rng(0).random((3, 512)).tolist()
+    face_ids = face_ids_for_image("image", 3)
+    for _ in range(2):
+        saved = client.save_face_embeddings(
+            embeddings, image_id="image", face_ids=face_ids
+        )
+        assert saved == face_ids
+    client.collection.flush()
+    rows = client.collection.query(expr='image_id == "image"', output_fields=["id"])
+    assert sorted(row["id"] for row in rows) == sorted(face_ids)
+
+
+def test_redetection_keeps_tags_on_their_faces():
+    """Tags follow the bbox when re-detection orders the faces differently"""
+    face_ids = face_ids_for_image("image", 3)
+    previous = [
+        {"milvusId": face_ids[0], "bbox": [0, 0, 10, 10], "personId": "alice"},
+        {"milvusId": face_ids[1], "bbox": [50, 50, 60, 60], "personId": ""},
+        {"milvusId": face_ids[2], "bbox": [100, 0, 110, 10], "personId": "bob"},
+    ]
+    faces = [
+        {"milvusId": face_ids[0], "bbox": [101, 0, 111, 10], "personId": "unknown"},
+        {"milvusId": face_ids[1], "bbox": [1, 1, 11, 11], "personId": "unknown"},
+    ]
+
+    carried = carry_face_tags(previous, faces)
+    assert [face["personId"] for face in carried] == ["bob", "alice"]
+    assert faces[0]["personId"] == "unknown"
+    # Without bboxes a face keeps the tag under its own milvusId
+    assert (
+        carry_face_tags(previous, [{"milvusId": face_ids[0], "personId": ""}])[0][
+            "personId"
+        ]
+        == "alice"
+    )
+
+    client = create_client(LITE_URI, "redetected_faces")
+    embeddings = np.random.default_rng(3).random((3, 512)).tolist()
+    client.save_face_embeddings(embeddings, image_id="image", face_ids=face_ids)
+    client.collection.flush()
+    assert client.delete_faces(face_ids[2:]) == 1
+    client.collection.flush()
+    rows = client.collection.query(expr='image_id == "image"', output_fields=["id"])
+    assert sorted(row["id"] for row in rows) == sorted(face_ids[:2])
+
+
+class FakeImages:
+    """The images collection of one document, faces changed by every read"""
+
+    def __init__(self, faces, racing: bool = False):
+        self.faces = faces
+        self.racing = racing
+        self.calls = []
+
+    async def find_one(self, collection_name, query, projection=None):
+        self.calls.append("find_one")
+        faces = list(self.faces) if self.faces is not None else None
+        if self.racing:
+            # Another tag lands between the read and the write
+            person_id = f"person-{len(self.calls)}"
+            self.faces = [{**face, "personId": person_id} for face in self.faces]
+        return {"faces": faces}
+
+    async def update_one(self, collection_name, query, update_data):
+        self.calls.append("update_one")
+        expected = query["faces"]
+        if isinstance(expected, dict):
+            matched = self.faces in expected["$in"]
+        else:
+            matched = self.faces == expected
+        if matched:
+            self.faces = update_data["$set"]["faces"]
+        return SimpleNamespace(matched_count=int(matched), modified_count=int(matched))
+
+
+def test_first_detection_is_one_write_and_races_give_up(monkeypatch):
+    image_id = "0123456789abcdef01234567"
+    faces = [{"milvusId": "a", "bbox": [0, 0, 10, 10], "personId": "unknown"}]
+    images = FakeImages(None)
+    monkeypatch.setattr(mongo_service, "get_async_client", lambda: images)
+    saved = asyncio.run(
+        mongo_service.save_detection_results(image_id, faces, "detected")
+    )
+    assert images.calls == ["update_one"]
+    assert saved["removed_ids"] == [] and saved["person_ids"] == {}
+    # Callers return what was stored, as callers that coalesced onto it read
+    assert saved["faces"] == images.faces == faces
+
+    # Re-detection while the faces keep changing under it
+    images = FakeImages([{**faces[0], "personId": "alice"}], racing=True)
+    monkeypatch.setattr(mongo_service, "get_async_client", lambda: images)
+    try:
+        asyncio.run(mongo_service.save_detection_results(image_id, faces, "detected"))
+        assert False, "replaced faces that changed after they were read"
+    except HTTPException as e:
+        assert e.status_code == 409
+    assert images.calls == ["update_one"] + ["find_one", "update_one"] * 3
+
+
+def test_tag_updates_person_id_and_keeps_the_row():
+    """Milvus Lite: a tagged face matches person_id filters, vector unchanged"""
+    client = create_client(LITE_URI, "tagged_faces")
+    embeddings = np.random.default_rng(1).random((2, 512)).tolist()
+    face_ids = client.save_face_embeddings(
+        embeddings, playground_id="p", image_id="image"
+    )
+    client.collection.flush()
+    assert client.update_metadata({face_ids[0]: {"person_id": "Alice"}}) == 1
+    client.collection.flush()
+
+    hits = client.search_similar_faces_batch(
+        [embeddings[0]], limit=2, filter='person_id != "unknown"'
+    )
+    assert [hit["id"] for hit in hits[0]] == [face_ids[0]]
+    assert abs(hits[0][0]["distance"] - 1.0) < 1e-4
+    rows = client.collection.query(
+        expr=f'id == "{face_ids[0]}"', output_fields=["image_id", "playground_id"]
+    )
+    assert rows[0]["image_id"] == "image" and rows[0]["playground_id"] == "p"
+
+
+def test_faces_missing_from_another_version():
+    """Milvus Lite: faces of the serving version the new one doesn't have"""
+    source = create_client(LITE_URI, "serving_faces")
+    target = create_client(LITE_URI, "serving_faces_v2")
+    embeddings = np.random.default_rng(2).random((3, 512)).tolist()
+    face_ids = face_ids_for_image("image", 3)
+    source.save_face_embeddings(embeddings, image_id="image", face_ids=face_ids)
+    target.save_face_embeddings(embeddings[:1], image_id="image", face_ids=face_ids[:1])
+    source.collection.flush()
+    target.collection.flush()
+
+    missing = source.faces_missing_from(target, batch_size=2)
+    assert missing == {face_ids[1]: "image", face_ids[2]: "image"}
+    assert target.faces_missing_from(source) == {}
+
+
+def test_int8_reranks_with_the_vectors_in_milvus():
+    """Milvus Lite: int8 mode keeps no local store, scores are exact"""
+    client = MilvusClient(
+        collection_name="int8_faces",
+        index_type="FLAT",
+        uri=LITE_URI,
+        storage_mode="int8",
+        local_stores=False,
+    )
+    assert client.embedding_store is None
+    request = client.search_request([[0.0] * 512], 2)
+    assert request["output_fields"] == ["id", "embedding"] and request["limit"] > 2
+    embeddings = np.random.default_rng(4).random((5, 512)).tolist()
+    face_ids = client.save_face_embeddings(embeddings, image_id="image")
+    client.collection.flush()
+
+    hits = client.search_similar_faces_batch([embeddings[2]], limit=2)
+    assert hits[0][0]["id"] == face_ids[2]
+    assert abs(hits[0][0]["distance"] - 1.0) < 1e-5
+    assert len(hits[0]) == 2
@@ -0,0 +1,68 @@
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.crop_store import CropStore
+
+
+def create_crops(count: int, size: int = 112, offset: int = 0):
+    """Crops whose pixels all hold their own index, easy to tell apart"""
+    return np.stack(
+        [
+            np.full((size, size, 3), (offset + i) % 256, dtype=np.uint8)
+            for i in range(count)
+        ]
+    )
+
+
+def test_crops_round_trip_across_chunks():
+    with tempfile.TemporaryDirectory() as directory:
+        store = CropStore(directory, chunk_crops=4)
+        ids = [f"face-{i}" for i in range(10)]
+        sealed = store.put_many(ids[:3], create_crops(3))
+        sealed += store.put_many(ids[3:], create_crops(7, offset=3))
+        # 10 crops in chunks of 4: two full chunks, one being filled
+        assert sealed == [0, 1]
+        assert store.pending_uploads() == [0, 1]
+
+        crops = store.get_many(["face-0", "face-5", "face-9", "missing"])
+        assert set(crops) == {"face-0", "face-5", "face-9"}
+        assert crops["face-5"][0, 0, 0] == 5 and crops["face-9"].shape == (112, 112, 3)
+
+        batches = [
+            (batch_ids, batch[:, 0, 0, 0].tolist())
+            for chunk in store.chunk_ids()
+            for batch_ids, batch in store.iter_chunk(chunk, 3)
+        ]
+        assert [face_id for batch_ids, _ in batches for face_id in batch_ids] == ids
+        assert [value for _, values in batches for value in values] == list(range(10))
+
+        # Survives a restart, a re-stored id points at its newest crop
+        store = CropStore(directory, chunk_crops=4)
+        store.put_many(["face-5"], create_crops(1, offset=200))
+        assert store.get_many(["face-5"])["face-5"][0, 0, 0] == 200
+        stats = store.stats()
+        assert stats["crops"] == 10 and stats["stale_records"] == 1
+
+
+def test_lost_index_write_is_overwritten():
+    with tempfile.TemporaryDirectory() as directory:
+        store = CropStore(directory, chunk_crops=8)
+        store.put_many(["a"], create_crops(1, offset=1))
+        # Bytes appended without an index row, as after a crash mid-write
+        with open(store.chunk_path(0), "ab") as f:
+            f.write(create_crops(1, offset=99).tobytes())
+        store.put_many(["b"], create_crops(1, offset=2))
+        crops = store.get_many(["a", "b"])
+        assert crops["a"][0, 0, 0] == 1 and crops["b"][0, 0, 0] == 2
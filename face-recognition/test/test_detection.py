@@ -0,0 +1,118 @@
+import sys
+import os
+
+import cv2
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.detection import (
+    adaptive_det_size,
+    detect_tiled,
+    rescale_faces,
+    tile_windows,
+)
+from integrates.opencv import decode_image_reduced, jpeg_size
+
+
+class SquareDetector:
+    """Stands in for SCRFD: every white blob is a face, keypoints at its corners"""
+
+    nms_thresh = 0.4
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        mask = (img[:, :, 0] > 127).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        bboxes, kpss = [], []
+        for x, y, w, h, _ in stats[1:count]:
+            bboxes.append([x, y, x + w - 1, y + h - 1, 0.9])
+            kpss.append(
+                [[x, y], [x + w, y], [x + w / 2, y + h / 2], [x, y + h], [x + w, y + h]]
+            )
+        return (
+            np.array(bboxes, dtype=np.float32).reshape(-1, 5),
+            np.array(kpss, dtype=np.float32).reshape(-1, 5, 2),
+        )
+
+
+def create_crowd_image(width=3000, height=2000, step=137, size=24):
+    """Small faces on a grid that doesn't line up with any tile edge"""
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    boxes = []
+    for y in range(50, height - size, step):
+        for x in range(40, width - size, step):
+            img[y : y + size, x : x + size] = 255
+            boxes.append((x, y))
+    # One face much larger than the tile overlap
+    img[600:1500, 1100:2000] = 0
+    img[700:1400, 1200:1900] = 255
+    boxes = [b for b in boxes if not (1100 <= b[0] < 2000 and 600 <= b[1] < 1500)]
+    return img, boxes + [(1200, 700)]
+
+
+def test_adaptive_det_size():
+    # Large photos are capped, keep their aspect ratio and stay multiples of 32
+    assert adaptive_det_size(6000, 4000, 320, 1280) == (1280, 864)
+    assert adaptive_det_size(4000, 6000, 320, 1280) == (864, 1280)
+    # Thumbnails aren't letterboxed into 640 x 640
+    assert adaptive_det_size(400, 300, 320, 1280) == (416, 320)
+    assert adaptive_det_size(100, 100, 320, 1280) == (320, 320)
+
+
+def test_tile_windows_cover_the_image():
+    windows = tile_windows(3000, 2000, 1280, 0.2)
+    covered = np.zeros((2000, 3000), dtype=bool)
+    for x1, y1, x2, y2 in windows:
+        assert x2 - x1 <= 1280 and y2 - y1 <= 1280
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+    assert tile_windows(800, 600, 1280, 0.2) == [(0, 0, 800, 600)]
+
+
+def test_tiled_detection_merges_across_tiles():
+    img, faces = create_crowd_image()
+    bboxes, kpss = detect_tiled(SquareDetector(), img, "fixed", 1280, 0.2)
+
+    # Every face exactly once: no cut halves, no overlap duplicates
+    assert len(bboxes) == len(faces) == len(kpss)
+    found = sorted((int(x1), int(y1)) for x1, y1, *_ in bboxes)
+    assert found == sorted(faces)
+    big = next(b for b in bboxes if int(b[0]) == 1200)
+    assert (int(big[2]), int(big[3])) == (1899, 1399)
+
+
+def test_reduced_decode_maps_back_to_original_pixels():
+    img = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    img[1000:1400, 2000:2400] = 255
+    ok, encoded = cv2.imencode(".jpg", img)
+    content = encoded.tobytes()
+    assert jpeg_size(content) == (4000, 3000)
+    assert jpeg_size(cv2.imencode(".png", img[:10, :10])[1].tobytes()) is None
+
+    reduced, scale = decode_image_reduced(content, 1000)
+    assert reduced.shape[:2] == (750, 1000) and scale == 4.0
+    full, scale = decode_image_reduced(content, 0)
+    assert full.shape[:2] == (3000, 4000) and scale == 1.0
+
+    bboxes, kpss = SquareDetector().detect(reduced)
+    faces = rescale_faces(
+        [{"bbox": bboxes[0, :4].tolist(), "kps": kpss[0].tolist(), "det_score": 0.9}],
+        4.0,
+    )
+    assert np.allclose(faces[0]["bbox"], [2000, 1000, 2396, 1396], atol=8)
+    assert faces[0]["det_score"] == 0.9
+
+
+if __name__ == "__main__":
+    test_adaptive_det_size()
+    test_tile_windows_cover_the_image()
+    test_tiled_detection_merges_across_tiles()
+    test_reduced_decode_maps_back_to_original_pixels()
+    print("✅ Detection resolution/tiling tests passed")
@@ -0,0 +1,99 @@
+import sys
+import os
+import json
+import tempfile
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.detection_cache import DetectionCache
+
+
+def create_sample_faces(count: int = 2) -> list:
+    return [
+        {
+            "bbox": [10.0 * i, 20.0, 60.0, 80.0],
+            "det_score": 0.9,
+            "embedding": [0.01 * i] * 512,
+        }
+        for i in range(count)
+    ]
+
+
+def test_cache_key_scoped_to_model_config():
+    content = b"same-image-bytes"
+    key = DetectionCache.make_key(content, "buffalo_l", (640, 640))
+
+    assert key == DetectionCache.make_key(content, "buffalo_l", (640, 640))
+    assert key != DetectionCache.make_key(content, "buffalo_l", (320, 320))
+    assert key != DetectionCache.make_key(content, "antelopev2", (640, 640))
+
+
+def test_memory_and_disk_tiers():
+    with tempfile.TemporaryDirectory() as disk_dir:
+        cache = DetectionCache(
+            memory_max_bytes=1024 * 1024, disk_dir=disk_dir, disk_max_bytes=1024 * 1024
+        )
+        key = DetectionCache.make_key(b"image", "buffalo_l", (640, 640))
+        faces = create_sample_faces()
+
+        assert cache.get(key) is None
+        cache.put(key, faces)
+
+        # Hits return copies so callers can mutate them (e.g. add milvusId)
+        cached = cache.get(key)
+        assert cached == faces
+        cached[0]["milvusId"] = "mutated"
+        assert "milvusId" not in cache.get(key)[0]
+
+        # A new instance only sees the disk tier
+        restarted = DetectionCache(
+            memory_max_bytes=1024 * 1024, disk_dir=disk_dir, disk_max_bytes=1024 * 1024
+        )
+        assert restarted.get(key) == faces
+
+        stats = cache.get_stats()
+        assert stats["memory_hits"] == 2
+        assert stats["misses"] == 1
+        assert restarted.get_stats()["disk_hits"] == 1
+        print(f"✓ Cache stats: {stats}")
+
+
+def test_lru_eviction():
+    with tempfile.TemporaryDirectory() as disk_dir:
+        faces = create_sample_faces(1)
+        payload_size = len(json.dumps(faces, separators=(",", ":")))
+        keys = [
+            DetectionCache.make_key(str(i).encode(), "buffalo_l", (640, 640))
+            for i in range(4)
+        ]
+
+        # Each tier holds two entries
+        cache = DetectionCache(
+            memory_max_bytes=payload_size * 2,
+            disk_dir=disk_dir,
+            disk_max_bytes=payload_size * 2,
+        )
+        for key in keys:
+            cache.put(key, faces)
+
+        stats = cache.get_stats()
+        assert stats["memory_entries"] == 2
+        assert stats["disk_entries"] == 2
+        assert stats["memory_evictions"] == 2
+        assert stats["disk_evictions"] == 2
+        assert cache.get(keys[-1]) == faces
+        assert cache.get(keys[0]) is None
+
+
+if __name__ == "__main__":
+    test_cache_key_scoped_to_model_config()
+    test_memory_and_disk_tiers()
+    test_lru_eviction()
+    print("Detection cache tests passed.")
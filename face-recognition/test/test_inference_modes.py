@@ -0,0 +1,109 @@
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+import integrates.inference_engine as inference_engine
+from integrates.inference_engine import BatchingInferenceEngine
+
+KPS = [[30, 40], [70, 40], [50, 60], [35, 80], [65, 80]]
+
+
+class FixedDetector:
+    """Stands in for SCRFD: one face with fixed keypoints per image"""
+
+    def detect(self, img, input_size=None, max_num=0, metric="default"):
+        return (
+            np.array([[20, 30, 80, 90, 0.9]], dtype=np.float32),
+            np.array([KPS], dtype=np.float32),
+        )
+
+
+class MeanRecognizer:
+    """Stands in for ArcFace: the embedding is the crop's mean color"""
+
+    input_size = (112, 112)
+
+    def get_feat(self, crops):
+        return np.array([crop.reshape(-1, 3).mean(axis=0) for crop in crops])
+
+
+class FakeSlot:
+    def __init__(self, detection=None, recognition=None):
+        self.models = {
+            taskname: model
+            for taskname, model in (
+                ("detection", detection),
+                ("recognition", recognition),
+            )
+            if model is not None
+        }
+        self.det_model = detection
+
+
+def _image():
+    return np.full((120, 120, 3), 200, dtype=np.uint8)
+
+
+def test_detect_only_engine_skips_embedding():
+    engine = BatchingInferenceEngine([FakeSlot(detection=FixedDetector())])
+    faces = engine.submit(_image()).result(timeout=5)
+
+    assert len(faces) == 1
+    assert faces[0].bbox.tolist() == [20, 30, 80, 90]
+    assert faces[0].embedding is None
+
+
+def test_embed_only_engine_uses_supplied_keypoints():
+    engine = BatchingInferenceEngine([FakeSlot(recognition=MeanRecognizer())])
+    faces = engine.submit(_image(), [{"kps": KPS}, {"kps": KPS, "bbox": [0, 0, 9, 9]}])
+    faces = faces.result(timeout=5)
+
+    # bbox falls back to the keypoints' extent, det_score to 1.0
+    assert faces[0].bbox.tolist() == [30, 40, 70, 80]
+    assert faces[0].det_score == 1.0
+    assert faces[1].bbox.tolist() == [0, 0, 9, 9]
+    assert faces[0].embedding.shape == (3,)
+    # The aligned crop is kept for the crop store
+    assert faces[0].crop.shape == (112, 112, 3)
+
+    with pytest.raises(ValueError):
+        engine.submit(_image())
+
+
+def test_alignment_error_fails_only_its_image(monkeypatch):
+    norm_crop = inference_engine.face_align.norm_crop
+
+    def failing_norm_crop(img, landmark, image_size=112):
+        if img[0, 0, 0] == 0:
+            raise ValueError("Degenerate keypoints")
+        return norm_crop(img, landmark=landmark, image_size=image_size)
+
+    monkeypatch.setattr(inference_engine.face_align, "norm_crop", failing_norm_crop)
+    engine = BatchingInferenceEngine(
+        [FakeSlot(FixedDetector(), MeanRecognizer())], max_wait_ms=200
+    )
+    broken = engine.submit(np.zeros((120, 120, 3), dtype=np.uint8))
+    healthy = engine.submit(_image())
+
+    with pytest.raises(ValueError):
+        broken.result(timeout=5)
+    # The error keeps no worker frame that references the caller's image
+    frames = []
+    traceback = broken.exception().__traceback__
+    while traceback is not None:
+        frames.append(traceback.tb_frame.f_code.co_name)
+        traceback = traceback.tb_next
+    assert "failing_norm_crop" not in frames and "_process_batch" not in frames
+    faces = healthy.result(timeout=5)
+    assert faces[0].embedding.shape == (3,)
@@ -0,0 +1,98 @@
+import sys
+import os
+import tempfile
+import time
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.job_queue import JobConflictError, JobQueue
+
+
+def test_claim_order_and_reserved_priority():
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(os.path.join(tmp, "jobs.sqlite3"))
+        long_jobs = [
+            queue.enqueue(f"batch-{i}", {"mode": "full"}, "low") for i in range(3)
+        ]
+        normal = queue.enqueue("normal", {"mode": "full"})
+        short = queue.enqueue("short", {"mode": "embed"}, "high")
+
+        # A worker reserved for high priority never picks up the backlog
+        reserved = queue.claim("high")
+        assert reserved["id"] == short["id"]
+        assert reserved["state"] == "running" and reserved["attempts"] == 1
+        assert queue.claim("high") is None
+
+        # General workers take the highest priority first, then FIFO
+        claimed = [queue.claim()["id"] for _ in range(4)]
+        assert claimed == [normal["id"]] + [job["id"] for job in long_jobs]
+        assert queue.claim() is None
+
+
+def test_dedup_retry_and_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.sqlite3")
+        queue = JobQueue(path)
+        job = queue.enqueue("image", {"mode": "full", "faces": None})
+        # A retried request while the image is queued gets the same job
+        assert (
+            queue.enqueue("image", {"mode": "full", "faces": None})["id"] == job["id"]
+        )
+        # Another payload isn't dropped in favour of the queued one
+        try:
+            queue.enqueue("image", {"mode": "embed", "faces": [{"kps": [[0, 0]]}]})
+            assert False, "returned a job with another payload"
+        except JobConflictError as e:
+            assert e.job["id"] == job["id"]
+
+        queue.claim()
+        queue.fail(job["id"], "Milvus timeout", retry=True)
+        retried = queue.get(job["id"])
+        assert retried["state"] == "queued" and retried["error"] == "Milvus timeout"
+
+        # A job left running by a stopped process runs again after a restart
+        queue.claim()
+        restarted = JobQueue(path)
+        assert restarted.requeue_running() == (1, [])
+        again = restarted.claim()
+        assert again["id"] == job["id"] and again["attempts"] == 3
+        assert again["payload"] == {"mode": "full", "faces": None}
+
+        restarted.complete(job["id"], {"faces_count": 2})
+        done = restarted.get(job["id"])
+        assert done["state"] == "succeeded" and done["result"] == {"faces_count": 2}
+        # Finished, the image can be queued again
+        assert restarted.enqueue("image", {"mode": "full"})["id"] != job["id"]
+
+        assert restarted.stats()["states"]["succeeded"] == {"normal": 1}
+        assert restarted.prune(time.time() + 1) == 1
+        assert restarted.get(job["id"]) is None
+
+
+def test_job_that_keeps_stopping_the_process_fails():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.sqlite3")
+        job = JobQueue(path, max_attempts=2).enqueue("image", {"mode": "full"})
+        # Every start requeues it until it used up its attempts...
+        for attempt in range(2):
+            queue = JobQueue(path, max_attempts=2)
+            assert queue.requeue_running()[0] == attempt
+            assert queue.claim()["attempts"] == attempt + 1
+        # ...then fails it instead of running it again
+        requeued, failed = JobQueue(path, max_attempts=2).requeue_running()
+        assert requeued == 0 and [f["id"] for f in failed] == [job["id"]]
+        assert failed[0]["state"] == "failed" and failed[0]["error"]
+
+        # A queued job that has no attempts left is never claimed
+        queue = JobQueue(path, max_attempts=1)
+        other = queue.enqueue("other", {"mode": "full"})
+        queue.claim()
+        queue.fail(other["id"], "Milvus timeout", retry=True)
+        assert queue.claim() is None
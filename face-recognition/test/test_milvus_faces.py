@@ -6,16 +6,17 @@ Test script for Milvus face recognition integration
 import sys
 import os
 import asyncio
-import json
 from typing import Dict, List
 
 # Add parent directory to path
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from services.milvus_face_service import get_face_recognition_service
-from integrates.milvus import get_face_milvus_client
+from services.milvus_service import MilvusService
+from services.suggestion_service import vote_person_suggestions
 import numpy as np
 
+PLAYGROUND_ID = "test_playground"
+
 
 async def test_milvus_connection():
     """Test Milvus connection"""
@@ -23,38 +24,32 @@ async def test_milvus_connection():
     print("=" * 50)
 
     try:
-        client = get_face_milvus_client()
-        if client.connected:
+        service = MilvusService()
+        # The probe only reports, connect and load first as app startup does
+        await service.async_client.ensure_ready()
+        status = service.get_readiness()
+        if status["ready"]:
             print("✅ Milvus connected successfully")
-            print(f"📊 Collection: {client.collection_name}")
+            print(f"📊 Collection: {status['collection']}")
             return True
         else:
-            print("❌ Milvus connection failed")
+            print(f"❌ Milvus connection failed: {status['error']}")
             return False
     except Exception as e:
         print(f"❌ Milvus connection error: {e}")
         return False
 
 
-def create_sample_face_data() -> Dict:
+def create_sample_face_data(identity: np.ndarray = None) -> Dict:
     """Create sample face data for testing"""
-    # Create sample data similar to InsightFace output
+    # Faces of the same identity are small perturbations of one direction
+    if identity is None:
+        identity = np.random.randn(512)
+    embedding = identity + 0.3 * np.random.randn(512)
     sample_face = {
-        "bbox": np.array([897.22, 343.30, 940.63, 401.90], dtype=np.float32),
-        "kps": np.array(
-            [
-                [908.6, 364.9],
-                [929.7, 364.4],
-                [919.3, 374.7],
-                [910.5, 386.1],
-                [927.9, 385.7],
-            ],
-            dtype=np.float32,
-        ),
-        "det_score": np.float32(0.89),
-        "embedding": np.random.randn(512).astype(
-            np.float32
-        ),  # Random 512-dim embedding
+        "bbox": [897.22, 343.30, 940.63, 401.90],
+        "det_score": 0.89,
+        "embedding": (embedding / np.linalg.norm(embedding)).tolist(),
     }
     return sample_face
 
@@ -65,44 +60,37 @@ async def test_save_face():
     print("=" * 50)
 
     try:
-        service = get_face_recognition_service()
         sample_face = create_sample_face_data()
 
         # Test saving face
-        face_id = await service.milvus_client.save_face_embedding(
-            face_data=sample_face,
+        face_id = await MilvusService().save_face_embedding(
+            sample_face["embedding"],
+            playground_id=PLAYGROUND_ID,
             image_id="test_image_123",
-            person_id="test_person_1",
-            person_name="John Doe",
         )
 
         print(f"✅ Face saved successfully with ID: {face_id}")
-        return face_id
+        return face_id, sample_face["embedding"]
 
     except Exception as e:
         print(f"❌ Error saving face: {e}")
-        return None
+        return None, None
 
 
-async def test_search_faces():
+async def test_search_faces(query_embedding: List[float]):
     """Test searching similar faces"""
     print("\n🔍 Testing Face Search...")
     print("=" * 50)
 
     try:
-        service = get_face_recognition_service()
-
-        # Create query embedding (similar to saved face)
-        query_embedding = np.random.randn(512).tolist()
-
         # Search for similar faces
-        results = await service.search_person_faces(query_embedding)
+        results = await MilvusService().search_similar_faces(
+            query_embedding, limit=3, playground_id=PLAYGROUND_ID
+        )
 
         print(f"✅ Search completed. Found {len(results)} similar faces")
         for i, face in enumerate(results):
-            print(
-                f"  {i+1}. {face['person_name']} (similarity: {face['similarity_score']:.3f})"
-            )
+            print(f"  {i+1}. {face['id']} (similarity: {face['distance']:.3f})")
 
         return results
 
@@ -111,59 +99,54 @@ async def test_search_faces():
         return []
 
 
-async def test_face_recognition_workflow():
-    """Test complete face recognition workflow"""
-    print("\n🤖 Testing Complete Face Recognition Workflow...")
+async def test_suggest_tags_workflow():
+    """Save faces of two tagged persons, then vote on a group photo"""
+    print("\n🤖 Testing Name Suggestion Workflow...")
     print("=" * 50)
 
     try:
-        service = get_face_recognition_service()
+        service = MilvusService()
+        identities = {
+            "John Doe": np.random.randn(512),
+            "Jane Smith": np.random.randn(512),
+        }
+
+        # Tag three faces per person (the tags normally live in MongoDB)
+        person_ids = {}
+        for name, identity in identities.items():
+            face_ids = await service.save_face_embeddings(
+                [create_sample_face_data(identity)["embedding"] for _ in range(3)],
+                playground_id=PLAYGROUND_ID,
+                image_id=f"workflow_{name}",
+            )
+            person_ids.update({face_id: name for face_id in face_ids})
 
-        # Create sample faces data (multiple faces)
-        faces_data = [
-            create_sample_face_data(),
-            create_sample_face_data(),
-            create_sample_face_data(),
+        # A group photo with both persons, searched in one batched call
+        group_faces = [
+            create_sample_face_data(identity) for identity in identities.values()
         ]
-
-        # Process faces
-        results = await service.process_detected_faces(
-            faces_data=faces_data, image_id="workflow_test_image"
+        hits = await service.search_similar_faces_batch(
+            [face["embedding"] for face in group_faces],
+            limit=10,
+            playground_id=PLAYGROUND_ID,
         )
+        suggestions = vote_person_suggestions(hits, person_ids)
 
         print(f"✅ Workflow completed successfully")
-        print(f"📊 Total faces: {results['total_faces']}")
-        print(f"👥 Recognized faces: {len(results['recognized_faces'])}")
-        print(f"🆕 New faces: {len(results['new_faces'])}")
-
-        return results
-
-    except Exception as e:
-        print(f"❌ Error in workflow: {e}")
-        return None
-
-
-async def test_person_registration():
-    """Test registering a new person"""
-    print("\n👤 Testing Person Registration...")
-    print("=" * 50)
-
-    try:
-        service = get_face_recognition_service()
-        sample_face = create_sample_face_data()
+        for expected, items in zip(identities, suggestions):
+            top = items[0]["person_id"] if items else None
+            print(
+                f"  {'✅' if top == expected else '❌'} expected {expected}, "
+                f"suggested {[(item['person_id'], item['similarity_score'], item['face_count']) for item in items]}"
+            )
 
-        # Register new person
-        face_id = await service.register_new_person(
-            face_data=sample_face,
-            image_id="registration_test_image",
-            person_name="Jane Smith",
+        return all(
+            items and items[0]["person_id"] == expected
+            for expected, items in zip(identities, suggestions)
         )
 
-        print(f"✅ Person registered successfully with face ID: {face_id}")
-        return face_id
-
     except Exception as e:
-        print(f"❌ Error registering person: {e}")
+        print(f"❌ Error in workflow: {e}")
         return None
 
 
@@ -179,16 +162,13 @@ async def run_all_tests():
         return
 
     # Test 2: Save face
-    saved_face_id = await test_save_face()
+    saved_face_id, saved_embedding = await test_save_face()
 
     # Test 3: Search faces
-    search_results = await test_search_faces()
-
-    # Test 4: Person registration
-    registered_face_id = await test_person_registration()
+    search_results = await test_search_faces(saved_embedding) if saved_embedding else []
 
-    # Test 5: Complete workflow
-    workflow_results = await test_face_recognition_workflow()
+    # Test 4: Name suggestions
+    workflow_results = await test_suggest_tags_workflow()
 
     # Summary
     print("\n📋 Test Summary")
@@ -196,8 +176,7 @@ async def run_all_tests():
     print(f"✅ Connection: {'PASS' if connection_ok else 'FAIL'}")
     print(f"✅ Save Face: {'PASS' if saved_face_id else 'FAIL'}")
     print(f"✅ Search Faces: {'PASS' if search_results else 'FAIL'}")
-    print(f"✅ Register Person: {'PASS' if registered_face_id else 'FAIL'}")
-    print(f"✅ Complete Workflow: {'PASS' if workflow_results else 'FAIL'}")
+    print(f"✅ Name Suggestions: {'PASS' if workflow_results else 'FAIL'}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.embedding_store import EmbeddingStore
+from integrates.quantization import code_bytes, decode, encode
+import integrates.vector_cache as vector_cache_module
+from integrates.vector_cache import VectorCache
+
+
+def create_sample_embeddings(count: int = 50, dim: int = 512) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_code_sizes():
+    assert code_bytes("float", 512) == 1024
+    assert code_bytes("int8", 512) == 512
+    assert code_bytes("binary", 512) == 64
+
+    embeddings = create_sample_embeddings(3)
+    assert encode(embeddings, "int8").dtype == np.int8
+    assert encode(embeddings, "binary").shape == (3, 64)
+
+
+def test_decoded_codes_keep_nearest_neighbour():
+    embeddings = create_sample_embeddings()
+    for mode in ("float", "int8", "binary"):
+        vectors = decode(encode(embeddings, mode), mode, 512)
+        scores = embeddings[:5] @ vectors.T
+        assert list(np.argmax(scores, axis=1)) == [0, 1, 2, 3, 4]
+
+
+def test_store_rerank_uses_exact_scores():
+    embeddings = create_sample_embeddings(3)
+    with tempfile.TemporaryDirectory() as workdir:
+        store = EmbeddingStore(os.path.join(workdir, "embeddings.sqlite3"))
+        store.put_many(["a", "b"], embeddings[:2])
+        assert store.count() == 2
+
+        # "c" has no stored vector: it keeps its estimate and never outranks
+        # an exactly scored hit, whatever its estimate
+        reranked = store.rerank(embeddings[1], [("a", 0.9), ("b", 0.1), ("c", 0.99)], 3)
+        assert [face_id for face_id, _ in reranked] == ["b", "a", "c"]
+        assert abs(reranked[0][1] - 1.0) < 1e-5
+        assert reranked[2] == ("c", 0.99)
+        assert store.unverified == 1
+
+
+def test_binary_vector_cache_reranks():
+    embeddings = create_sample_embeddings(200)
+    ids = [f"face-{i}" for i in range(200)]
+    with tempfile.TemporaryDirectory() as workdir:
+        store = EmbeddingStore(os.path.join(workdir, "embeddings.sqlite3"))
+        store.put_many(ids, embeddings)
+        cache = VectorCache(
+            os.path.join(workdir, "vectors"),
+            512,
+            storage_mode="binary",
+            embedding_store=store,
+            rerank_factor=4,
+        )
+        assert cache.load("playground", ids, embeddings)
+
+        hits = cache.search("playground", embeddings[:3], 2)
+        assert [query_hits[0]["id"] for query_hits in hits] == ids[:3]
+        assert abs(hits[0][0]["distance"] - 1.0) < 1e-5
+        assert cache.get_stats()["playgrounds"]["playground"]["bytes"] == 200 * 64
+
+
+def test_vector_cache_upsert_replaces_rows():
+    embeddings = create_sample_embeddings(20)
+    ids = [f"face-{i}" for i in range(10)]
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = VectorCache(os.path.join(workdir, "vectors"), 512)
+        assert cache.load("playground", ids, embeddings[:10])
+
+        # face-0 is re-detected with a new vector, face-new is added
+        cache.add("playground", ["face-0", "face-new"], embeddings[10:12], replace=True)
+        assert cache.get_stats()["playgrounds"]["playground"]["size"] == 11
+        hits = cache.search("playground", embeddings[10:12], 1)
+        assert [query_hits[0]["id"] for query_hits in hits] == ["face-0", "face-new"]
+
+
+def test_warm_replays_inserts_its_snapshot_missed():
+    embeddings = create_sample_embeddings(12)
+    ids = [f"face-{i}" for i in range(12)]
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = VectorCache(os.path.join(workdir, "vectors"), 512)
+        started_at = cache.begin_warm("playground")
+        # Stored while the snapshot is read: in Milvus, not yet in Mongo
+        cache.add("playground", ids[10:], embeddings[10:])
+        assert not cache.can_serve("playground")
+        assert cache.load("playground", ids[:10], embeddings[:10], started_at)
+
+        assert cache.get_stats()["playgrounds"]["playground"]["size"] == 12
+        hits = cache.search("playground", embeddings[10:], 1)
+        assert [query_hits[0]["id"] for query_hits in hits] == ids[10:]
+        # A re-warm whose snapshot already has them doesn't duplicate rows
+        started_at = cache.begin_warm("playground")
+        assert cache.load("playground", ids, embeddings, started_at)
+        assert cache.get_stats()["playgrounds"]["playground"]["size"] == 12
+
+
+def test_ivf_is_trained_by_the_warm_not_the_search():
+    embeddings = create_sample_embeddings(400)
+    ids = [f"face-{i}" for i in range(400)]
+    brute_force_max = vector_cache_module.VECTOR_CACHE_BRUTE_FORCE_MAX
+    vector_cache_module.VECTOR_CACHE_BRUTE_FORCE_MAX = 100
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            cache = VectorCache(os.path.join(workdir, "vectors"), 512)
+            assert cache.load("playground", ids, embeddings)
+            index = cache._index("playground")
+            assert index.centroids is not None and index.ivf_size == 400
+            hits = cache.search("playground", embeddings[:3], 1)
+            assert [query_hits[0]["id"] for query_hits in hits] == ids[:3]
+            assert not index.needs_ivf()
+    finally:
+        vector_cache_module.VECTOR_CACHE_BRUTE_FORCE_MAX = brute_force_max
+
+
+def test_removed_faces_are_skipped_and_replayed():
+    embeddings = create_sample_embeddings(12)
+    ids = [f"face-{i}" for i in range(12)]
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = VectorCache(os.path.join(workdir, "vectors"), 512)
+        assert cache.load("playground", ids[:10], embeddings[:10])
+        # face-0 is no longer detected in its image
+        cache.remove("playground", ["face-0"])
+        hits = cache.search("playground", embeddings[:1], 10)
+        assert len(hits[0]) == 9 and "face-0" not in [hit["id"] for hit in hits[0]]
+
+        # Removed while a warm reads a snapshot that still has it
+        started_at = cache.begin_warm("playground")
+        cache.remove("playground", ["face-1"])
+        assert cache.load("playground", ids, embeddings, started_at)
+        hits = cache.search("playground", embeddings[1:2], 12)
+        # face-0 too: removals shortly before the warm are replayed like inserts
+        assert sorted(hit["id"] for hit in hits[0]) == sorted(ids[2:])
+        # Tombstones survive a reload from disk
+        reloaded = VectorCache(os.path.join(workdir, "vectors"), 512)
+        assert reloaded.get_stats()["playgrounds"] == {}
+        index = reloaded._index("playground")
+        assert index.removed == 2
+        assert set(index.rows) == set(ids[2:])
+        assert all(index.ids[row] == face_id for face_id, row in index.rows.items())
+        # A restarted process re-warms before answering locally
+        assert not reloaded.can_serve("playground")
+        assert reloaded.search("playground", embeddings[:1], 1) is None
+
+
+if __name__ == "__main__":
+    test_code_sizes()
+    test_decoded_codes_keep_nearest_neighbour()
+    test_store_rerank_uses_exact_scores()
+    test_binary_vector_cache_reranks()
+    test_vector_cache_upsert_replaces_rows()
+    test_warm_replays_inserts_its_snapshot_missed()
+    test_ivf_is_trained_by_the_warm_not_the_search()
+    test_removed_faces_are_skipped_and_replayed()
+    print("✅ Quantization tests passed")
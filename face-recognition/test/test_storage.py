@@ -0,0 +1,196 @@
+import sys
+import os
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+
+from integrates.storage import StorageClient, StorageError
+
+PREFIX = "/storage/v1/object/bucket/"
+
+
+class FakeStorage(ThreadingHTTPServer):
+    """Supabase storage on localhost: objects in a dict, scripted delays"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeStorageHandler)
+        self.objects = {}
+        # key -> delays of its next GETs, in seconds
+        self.delays = {}
+        self.gets = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeStorageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        key = self.path[len(PREFIX) :]
+        with self.server.lock:
+            self.server.gets.append(key)
+            delays = self.server.delays.get(key)
+            delay = delays.pop(0) if delays else 0
+        time.sleep(delay)
+        if self.headers.get("Authorization") != "Bearer key":
+            return self._reply(403, b'{"message": "Unauthorized"}', "application/json")
+        if key not in self.server.objects:
+            return self._reply(
+                404, b'{"message": "Object not found"}', "application/json"
+            )
+        self._reply(200, self.server.objects[key], "application/octet-stream")
+
+    def do_POST(self):
+        key = self.path[len(PREFIX) :]
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if key in self.server.objects and self.headers.get("x-upsert") != "true":
+            return self._reply(409, b'{"message": "Duplicate"}', "application/json")
+        # Keep the multipart part's content, enough to check the round trip
+        content = body.split(b"\r\n\r\n", 2)[2].rsplit(b"\r\n--", 2)[0]
+        self.server.objects[key] = content
+        self._reply(200, b'{"Key": "bucket/%s"}' % key.encode(), "application/json")
+
+
+def with_server(test):
+    def run():
+        server = FakeStorage()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            asyncio.run(test(server))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    run.__name__ = test.__name__
+    return run
+
+
+def create_client(server: FakeStorage, **kwargs) -> StorageClient:
+    return StorageClient(server.url, "key", "bucket", **kwargs)
+
+
+@with_server
+async def test_upload_download_and_errors(server):
+    client = create_client(server)
+    try:
+        await client.upload("crops/a.bin", b"face bytes", upsert=False)
+        assert await client.download("crops/a.bin") == b"face bytes"
+        try:
+            await client.upload("crops/a.bin", b"again")
+            assert False, "overwrote without upsert"
+        except StorageError as e:
+            assert e.status_code == 409
+        await client.upload("crops/a.bin", b"replaced", upsert=True)
+        assert await client.download("crops/a.bin") == b"replaced"
+
+        try:
+            await client.download("missing.jpg")
+            assert False, "downloaded a missing object"
+        except StorageError as e:
+            assert e.status_code == 404 and "Object not found" in str(e)
+        assert client.stats()["errors"] == 1
+    finally:
+        await client.close()
+
+
+@with_server
+async def test_download_many_runs_in_parallel(server):
+    keys = [f"images/{i}.jpg" for i in range(8)]
+    for index, key in enumerate(keys):
+        server.objects[key] = b"image %d" % index
+        server.delays[key] = [0.2]
+    client = create_client(server, download_concurrency=8)
+    try:
+        started_at = time.perf_counter()
+        results = await client.download_many(keys + ["images/missing.jpg"])
+        elapsed = time.perf_counter() - started_at
+        # One after another would take 8 x 0.2s
+        assert elapsed < 0.8
+        assert [results[key] for key in keys] == [b"image %d" % i for i in range(8)]
+        assert isinstance(results["images/missing.jpg"], StorageError)
+    finally:
+        await client.close()
+
+
+@with_server
+async def test_hedged_download_beats_a_slow_request(server):
+    server.objects["image.jpg"] = b"image"
+    client = create_client(
+        server,
+        hedge=True,
+        hedge_min_samples=5,
+        hedge_min_delay_ms=20,
+        hedge_max_ratio=0.5,
+    )
+    try:
+        # No hedging until enough latencies are known
+        for _ in range(5):
+            await client.download("image.jpg")
+        assert client.stats()["hedged"] == 0
+        assert client.hedge_delay() is not None
+
+        # The first request stalls, the hedge sent after ~p95 answers first
+        server.delays["image.jpg"] = [1.0]
+        started_at = time.perf_counter()
+        assert await client.download("image.jpg") == b"image"
+        assert time.perf_counter() - started_at < 0.5
+        stats = client.stats()
+        assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+        assert server.gets.count("image.jpg") == 7
+
+        # The hedge budget (half the downloads) is spent
+        client.hedged = client.downloads
+        assert client.hedge_delay() is None
+    finally:
+        await client.close()
+
+
+@with_server
+async def test_large_downloads_are_not_hedged(server):
+    server.objects["image.jpg"] = b"image"
+    server.objects["crops/chunk-0.bin"] = b"chunk" * 1000
+    client = create_client(
+        server, hedge=True, hedge_min_samples=5, hedge_min_delay_ms=20
+    )
+    try:
+        for _ in range(5):
+            await client.download("image.jpg")
+        assert client.hedge_delay() is not None
+
+        # Slower than the hedge delay, still requested once
+        server.delays["crops/chunk-0.bin"] = [0.2]
+        content = await client.download("crops/chunk-0.bin", hedge=False)
+        assert content == b"chunk" * 1000
+        assert server.gets.count("crops/chunk-0.bin") == 1
+        stats = client.stats()
+        assert stats["hedged"] == 0 and stats["downloads"] == 5
+        # Its latency doesn't raise the delay for images
+        assert len(client._latencies) == 5
+    finally:
+        await client.close()
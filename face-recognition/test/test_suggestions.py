@@ -0,0 +1,118 @@
+import sys
+import os
+import asyncio
+
+sys.path.append(
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(__file__),
+            "..",
+        )
+    )
+)
+from services.mongo_service import get_person_names
+import services.suggestion_service as suggestion_service
+from services.suggestion_service import vote_person_suggestions
+
+
+def create_hits(*pairs):
+    return [{"id": face_id, "distance": distance} for face_id, distance in pairs]
+
+
+def test_votes_are_grouped_per_person():
+    hits = [
+        create_hits(("a1", 0.9), ("b1", 0.85), ("a2", 0.7), ("a3", 0.6), ("x", 0.95)),
+        create_hits(("b1", 0.8), ("b2", 0.75), ("a1", 0.5)),
+    ]
+    # "x" is untagged and must not vote
+    person_ids = {"a1": "alice", "a2": "alice", "a3": "alice", "b1": "bob", "b2": "bob"}
+
+    suggestions = vote_person_suggestions(hits, person_ids, min_similarity=0.4)
+
+    assert [item["person_id"] for item in suggestions[0]] == ["alice", "bob"]
+    assert suggestions[0][0]["face_count"] == 3
+    assert suggestions[0][0]["similarity_score"] == 0.9
+    assert abs(sum(item["vote_share"] for item in suggestions[0]) - 1) < 1e-3
+    assert [item["person_id"] for item in suggestions[1]] == ["bob", "alice"]
+    assert suggestions[1][0]["face_count"] == 2
+
+
+def test_threshold_exclusions_and_limit():
+    hits = [
+        create_hits(("a1", 0.9), ("b1", 0.3)),
+        create_hits(("b1", 0.2)),
+        create_hits(("a1", 0.9), ("b1", 0.8), ("c1", 0.7)),
+    ]
+    person_ids = {"a1": "alice", "b1": "bob", "c1": "carol"}
+
+    suggestions = vote_person_suggestions(
+        hits, person_ids, min_similarity=0.4, max_names=2, exclude_ids=["a1"]
+    )
+
+    # Below-threshold and excluded hits leave a face without suggestions
+    assert suggestions[0] == []
+    assert suggestions[1] == []
+    assert [item["person_id"] for item in suggestions[2]] == ["bob", "carol"]
+    assert vote_person_suggestions([[], []], person_ids) == [[], []]
+
+
+def test_person_ids_that_are_names():
+    """Tags written by the client store the name itself in personId"""
+    hits = [create_hits(("a1", 0.9), ("a2", 0.8), ("b1", 0.7))]
+    person_ids = {"a1": "Alice Nguyen", "a2": "Alice Nguyen", "b1": "Bob"}
+
+    suggestions = vote_person_suggestions(hits, person_ids, min_similarity=0.4)
+    names = asyncio.run(
+        get_person_names([item["person_id"] for item in suggestions[0]])
+    )
+
+    assert names == {"Alice Nguyen": "Alice Nguyen", "Bob": "Bob"}
+    assert [names[item["person_id"]] for item in suggestions[0]] == [
+        "Alice Nguyen",
+        "Bob",
+    ]
+
+
+def test_votes_use_current_tags_not_the_centroid_index(monkeypatch):
+    """A face retagged outside /tag-face votes for its new person"""
+    hits = [create_hits(("a1", 0.9), ("a2", 0.85), ("b1", 0.8))]
+    rebuilt = []
+
+    async def centroid_hits(embeddings, playground_id, neighbors):
+        return hits, {"a1": "alice", "a2": "alice", "b1": "bob"}
+
+    async def face_person_ids(milvus_ids):
+        return {"a1": "bob", "a2": "bob", "b1": "bob"}
+
+    async def person_names(person_ids):
+        return {person_id: person_id for person_id in person_ids}
+
+    async def rebuild(playground_id):
+        rebuilt.append(playground_id)
+
+    monkeypatch.setattr(suggestion_service, "_centroid_hits", centroid_hits)
+    monkeypatch.setattr(suggestion_service, "get_face_person_ids", face_person_ids)
+    monkeypatch.setattr(suggestion_service, "get_person_names", person_names)
+    monkeypatch.setattr(suggestion_service, "build_centroid_index_service", rebuild)
+
+    async def run():
+        suggestions = await suggestion_service.suggest_names_service(
+            [[0.0]], playground_id="pg"
+        )
+        await asyncio.sleep(0)
+        return suggestions
+
+    suggestions = asyncio.run(run())
+
+    assert [item["person_id"] for item in suggestions[0]] == ["bob"]
+    assert suggestions[0][0]["face_count"] == 3
+    # The stale index is rebuilt once, off the request
+    assert rebuilt == ["pg"]
+    assert suggestion_service._rebuilding == {}
+
+
+if __name__ == "__main__":
+    test_votes_are_grouped_per_person()
+    test_threshold_exclusions_and_limit()
+    test_person_ids_that_are_names()
+    print("✅ Suggestion voting tests passed")